@@ -1,4 +1,3 @@
-import json
 import logging
 import os
 import threading
@@ -7,6 +6,7 @@ from pathlib import Path
 
 import numpy as np
 import yaml
+from tools.cal_store import CalStore
 
 log = logging.getLogger(__name__)
 lock = threading.Lock()
@@ -52,6 +52,25 @@ class Context(object):
             self.EXPERIMENT = os.environ.get('EXPERIMENT',
                                              yml_dict['experiment'])
             self.pv_map = yml_dict['pv_map']
+            # 'poll' reads the PVs once per refresh, 'monitor' subscribes to
+            # them and 'zmq' reads the per-shot stream of the MPI master
+            self.live_source = yml_dict.get('live_source', 'poll')
+            self.zmq_address = yml_dict.get('zmq_address',
+                                            'tcp://localhost:8123')
+            # scenario file moving the simulated jet, see sketch/jet_model.py
+            self.sim_scenario = yml_dict.get('sim_scenario')
+            # shots are averaged at each motor position until the standard
+            # error of the mean is below precision times the calibration
+            # sigma, motor_averaging shots are used without calibration
+            self.motor_precision = yml_dict['motor'].get('precision', 0.25)
+            self.motor_min_averaging = yml_dict['motor'].get('min_averaging',
+                                                             5)
+            self.motor_max_averaging = yml_dict['motor'].get('max_averaging',
+                                                             100)
+            # speed in units per second and bin width of the fly scan
+            self.motor_fly_velocity = yml_dict['motor'].get('fly_velocity',
+                                                            0.03)
+            self.motor_fly_bin = yml_dict['motor'].get('fly_bin', 0.005)
 
         if self.jet_cam_name == 'None' or self.jet_cam_name == 'none':
             self.jet_came_name = None
@@ -68,35 +87,47 @@ class Context(object):
         self.PV_DICT = self.pv_map
 
         self.live_data = True
+        # in monitor mode, PV updates less than this many seconds apart
+        # belong to the same sample
+        self.monitor_tolerance = 0.1
         self.calibration_source = "calibration from results"
         self.percent = 50
         self.refresh_rate = 5
+        # samples per second the buffers and windows are sized for, the
+        # refresh rate when polling and the measured rate when streaming
+        self.sample_rate = self.refresh_rate
+        # how many times per second the graphs are redrawn, independent of
+        # the rate at which points are read
+        self.display_rate = 10
         self.graph_ave_time = 2
         self.display_time = 10
         self.notification_time = 2
+        # lengths in seconds of the rolling mean/sigma windows
+        self.stat_times = [1, 10, 60]
         self.manual_motor = True
         self.high_limit = 0.1
         self.low_limit = -0.1
         self.step_size = 0.02
         self.position_tolerance = 0.001
-        self.motor_averaging = 10
+        self.motor_averaging = 20
         self.algorithm = 'Ternary Search'
         self.motor_running = False
         self.motor_mode = ''
         self.calibration_values = {}
+        self.cal_store = None
         self.isTracking = False
         self.calibrated = False
         self.live_data = True
         self.display_flag = None
         # number of points over the time wanted for averaging
-        self.naverage = self.graph_ave_time * self.refresh_rate
+        self.naverage = self.graph_ave_time * self.sample_rate
         # number of points over the graph time
-        self.buffer_size = self.display_time * self.refresh_rate
+        self.buffer_size = self.display_time * self.sample_rate
         # how many averages can fit within the time window
         self.averaging_size = int(self.buffer_size / self.naverage)
         self.x_axis = list(np.linspace(0, self.display_time, self.buffer_size))
         self.notification_tolerance = (self.notification_time *
-                                       self.refresh_rate)
+                                       self.sample_rate)
         self.ave_cycle = list(range(1, self.naverage + 1))
         self.x_cycle = list(range(0, self.buffer_size))
         # +1 for NaN value added at the end
@@ -146,6 +177,13 @@ class Context(object):
     def update_live_graphing(self, live):
         self.live_data = live
         self.signals.changeRunLive.emit(self.live_data)
+        if not self.streaming and self.sample_rate != self.refresh_rate:
+            self.update_sample_rate(self.refresh_rate)
+
+    @property
+    def streaming(self):
+        """True when samples are pushed to the reader instead of polled"""
+        return self.live_data and self.live_source in ('monitor', 'zmq')
 
     def update_calibration_source(self, cal_src):
         self.calibration_source = cal_src
@@ -172,14 +210,30 @@ class Context(object):
 
     def update_refresh_rate(self, rr):
         """
-        changes the refresh rate of the graph
+        changes the rate at which new points are read
         """
         self.refresh_rate = int(rr)
+        if not self.streaming:
+            self.update_sample_rate(self.refresh_rate)
+
+    def update_sample_rate(self, rate):
+        """
+        changes the number of samples per second the buffers and averaging
+        windows are sized for, so that they keep covering the same time
+        """
+        self.sample_rate = rate
         self.update_buffers_and_cycles("all")
 
+    def update_display_rate(self, dr):
+        """
+        changes how many times per second the graphs are redrawn
+        """
+        self.display_rate = float(dr)
+        self.signals.changeDisplayRate.emit(self.display_rate)
+
     def update_buffers_and_cycles(self, who):
         if who == "all":
-            # if the display time, or refresh rate is changed then these should
+            # if the display time, or sample rate is changed then these should
             # also change:
             # 1. x_axis
             # 2. buffer_size
@@ -189,20 +243,23 @@ class Context(object):
             # 6. ave_cycle (the number of points to average has changed to
             #    achieve the same amount of time)
             # 7. naverage
-            self.buffer_size = int(self.display_time * self.refresh_rate)
-            self.naverage = int(self.graph_ave_time * self.refresh_rate)
+            self.buffer_size = max(int(self.display_time * self.sample_rate),
+                                   1)
+            self.naverage = max(int(self.graph_ave_time * self.sample_rate),
+                                1)
             self.averaging_size = int(self.buffer_size / self.naverage)
             self.x_axis = list(np.linspace(0, self.display_time,
                                self.buffer_size))
             self.notification_tolerance = int(self.notification_time *
-                                              self.refresh_rate)
+                                              self.sample_rate)
             self.ave_cycle = list(range(1, self.naverage+1))
             self.x_cycle = list(range(0, self.buffer_size))
             self.ave_idx = list(range(0, self.averaging_size+1))
             self.signals.changeDisplayFlag.emit("all")
 
         if who == "just average":
-            self.naverage = int(self.graph_ave_time * self.refresh_rate)
+            self.naverage = max(int(self.graph_ave_time * self.sample_rate),
+                                1)
             self.averaging_size = int(self.buffer_size / self.naverage)
             self.ave_cycle = list(range(1, self.naverage+1))
             self.ave_idx = list(range(0, self.averaging_size+1))
@@ -273,15 +330,13 @@ class Context(object):
     def get_cal_results(self):
         results_dir = Path(f'/cds/home/opr/{self.HUTCH}opr/experiments/'
                            f'{self.EXPERIMENT}/jt_calib/')
-        cal_files = list(results_dir.glob('jt_cal*'))
-        cal_files.sort(key=os.path.getmtime)
-        if cal_files:
-            cal_file_path = cal_files[-1]
-            with open(cal_file_path) as f:
-                cal_results = json.load(f)
-            return cal_results, cal_file_path
-        else:
+        # kept so the index is only read again when it changes
+        if self.cal_store is None or self.cal_store.directory != results_dir:
+            self.cal_store = CalStore(results_dir)
+        record = self.cal_store.latest(self.EXPERIMENT)
+        if record is None:
             return None, None
+        return record['results'], record['source']
 
     def set_mode(self, mode):
         self.mode = mode
@@ -1,9 +1,9 @@
-import collections
+import functools
 import logging
+import os
 import threading
 import time
-from collections import deque
-from statistics import StatisticsError, mean, stdev
+from statistics import StatisticsError, mean
 
 import cv2
 import numpy as np
@@ -12,10 +12,16 @@ from ophyd import EpicsSignal
 from PyQt5.QtCore import QThread
 from qimage2ndarray import array2qimage
 from scipy import stats
-from sketch.motorMoving import MotorAction
+from sketch.motorMoving import MotorAction, integration_done, target_sem
 from sketch.num_gen import SimulationGenerator
 from sketch.sim_motorMoving import SimulatedMotor
-from tools.quick_calc import skimmer
+from tools.calibration import results_calibration, shots_calibration
+from tools.event_flags import EventFlagWindow
+from tools.monitor_assembler import MonitorAssembler
+from tools.rate_meter import RateMeter
+from tools.ring_buffer import RingBuffer
+from tools.rolling_stats import RollingStats
+from tools.sample_queue import SampleQueue
 
 from pcdsdevices.epics_motor import IMS
 
@@ -40,6 +46,19 @@ class Singleton(type):
 
 
 class ValueReader(metaclass=Singleton):
+    """
+    Reads i0, diff, ratio and dropped from the configured source.
+
+    Live data comes from the four jet tracking PVs, either polled with one
+    get per PV per read (live_source 'poll') or pushed by channel access
+    monitors (live_source 'monitor'), or straight from the per-shot ZMQ
+    stream of the MPI master (live_source 'zmq'). In monitor mode the
+    updates of the four PVs are matched by timestamp and a sample is only
+    queued once every one of them has arrived. Pushed samples are queued as
+    they arrive and handed over in bulk by read_values, so nothing is lost
+    between two reads and no network round trip happens in the StatusThread
+    loop.
+    """
 
     def __init__(self, context, signals):
         self.signals = signals
@@ -50,7 +69,16 @@ class ValueReader(metaclass=Singleton):
         self.signal_i0 = None
         self.signal_ratio = None
         self.signal_dropped = None
+        self.subscriptions = {}
+        self.zmq_subscriber = None
+        self.assembler = MonitorAssembler(
+            ('i0', 'diff', 'ratio', 'dropped'), self.context.monitor_tolerance)
+        self.assembler_lock = threading.Lock()
+        self.queue = SampleQueue()
         self.simgen = SimulationGenerator(self.context, self.signals)
+        if self.context.sim_scenario:
+            self.simgen.load_scenario(os.path.join(
+                self.context.JT_LOC, self.context.sim_scenario))
         self.sim_vals = {"i0": 1, "diff": 1, "ratio": 1}
         self.diff = 1
         self.i0 = 1
@@ -66,6 +94,10 @@ class ValueReader(metaclass=Singleton):
         It should also handle the error that happens when you try to
         click start when the PVs are not active
         """
+        if self.context.live_source == 'zmq':
+            self.start_zmq_subscriber()
+            self.live_initialized = True
+            return
         i0 = self.context.PV_DICT.get('i0', None)
         self.signal_i0 = EpicsSignal(i0)
         diff = self.context.PV_DICT.get('diff', None)
@@ -74,10 +106,73 @@ class ValueReader(metaclass=Singleton):
         self.signal_ratio = EpicsSignal(ratio)
         dropped = self.context.PV_DICT.get('dropped', None)
         self.signal_dropped = EpicsSignal(dropped)
+        if self.context.live_source == 'monitor':
+            self.subscribe_live_signals()
         self.live_initialized = True
 
+    def subscribe_live_signals(self):
+        """Start channel access monitors on the four PVs"""
+        signals = {'i0': self.signal_i0, 'diff': self.signal_diff,
+                   'ratio': self.signal_ratio, 'dropped': self.signal_dropped}
+        self.queue.clear()
+        with self.assembler_lock:
+            self.assembler.clear()
+        for name, sig in signals.items():
+            cid = sig.subscribe(functools.partial(self.monitor_update, name),
+                                run=False)
+            self.subscriptions[name] = (sig, cid)
+
+    def unsubscribe_live_signals(self):
+        for sig, cid in self.subscriptions.values():
+            sig.unsubscribe(cid)
+        self.subscriptions = {}
+        self.queue.clear()
+
+    def start_zmq_subscriber(self):
+        """Start reading the per-shot stream published by the MPI master"""
+        # pyzmq is only needed for this source
+        from tools.zmq_subscriber import ZmqSubscriber
+
+        self.queue.clear()
+        self.zmq_subscriber = ZmqSubscriber(self.context.zmq_address,
+                                            self.queue)
+        self.zmq_subscriber.start()
+
+    def stop_zmq_subscriber(self):
+        self.zmq_subscriber.stop()
+        self.zmq_subscriber.join()
+        self.zmq_subscriber = None
+        self.queue.clear()
+
+    def monitor_update(self, name, value=None, timestamp=None, **kwargs):
+        """
+        Callback for the PV monitors, runs in the channel access thread.
+
+        Queues a sample once the updates of all four PVs with the same
+        timestamp have arrived, the sample time is the PV timestamp.
+        """
+        if name == 'dropped':
+            value = bool(value)
+        if timestamp is None:
+            timestamp = time.time()
+        with self.assembler_lock:
+            sample = self.assembler.update(name, value, timestamp)
+        if sample is not None:
+            self.queue.put(sample)
+
     def run_live_data(self, live):
         self.live_data = live
+        if not live and self.subscriptions:
+            self.unsubscribe_live_signals()
+            self.live_initialized = False
+        if not live and self.zmq_subscriber is not None:
+            self.stop_zmq_subscriber()
+            self.live_initialized = False
+
+    @property
+    def streaming(self):
+        """True when samples are pushed to the reader instead of polled"""
+        return self.context.streaming
 
     def live_data_stream(self):
         if not self.live_initialized:
@@ -85,25 +180,12 @@ class ValueReader(metaclass=Singleton):
         self.i0 = self.signal_i0.get()
         self.diff = self.signal_diff.get()
         self.ratio = self.signal_ratio.get()
+        self.dropped = bool(self.signal_dropped.get())
 
     def sim_data_stream(self):
-        """Run with offline data"""
-        # Adam's code for running simulations offline data
-        # TODO: Add flag to enable this
-        #
-        # context_data = zmq.Context()
-        # socket_data = context_data.socket(zmq.SUB)
-        # socket_data.connect(''.join(['tcp://localhost:', '8123']))
-        # socket_data.subscribe("")
-        # while True:
-        # md = socket_data.recv_json(flags=0)
-        # msg = socket_data.recv(flags=0, copy=False, track=False)
-        # buf = memoryview(msg)
-        # data = np.frombuffer(buf, dtype=md['dtype'])
-        # data = np.ndarray.tolist(data.reshape(md['shape']))
-        # self.i0 = data[0]
-        # self.diff = data[1]
-
+        """Run with simulated data"""
+        # offline data replayed through the MPI scripts is read with
+        # live_source 'zmq', see start_zmq_subscriber
         self.sim_vals = self.simgen.sim()
         self.i0 = self.sim_vals["i0"]
         self.diff = self.sim_vals["diff"]
@@ -111,11 +193,26 @@ class ValueReader(metaclass=Singleton):
         self.dropped = self.sim_vals["dropped"]
         # self.motor_position = self.sim_vals["motor_position"]
 
+    def read_values(self, timeout=None):
+        """
+        List of every sample available since the last call.
+
+        When streaming, waits up to timeout seconds for the first sample and
+        may return an empty list. Otherwise reads exactly one sample.
+        """
+        if self.streaming:
+            if not self.live_initialized:
+                self.initialize_live_connections()
+            return self.queue.drain(timeout)
+        return [self.read_value()]
+
     def read_value(self):  # needs to initialize first maybe using a decorator?
         if self.context.live_data:
             self.live_data_stream()
+            # the time of the shot, not of the read
             return {'i0': self.i0, 'diff': self.diff, 'ratio': self.ratio,
-                    'dropped': self.dropped}
+                    'dropped': self.dropped,
+                    'time': self.signal_ratio.timestamp}
         else:
             self.sim_data_stream()
             return {'i0': self.i0, 'diff': self.diff, 'ratio': self.ratio,
@@ -145,6 +242,7 @@ class StatusThread(QThread):
         self.calibration_source = ''
         self.flag_message = None
         self.refresh_rate = 0
+        self.display_rate = 0
         self.display_time = 0
         self.buffer_size = 0
         self.percent = 1
@@ -153,6 +251,7 @@ class StatusThread(QThread):
         self.graph_ave_time = 0
         self.count = 0
         self.naverage = 0
+        self.sample_rate = 0
         self.ave_cycle = []
         self.ave_idx = []
         self.x_cycle = []
@@ -173,8 +272,17 @@ class StatusThread(QThread):
                                              'range': (0, 0)}}
         self.averages = {}
         self.buffers = {}
+        self.stats = {}
         self.current_values = {}
-        self.flagged_events = {}
+        self.flagged_events = None
+        self.graphs_pending = False
+        self.averages_pending = False
+        self.status_pending = False
+        self.last_publish = 0
+        # when streaming, the buffers follow the measured sample rate once
+        # it is more than rate_tolerance away from the one they are sized for
+        self.rate_meter = RateMeter()
+        self.rate_tolerance = 0.2
         self.create_value_reader()
         self.create_event_processor()
         self.create_vars()
@@ -187,6 +295,8 @@ class StatusThread(QThread):
         self.mode = "running"
         self.calibration_source = self.context.calibration_source
         self.refresh_rate = self.context.refresh_rate
+        self.sample_rate = self.context.sample_rate
+        self.display_rate = self.context.display_rate
         self.percent = self.context.percent
         self.buffer_size = self.context.buffer_size
         self.graph_ave_time = self.context.graph_ave_time
@@ -207,27 +317,50 @@ class StatusThread(QThread):
     def initialize_buffers(self):
         # buffers and data collection
 
-        self.averages = {"i0": deque([0], self.averaging_size),
-                         "diff": deque([0], self.averaging_size),
-                         "ratio": deque([0], self.averaging_size),
-                         "time": deque([0], self.averaging_size)}
-        self.flagged_events = {
-            "high intensity": collections.deque([0] * self.buffer_size,
-                                                self.buffer_size),
-            "missed shot": collections.deque([0] * self.buffer_size,
-                                             self.buffer_size),
-            "dropped shot": collections.deque([0] * self.buffer_size,
-                                              self.buffer_size)}
+        self.averages = {"i0": RingBuffer(self.averaging_size, [0]),
+                         "diff": RingBuffer(self.averaging_size, [0]),
+                         "ratio": RingBuffer(self.averaging_size, [0]),
+                         "time": RingBuffer(self.averaging_size, [0])}
+        self.flagged_events = EventFlagWindow(self.buffer_size)
         self.current_values = {"i0": 0, "diff": 0, "ratio": 0, "dropped": 0}
-        self.buffers = {"i0": deque([0], self.buffer_size),
-                        "diff": deque([0], self.buffer_size),
-                        "ratio": deque([0], self.buffer_size),
-                        "time": deque([0], self.buffer_size)}
+        self.buffers = {"i0": RingBuffer(self.buffer_size, [0]),
+                        "diff": RingBuffer(self.buffer_size, [0]),
+                        "ratio": RingBuffer(self.buffer_size, [0]),
+                        "time": RingBuffer(self.buffer_size, [0])}
+        windows = self.stat_windows()
+        self.stats = {"i0": RollingStats(windows),
+                      "diff": RollingStats(windows),
+                      "ratio": RollingStats(windows)}
+
+    def stat_windows(self):
+        """
+        Window lengths in samples for the rolling statistics: the graph
+        averaging window followed by each of the context stat_times.
+        """
+        return [self.naverage] + [self.stat_window(t)
+                                  for t in self.context.stat_times]
+
+    def stat_window(self, seconds):
+        """Samples in seconds at the rate the windows are sized for"""
+        return max(int(seconds * self.sample_rate), 1)
+
+    def rolling_summary(self):
+        """
+        Mean and sigma of i0, diff and ratio over each of the context
+        stat_times, keyed by the window length in seconds.
+        """
+        summary = {}
+        for key, rolling in self.stats.items():
+            windows = rolling.summary()
+            summary[key] = {t: windows[self.stat_window(t)]
+                            for t in self.context.stat_times}
+        return summary
 
     def connect_signals(self):
         self.signals.mode.connect(self.update_mode)
         self.signals.changeDisplayFlag.connect(self.change_display_flag)
         self.signals.changePercent.connect(self.set_percent)
+        self.signals.changeDisplayRate.connect(self.set_display_rate)
         self.signals.changeCalibrationSource.connect(
             self.set_calibration_source)
         self.signals.enableTracking.connect(self.tracking)
@@ -235,16 +368,9 @@ class StatusThread(QThread):
 
     @staticmethod
     def fix_size(old_size, new_size, b):
-        d = new_size - old_size
-        if d <= 0:
-            for key in b:
-                old = list(b[key])
-                new = old[-d:]
-                b[key] = deque(new, new_size)
-        else:
-            for key in b:
-                old = list(b[key])
-                b[key] = deque(old, new_size)
+        """Resize every RingBuffer in the dictionary b to new_size"""
+        for key in b:
+            b[key].resize(new_size)
         return b
 
     @staticmethod
@@ -281,6 +407,9 @@ class StatusThread(QThread):
         self.percent = p
         self.update_calibration_range()
 
+    def set_display_rate(self, r):
+        self.display_rate = r
+
     def set_calibration_source(self, c):
         self.calibration_source = c
 
@@ -290,6 +419,7 @@ class StatusThread(QThread):
             current_ave_size = self.averaging_size+1
             current_buff_size = self.buffer_size
             self.refresh_rate = self.context.refresh_rate
+            self.sample_rate = self.context.sample_rate
             self.buffer_size = self.context.buffer_size
             self.display_time = self.context.display_time
             self.naverage = self.context.naverage
@@ -303,9 +433,9 @@ class StatusThread(QThread):
                                           self.averaging_size, self.averages)
             self.buffers = self.fix_size(current_buff_size, self.buffer_size,
                                          self.buffers)
-            self.flagged_events = self.fix_size(current_buff_size,
-                                                self.buffer_size,
-                                                self.flagged_events)
+            self.flagged_events.resize(self.buffer_size)
+            for rolling in self.stats.values():
+                rolling.set_windows(self.stat_windows())
             self.display_flag = None
 
         elif self.display_flag == "just average":
@@ -317,6 +447,8 @@ class StatusThread(QThread):
             self.ave_idx = self.context.ave_idx
             self.averages = self.fix_size(current_ave_size,
                                           self.averaging_size, self.averages)
+            for rolling in self.stats.values():
+                rolling.set_windows(self.stat_windows())
             self.display_flag = None
 
     def change_display_flag(self, culprit):
@@ -349,9 +481,9 @@ class StatusThread(QThread):
 
     def points_to_plot(self, x_idx, ave_cycle, ave_idx):
         """
-        makes list of values to be plotted on the
-        graph and sends the values through the refresh graphs signal
-        checks if the location info indicates that the average needs to
+        marks the buffers as ready to be plotted on the graph. They are sent
+        through the refresh graphs signal by publish_graphs at the display
+        rate. checks if the location info indicates that the average needs to
         be updated on the graph (0) or if the end of the buffer has been
         reached (-2)
         - sets a nan value if the end of the buffer has been reached so that
@@ -363,16 +495,11 @@ class StatusThread(QThread):
         # returns info to inform what to plot
         location_info = self.check_cycle(x_idx, ave_cycle)
 
-        i0 = list(self.buffers['i0'])
-        diff = list(self.buffers['diff'])
-        ratio = list(self.buffers['ratio'])
-        t = list(self.buffers['time'])
-        buff = {'i0': i0, 'diff': diff, 'ratio': ratio, 'time': t}
-        self.signals.refreshGraphs.emit(buff)
+        self.graphs_pending = True
         if location_info == 0:
             self.update_averages(ave_idx, x_idx)
             ave_idx = self.ave_idx[0]
-            if ave_idx > len(list(self.averages['i0'])) - 1:
+            if ave_idx > len(self.averages['i0']) - 1:
                 choice = "append"
             else:
                 choice = "set"
@@ -384,38 +511,49 @@ class StatusThread(QThread):
             self.update_averages(ave_idx, x_idx)
 
     def update_averages(self, ave_idx, x_idx):
-        if ave_idx > len(list(self.averages['i0']))-1:
+        if ave_idx > len(self.averages['i0'])-1:
             choice = "append"
         else:
             choice = "set"
         try:
-            if self.calibrated and len(self.flagged_events[
-                    'dropped shot']) == len(self.buffers['i0']):
-                avei0 = mean(skimmer('dropped shot',
-                                     list(self.buffers['i0']),
-                                     self.flagged_events)[:-self.naverage])
-                avediff = mean(skimmer('dropped shot',
-                                       list(self.buffers['diff']),
-                                       self.flagged_events)[:-self.naverage])
-                averatio = mean(skimmer('dropped shot',
-                                        list(self.buffers['ratio']),
-                                        self.flagged_events)[:-self.naverage])
-            else:
-                avei0 = mean(list(self.buffers['i0'])[:-self.naverage])
-                avediff = mean(list(self.buffers['diff'])[:-self.naverage])
-                averatio = mean(list(self.buffers['ratio'])[:-self.naverage])
-            vals = [avei0, avediff, averatio, self.x_axis[x_idx]]
+            vals = [self.stats['i0'].mean(self.naverage),
+                    self.stats['diff'].mean(self.naverage),
+                    self.stats['ratio'].mean(self.naverage),
+                    self.x_axis[x_idx]]
         except StatisticsError:
             vals = [0, 0, 0, self.x_axis[x_idx]]
         self.append_or_set(choice, self.averages, vals, ave_idx)
-        i0 = list(self.averages['i0'])
-        diff = list(self.averages['diff'])
-        ratio = list(self.averages['ratio'])
-        t = list(self.averages['time'])
-        ave = {"i0": i0, "diff": diff,
-               "ratio": ratio, 'time': t}
         self.ave_idx.append(self.ave_idx.pop(0))
-        self.signals.refreshAveValueGraphs.emit(ave)
+        self.averages_pending = True
+
+    def publish_graphs(self, force=False):
+        """
+        Send the buffers and averages to the graphs, and the status, at most
+        display_rate times per second.
+
+        Samples that arrive between two redraws only update the buffers and
+        the flag counts, so whatever is in them when the next redraw is due
+        gets plotted and the Qt event loop never sees more than display_rate
+        updates per second, however fast the data comes in. The graphs get
+        copies, the buffers are written on while the GUI thread draws.
+        """
+        now = time.monotonic()
+        if not force and now - self.last_publish < 1 / self.display_rate:
+            return
+        if self.graphs_pending:
+            buff = {key: self.buffers[key].view().copy()
+                    for key in self.buffers}
+            self.signals.refreshGraphs.emit(buff)
+            self.graphs_pending = False
+        if self.averages_pending:
+            ave = {key: self.averages[key].view().copy()
+                   for key in self.averages}
+            self.signals.refreshAveValueGraphs.emit(ave)
+            self.averages_pending = False
+        if self.status_pending:
+            self.check_status_update()
+            self.status_pending = False
+        self.last_publish = now
 
     def update_buffer(self, vals, idx):
         """
@@ -426,56 +564,101 @@ class StatusThread(QThread):
         vals -- the values received from the ValueReader
         idx -- the current x index from the x_cycle list variable
         """
-        if idx > len(list(self.buffers['i0']))-1:
+        if idx > len(self.buffers['i0'])-1:
             choice = "append"
         else:
             choice = "set"
         v = [vals.get('i0'), vals.get('diff'), vals.get('ratio'),
              self.x_axis[idx]]
         self.append_or_set(choice, self.buffers, v, idx)
+        # dropped shots only count as such once there is a calibration
+        masked = bool(self.calibrated and vals.get('dropped'))
+        for key, rolling in self.stats.items():
+            rolling.push(vals.get(key), masked)
         v = [vals.get('i0'), vals.get('diff'), vals.get('ratio'),
              vals.get('dropped')]
         if self.calibrated and choice == "set":
             self.event_flagging(v, idx)
 
     def run(self):
-        """Long-running task to collect data points"""
+        """
+        Long-running task to collect data points.
+
+        Values are read at refresh_rate, or processed as they arrive when the
+        reader is streaming, and the graphs are redrawn at display_rate, so
+        raising the data rate does not raise the number of redraws.
+        """
+        next_read = time.monotonic()
         while not self.isInterruptionRequested():
-            new_values = self.reader.read_value()
-            self.current_values = new_values
-            x_idx = self.x_cycle[0]
-            ave_cycle = self.ave_cycle[0]
-            ave_idx = self.ave_idx[0]
-            self.ave_cycle.append(self.ave_cycle.pop(0))
-            self.x_cycle.append(self.x_cycle.pop(0))
-            if self.mode == "running":
-                self.update_buffer(new_values, x_idx)
-                self.check_status_update()
-                self.points_to_plot(x_idx, ave_cycle, ave_idx)
-                time.sleep(1/self.refresh_rate)
-            elif self.mode == "calibrate":
-                self.calibrated = False
-                self.update_buffer(new_values, x_idx)
-                self.points_to_plot(x_idx, ave_cycle, ave_idx)
-                self.calibrate(new_values)
-                time.sleep(1 / self.refresh_rate)
+            samples = self.reader.read_values(1 / self.display_rate)
+            for new_values in samples:
+                self.process_values(new_values)
+            if samples:
+                # every shot, for the motor algorithms using each of them
+                self.signals.valuesBatch.emit(samples)
+            self.publish_graphs()
+            if self.reader.streaming:
+                self.check_sample_rate(len(samples))
+                continue
+            self.rate_meter.reset()
+            next_read += 1 / self.refresh_rate
+            delay = next_read - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # fell behind, don't try to catch up with a burst of reads
+                next_read = time.monotonic()
         print("Interruption request: %d" % QThread.currentThreadId())
 
+    def check_sample_rate(self, count):
+        """
+        Resize the buffers to the measured rate of a streaming reader.
+
+        Buffers and windows hold a number of samples worked out from the
+        display and averaging times, which only describes seconds if the
+        samples come in at the rate they were sized for.
+        """
+        rate = self.rate_meter.add(count)
+        if not rate:
+            return
+        sized = self.context.sample_rate
+        if abs(rate - sized) > self.rate_tolerance * sized:
+            self.context.update_sample_rate(rate)
+
+    def process_values(self, new_values):
+        """Add one set of values from the ValueReader to the buffers"""
+        self.current_values = new_values
+        x_idx = self.x_cycle[0]
+        ave_cycle = self.ave_cycle[0]
+        ave_idx = self.ave_idx[0]
+        self.ave_cycle.append(self.ave_cycle.pop(0))
+        self.x_cycle.append(self.x_cycle.pop(0))
+        if self.mode == "running":
+            self.update_buffer(new_values, x_idx)
+            # checked once per redraw, see publish_graphs
+            self.status_pending = True
+            self.points_to_plot(x_idx, ave_cycle, ave_idx)
+        elif self.mode == "calibrate":
+            self.calibrated = False
+            self.update_buffer(new_values, x_idx)
+            self.points_to_plot(x_idx, ave_cycle, ave_idx)
+            self.calibrate(new_values)
+
     def check_status_update(self):
         if self.calibrated:
-            if np.count_nonzero(self.flagged_events[
-                    'missed shot']) > self.notification_tolerance:
+            if self.flagged_events.count(
+                    'missed shot') > self.notification_tolerance:
                 self.signals.changeStatus.emit("Warning, missed shots", "red")
                 self.processor_worker.flag_counter('missed shot', 50,
                                                    self.missed_shots)
-            elif np.count_nonzero(self.flagged_events[
-                    'dropped shot']) > self.notification_tolerance:
+            elif self.flagged_events.count(
+                    'dropped shot') > self.notification_tolerance:
                 self.signals.changeStatus.emit("Lots of dropped shots",
                                                "yellow")
                 self.processor_worker.flag_counter('dropped shot', 50,
                                                    self.dropped_shots)
-            elif np.count_nonzero(self.flagged_events[
-                    'high intensity']) > self.notification_tolerance:
+            elif self.flagged_events.count(
+                    'high intensity') > self.notification_tolerance:
                 self.signals.changeStatus.emit("High Intensity", "orange")
                 self.processor_worker.flag_counter('high intensity', 50,
                                                    self.high_intensity)
@@ -526,8 +709,9 @@ class StatusThread(QThread):
         Flags values that are outside of the values indicated from the gui.
 
         Values that fall within the allowed range receive a value
-        of zero in self.flagged_events deque. Otherwise, that position gets
-        updated with the current value in the buffer.
+        of zero in self.flagged_events. Otherwise, that position gets
+        updated with the current value in the buffer. The window keeps a
+        running count of flagged shots for check_status_update.
 
         Parameters:
         vals
@@ -539,10 +723,9 @@ class StatusThread(QThread):
         if self.calibrated:
             if vals[2] > self.calibration_values['ratio']['range'][1]:
                 high_intensity = vals[2]
-                self.flagged_events['high intensity'][idx] = high_intensity
             else:
                 high_intensity = 0
-                self.flagged_events['high intensity'][idx] = high_intensity
+            self.flagged_events.set('high intensity', idx, high_intensity)
             if vals[2] < self.calibration_values['ratio']['range'][0]:
                 missed_shot = vals[2]
 
@@ -551,16 +734,14 @@ class StatusThread(QThread):
                 if missed_shot == 0:
                     missed_shot = 0.01
                 # print("missed shot: ", missed_shot)
-                self.flagged_events['missed shot'][idx] = missed_shot
             else:
                 missed_shot = 0
-                self.flagged_events['missed shot'][idx] = missed_shot
+            self.flagged_events.set('missed shot', idx, missed_shot)
         if not vals[3]:
             dropped_shot = 0
-            self.flagged_events['dropped shot'][idx] = dropped_shot
-        elif vals[3]:
+        else:
             dropped_shot = 1
-            self.flagged_events['dropped shot'][idx] = dropped_shot
+        self.flagged_events.set('dropped shot', idx, dropped_shot)
 
     def update_calibration_range(self):
         for name in ['i0', 'diff', 'ratio']:
@@ -598,20 +779,9 @@ class StatusThread(QThread):
                 self.calibrated = False
                 self.mode = 'running'
             else:
-                self.set_calibration_values('i0',
-                                            float(results['i0_median']),
-                                            float(results['i0_low']))
-                # self.set_calibration_values('ratio',
-                #                             float(results['med_ratio']),
-                #                             float(results['ratio_low']))
-                self.set_calibration_values('diff',
-                                            float(results['int_median']),
-                                            float(results['int_low']))
-                # this should be removed
-                ratio_low = float(results['int_low'])/float(results['i0_low'])
-                self.set_calibration_values('ratio',
-                                            float(results['med_ratio']),
-                                            ratio_low)
+                for name, (vmean, std) in results_calibration(
+                        results).items():
+                    self.set_calibration_values(name, vmean, std)
                 self.calibrated = True
                 self.mode = 'running'
                 self.signals.message.emit('calibration file: ' + str(cal_file))
@@ -622,18 +792,9 @@ class StatusThread(QThread):
                 self.cal_vals[1].append(v.get('diff'))
                 self.cal_vals[2].append(v.get('ratio'))
             if len(self.cal_vals[0]) > 50:
-                self.set_calibration_values('i0',
-                                            mean(self.cal_vals[0]),
-                                            stdev(self.cal_vals[0])
-                                            )
-                self.set_calibration_values('diff',
-                                            mean(self.cal_vals[1]),
-                                            stdev(self.cal_vals[1])
-                                            )
-                self.set_calibration_values('ratio',
-                                            mean(self.cal_vals[2]),
-                                            stdev(self.cal_vals[2])
-                                            )
+                for name, (vmean, std) in shots_calibration(
+                        *self.cal_vals).items():
+                    self.set_calibration_values(name, vmean, std)
                 self.update_calibration_range()
                 self.calibrated = True
                 self.cal_vals = [[], [], []]
@@ -873,6 +1034,11 @@ class MotorThread(QThread):
         self.initial_position = 0
         self.tolerance = 0
         self.averaging = 0
+        self.precision = None
+        self.min_averaging = 0
+        self.max_averaging = 0
+        self.fly_velocity = 0
+        self.fly_bin = 0
         self.refresh_rate = 0
         self.request_new_values = False
         self.got_new_values = False
@@ -894,6 +1060,12 @@ class MotorThread(QThread):
         self.high_limit = self.context.high_limit
         self.step_size = self.context.step_size
         self.tolerance = self.context.position_tolerance
+        self.averaging = self.context.motor_averaging
+        self.precision = self.context.motor_precision
+        self.min_averaging = self.context.motor_min_averaging
+        self.max_averaging = self.context.motor_max_averaging
+        self.fly_velocity = self.context.motor_fly_velocity
+        self.fly_bin = self.context.motor_fly_bin
         self.calibration_values = self.context.calibration_values
         self.refresh_rate = self.context.refresh_rate
 
@@ -902,11 +1074,20 @@ class MotorThread(QThread):
         self.low_limit = self.context.low_limit
         self.high_limit = self.context.high_limit
         self.step_size = self.context.step_size
+        self.averaging = self.context.motor_averaging
         self.calibration_values = self.context.calibration_values
         self.refresh_rate = self.context.refresh_rate
 
+    def target_sem(self):
+        """
+        Standard error of the mean wanted at each motor position, a fraction
+        of the calibration sigma of the ratio. None without calibration.
+        """
+        return target_sem(self.calibration_values, self.precision)
+
     def make_connections(self):
         self.signals.intensitiesForMotor.connect(self.update_values)
+        self.signals.valuesBatch.connect(self.update_batch)
         self.signals.connectMotor.connect(self.connect_to_motor)
         self.signals.liveMotor.connect(self.live_motor)
         self.signals.notifyMotor.connect(self.impart_knowledge)
@@ -916,6 +1097,8 @@ class MotorThread(QThread):
     def change_motor_mode(self, m):
         if m == 'sleep' and self.mode == 'run':
             self.signals.message.emit('Canceling motor moving immediately, going to sleep')
+            # the motor is not left flying at the fly scan velocity
+            self.action.fly_scan.stop()
             self.mode = m
         if m == 'sleep' and self.mode == 'calibrate':
             self.signals.message.emit('calibration finished')
@@ -998,46 +1181,59 @@ class MotorThread(QThread):
         if not self.done:
             self.got_new_values = True
             self.check_motor_options()
-            if vals != self.vals and vals['dropped'] is False:
+            if self.algorithm == "Fly Scan":
+                # the fly scan gets every shot from update_batch
+                pass
+            elif vals != self.vals and not vals['dropped']:
                 self.vals = vals
                 self.average_intensity()
             else:
                 pass
 
+    def update_batch(self, samples):
+        """
+        Every sample read by the StatusThread, see MotorAction.add_samples
+        """
+        if self.mode != 'run' or self.done or self.pause:
+            return
+        self.check_motor_options()
+        result = self.action.add_samples(samples)
+        if result is not None:
+            self.done, self.max_value = result
+
     def average_intensity(self):
         self.intensities += [self.vals['ratio']]
-<<<<<<< HEAD
-        # this is where we set the integration time for each motor position in the scan
-        if len(self.intensities) == 20:
-            self.check_motor_options()
-            self.moves.append([mean(self.intensities), self.motor.position])  # this should be the same either way
-=======
         # this is where we set the integration time for each motor position
-        # in the scan
-        if len(self.intensities) == 20:
+        # in the scan, until the mean is known to the wanted precision
+        done, sem = integration_done(self.intensities, self.averaging,
+                                     self.target_sem(), self.min_averaging,
+                                     self.max_averaging)
+        if done:
             self.check_motor_options()
-            print(self.moves)
 
-            # this should be the same either way
-            self.moves.append([mean(self.intensities), self.motor.position])
->>>>>>> 6e0240e8fe3b216f1a040e93baea288f8d9e0f84
+            # this should be the same either way, the shots are kept for
+            # the algorithms comparing positions statistically
+            self.moves.append([mean(self.intensities), self.motor.position,
+                               self.intensities, sem])
             self.intensities = []
             if not self.pause:
                 self.done, self.max_value = self.action.execute()
 
     def run(self):
         while not self.isInterruptionRequested():
-<<<<<<< HEAD
             if self.mode == 'run':
                 if self.done:
                     if len(self.moves) > 4:
                         x = [a[1] for a in self.moves]
                         y = [b[0] for b in self.moves]
-                        self.signals.plotMotorMoves.emit(self.motor.position, self.max_value, x, y)
+                        self.signals.plotMotorMoves.emit(self.motor.position,
+                                                         self.max_value, x, y)
                         print("go to sleep now..")
                         time.sleep(7)
-                        self.signals.message.emit(f"Found peak intensity {self.max_value} "
-                                                  f"at motor position: {self.motor.position}")
+                        self.signals.message.emit(f"Found peak intensity "
+                                                  f"{self.max_value} at motor "
+                                                  f"position: "
+                                                  f"{self.motor.position}")
                         self.mode = 'sleep'
                 else:
                     if self.request_new_values and self.got_new_values:
@@ -1053,37 +1249,17 @@ class MotorThread(QThread):
                     self.calibration_steps = 1
                     self.mode = 'sleep'
                 else:
-                    if self.request_image_processor and self.complete_image_processor:
+                    if (self.request_image_processor and
+                            self.complete_image_processor):
                         self.request_image_processor = False
                         self.complete_image_processor = False
                     if not self.request_image_processor:
-                        self.signals.imageProcessingRequest.emit(self.motor.position)
+                        self.signals.imageProcessingRequest.emit(
+                            self.motor.position)
                         self.request_image_processor = True
             elif self.mode == 'sleep':
                 self.clear_values()
                 pass
-=======
-            if self.done:
-                if len(self.moves) > 4:
-                    x = [a[1] for a in self.moves]
-                    y = [b[0] for b in self.moves]
-                    self.signals.plotMotorMoves.emit(self.motor.position,
-                                                     self.max_value, x, y)
-                    print("go to sleep now..")
-                    time.sleep(7)
-                    self.signals.message.emit(f"Found peak intensity "
-                                              f"{self.max_value} at motor "
-                                              f"position: "
-                                              f"{self.motor.position}")
-                    self.signals.sleepMotor.emit()
-            else:
-                if self.request_new_values and self.got_new_values:
-                    self.request_new_values = False
-                    self.got_new_values = False
-                if not self.request_new_values:
-                    self.signals.valuesRequest.emit()
-                    self.request_new_values = True
->>>>>>> 6e0240e8fe3b216f1a040e93baea288f8d9e0f84
             time.sleep(1/self.refresh_rate)
         print("Interruption was requested: Motor Thread")
 
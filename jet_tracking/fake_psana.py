@@ -0,0 +1,307 @@
+"""
+Offline stand-in for the parts of psana the jet tracking scripts use
+
+Generates detector frames with a diffraction ring whose intensity follows
+the simulated jet of sketch/num_gen.py, i0 values from the same simulation
+and EVR event codes, at a set rate and image size. With it, mpi_driver.py
+and jt_cal.py run on any machine with mpi4py, e.g.
+
+    mpirun -n 5 python mpi_driver.py --cfg_file cxi_config.yml --fake_psana
+
+The generator is set up with configure, usually from the fake_psana
+section of the config file. It is only used when asked for explicitly, it
+never stands in for a missing psana.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from sketch.num_gen import SimulationGenerator
+from utils import RadialIntegrator
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+# settings of the generated data, see configure
+CONFIG = dict(
+    shape=(512, 512),  # assembled image shape
+    panel_gap=8,  # pixels between the four raw panels
+    ring_radius=0.35,  # ring radius as a fraction of the largest radius
+    ring_width=0.03,  # ring sigma as a fraction of the largest radius
+    noise=0.5,  # sigma of the pixel noise
+    i0_jitter=0.1,  # relative sigma of the shot to shot beam intensity
+    background=1.0,  # flat background level
+    rate=120.,  # events per second over all ranks, 0 for no limit
+    events=10000,  # events per run, None to run forever
+    event_code=40,  # code present on every x-ray shot
+    motor_position=0.03,  # where the simulated jet is probed
+    scenario=None,  # jet model scenario, relative to this directory
+    seed=0,
+    run=1,
+)
+
+_options = {}
+
+
+def configure(**kwargs):
+    """Change the settings in CONFIG"""
+    unknown = set(kwargs) - set(CONFIG)
+    if unknown:
+        raise ValueError(f'unknown fake_psana settings {sorted(unknown)}')
+    CONFIG.update(kwargs)
+
+
+def setOption(key, value):
+    _options[key] = value
+
+
+def DetNames():
+    names = ['detector', 'ipm', 'evr', 'jet_cam']
+    return [('fake', name, '') for name in names]
+
+
+def _rank_and_size():
+    if MPI is None:
+        return 0, 1
+    comm = MPI.COMM_WORLD
+    return comm.Get_rank(), comm.Get_size()
+
+
+class Event(object):
+    """One shot, with everything the fake detectors return for it"""
+
+    def __init__(self, index, i0, diff, dropped, center, event_codes):
+        self.index = index
+        self.i0 = i0
+        self.diff = diff
+        self.dropped = dropped
+        self.center = center
+        self.event_codes = event_codes
+
+
+class Run(object):
+    def __init__(self, ds, number):
+        self._ds = ds
+        self._number = number
+
+    def run(self):
+        return self._number
+
+    def events(self):
+        return self._ds.events()
+
+
+class DataSource(object):
+    """
+    Shared memory style source, every worker rank gets its own events.
+
+    Rank 0 is the master and gets none when there are other ranks.
+    """
+
+    def __init__(self, dsname=None):
+        self.dsname = dsname
+        rank, size = _rank_and_size()
+        if size > 1:
+            self._ranks = list(range(1, size))
+        else:
+            self._ranks = [0]
+        self._rank = rank
+
+    def runs(self):
+        yield Run(self, CONFIG['run'])
+
+    def events(self):
+        if self._rank not in self._ranks:
+            return
+        mine = self._ranks.index(self._rank)
+        every = len(self._ranks)
+        rate = CONFIG['rate']
+        start = time.monotonic()
+        for event in _generate():
+            if event.index % every != mine:
+                continue
+            if rate:
+                delay = start + event.index / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield event
+
+
+class MPIDataSource(DataSource):
+    """Offline style source, the events are shared by all ranks"""
+
+    def __init__(self, dsname=None):
+        super(MPIDataSource, self).__init__(dsname)
+        self._ranks = list(range(_rank_and_size()[1]))
+
+    def small_data(self, path, gather_interval=100):
+        return SmallData(path)
+
+
+class SmallData(object):
+    """Collects per event values and saves them all from rank 0 as h5"""
+
+    def __init__(self, path):
+        self.path = path
+        self._events = []
+
+    def event(self, **kwargs):
+        self._events.append(kwargs)
+
+    def save(self):
+        events = self._events
+        if MPI is not None:
+            gathered = MPI.COMM_WORLD.gather(events, root=0)
+            if gathered is None:
+                return
+            events = [evt for part in gathered for evt in part]
+        import h5py
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with h5py.File(self.path, 'w') as f:
+            for key in (events[0] if events else []):
+                f[key] = np.array([evt[key] for evt in events])
+
+
+def _generate():
+    """Every event of the run in order, the same on every rank"""
+    sim = SimulationGenerator(None, seed=CONFIG['seed'])
+    if CONFIG['scenario']:
+        sim.load_scenario(os.path.join(os.path.dirname(__file__),
+                                       CONFIG['scenario']))
+        sim.seed(CONFIG['seed'])
+    sim.motor_position = CONFIG['motor_position']
+    # the beam intensity scales i0 and the diffraction alike, the ratio is
+    # what the jet changes
+    rng = np.random.default_rng(CONFIG['seed'])
+    total = CONFIG['events']
+    index = 0
+    while total is None or index < total:
+        n = 1000 if total is None else min(1000, total - index)
+        batch = sim.sim_batch(n)
+        jitter = np.clip(1 + CONFIG['i0_jitter'] * rng.standard_normal(n),
+                         0.1, None)
+        for i in range(n):
+            yield Event(index, float(batch['i0'][i] * jitter[i]),
+                        float(batch['diff'][i] * jitter[i]),
+                        bool(batch['dropped'][i]),
+                        sim.center, [CONFIG['event_code'], 140])
+            index += 1
+
+
+class _Geometry(object):
+    """Four raw panels, one per quadrant of the image"""
+
+    _cache = {}
+
+    def __new__(cls):
+        key = (tuple(CONFIG['shape']), CONFIG['panel_gap'],
+               CONFIG['ring_radius'], CONFIG['ring_width'])
+        if key not in cls._cache:
+            geo = super(_Geometry, cls).__new__(cls)
+            geo._build(*key)
+            cls._cache[key] = geo
+        return cls._cache[key]
+
+    def _build(self, shape, gap, ring_radius, ring_width):
+        rows, cols = shape
+        ph, pw = rows // 2 - gap, cols // 2 - gap
+        self.raw_shape = (4, ph, pw)
+        self.rows = np.empty(self.raw_shape, dtype=np.int64)
+        self.cols = np.empty(self.raw_shape, dtype=np.int64)
+        for p, (r0, c0) in enumerate([(0, 0), (0, cols // 2 + gap),
+                                      (rows // 2 + gap, 0),
+                                      (rows // 2 + gap, cols // 2 + gap)]):
+            self.rows[p] = np.arange(r0, r0 + ph)[:, None]
+            self.cols[p] = np.arange(c0, c0 + pw)[None, :]
+        # same center and radii as utils.RadialIntegrator
+        R = np.sqrt((self.cols - cols / 2) ** 2 + (self.rows - rows / 2) ** 2)
+        max_R = np.sqrt((cols / 2) ** 2 + (rows / 2) ** 2)
+        self.ring = np.exp(-0.5 * ((R - ring_radius * max_R) /
+                                   (ring_width * max_R)) ** 2)
+        self.ring = self.ring.astype(np.float32)
+
+
+class _IpmData(object):
+    def __init__(self, i0):
+        self._i0 = i0
+
+    def __getattr__(self, name):
+        # any field name of the config, e.g. TotalIntensity or f_12_ENRC
+        return lambda: self._i0
+
+
+class Detector(object):
+    """
+    Any detector of the config. Area detector, intensity monitor, EVR and
+    jet camera calls all work on every instance.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._rng = np.random.default_rng(
+            [CONFIG['seed'], _rank_and_size()[0]])
+
+    @property
+    def shape(self):
+        return _Geometry().raw_shape
+
+    def calib(self, evt):
+        """Raw panels with the ring scaled by the shot's diffraction"""
+        geo = _Geometry()
+        frame = self._rng.standard_normal(geo.raw_shape, dtype=np.float32)
+        frame *= CONFIG['noise']
+        frame += CONFIG['background']
+        frame += np.float32(evt.diff) * geo.ring
+        return frame
+
+    def image(self, evt, nda=None):
+        """Assembled image of nda, or the jet camera image without one"""
+        if nda is None:
+            return self._jet_cam_image(evt)
+        geo = _Geometry()
+        img = np.zeros(CONFIG['shape'], dtype=nda.dtype)
+        img[geo.rows, geo.cols] = nda
+        return img
+
+    def mask(self, run, calib=True, status=True, edges=True, central=False,
+             unbond=False, unbondnbrs=False):
+        mask = np.ones(_Geometry().raw_shape, dtype=np.uint8)
+        if edges:
+            mask[:, [0, -1], :] = 0
+            mask[:, :, [0, -1]] = 0
+        return mask
+
+    def indexes_xy(self, par):
+        geo = _Geometry()
+        return geo.rows, geo.cols
+
+    def get(self, evt):
+        return _IpmData(evt.i0)
+
+    def eventCodes(self, evt):
+        return evt.event_codes
+
+    def _jet_cam_image(self, evt, shape=(64, 128), scale=1000.):
+        """Vertical jet at the simulated jet center, 1 pixel = 1/scale"""
+        x = np.arange(shape[1]) - shape[1] / 2
+        column = np.exp(-0.5 * ((x - evt.center * scale) / 3) ** 2)
+        return np.tile(column, (shape[0], 1)) * 100
+
+
+def nominal_calibration(bins=100, delta_bin=3, integration='image'):
+    """
+    Calibration results that match the generated data, for running the
+    driver without a jt_cal run
+    """
+    rows, cols = CONFIG['shape']
+    max_R = np.sqrt((cols / 2) ** 2 + (rows / 2) ** 2)
+    radii = RadialIntegrator(CONFIG['shape'], bins).radii
+    peak_bin = int(np.argmin(abs(radii - CONFIG['ring_radius'] * max_R)))
+    peak_intensity = SimulationGenerator(None).peak_intensity
+    return {'i0_low': peak_intensity * 0.5, 'i0_high': peak_intensity * 2,
+            'peak_bin': peak_bin, 'delta_bin': delta_bin,
+            'integration': integration}
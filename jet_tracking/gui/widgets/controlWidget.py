@@ -30,6 +30,7 @@ class ControlsWidget(QFrame, Controls_Ui):
         self.le_percent.setText(str(self.context.percent))
         self.le_ave_graph.setText(str(self.context.graph_ave_time))
         self.le_refresh_rate.setText(str(self.context.refresh_rate))
+        self.le_display_rate.setText(str(self.context.display_rate))
         self.le_x_axis.setText(str(self.context.display_time))
 
     def set_motor_options(self):
@@ -41,6 +42,7 @@ class ControlsWidget(QFrame, Controls_Ui):
     def make_connections(self):
         self.le_percent.checkVal.connect(self.context.update_percent)
         self.le_refresh_rate.checkVal.connect(self.context.update_refresh_rate)
+        self.le_display_rate.checkVal.connect(self.context.update_display_rate)
         self.le_ave_graph.checkVal.connect(self.context.update_graph_averaging)
         self.le_motor_ll.checkVal.connect(self.update_limits)
         self.le_motor_hl.checkVal.connect(self.update_limits)
@@ -74,15 +74,20 @@ class Controls_Ui(object):
         obj.le_notification_tol.setToolTip('Sets time delay before '
                                            'notifications trigger an action.')
         obj.lbl_ave_graph = Label('Averaging \n(1 - 30s)')
-        obj.lbl_refresh_rate = Label('Refresh Rate \n(1 - 50Hz)')
+        obj.lbl_refresh_rate = Label('Refresh Rate \n(1 - 120Hz)')
+        obj.lbl_display_rate = Label('Display Rate \n(1 - 30Hz)')
         obj.le_ave_graph = LineEdit("5")
         obj.le_ave_graph.valRange(1, 30)
         obj.le_ave_graph.setToolTip('Sets averaging time for each point in the'
                                     ' plots.')
         obj.le_refresh_rate = LineEdit("5")
-        obj.le_refresh_rate.valRange(1, 50)
-        obj.le_refresh_rate.setToolTip('Sets the refresh rate for the plots. '
-                                       '\nHigh refresh rates may make the GUI '
+        obj.le_refresh_rate.valRange(1, 120)
+        obj.le_refresh_rate.setToolTip('Sets the rate at which new points are '
+                                       'read.')
+        obj.le_display_rate = LineEdit("10")
+        obj.le_display_rate.valRange(1, 30)
+        obj.le_display_rate.setToolTip('Sets how often the plots are redrawn.'
+                                       '\nHigh display rates may make the GUI '
                                        'run slowly.')
         obj.lbl_x_axis = Label("X-Axis Time View \n(10 - 120s)")
         obj.le_x_axis = LineEdit("60")
@@ -98,6 +103,7 @@ class Controls_Ui(object):
         obj.layout_tol = QHBoxLayout()
         obj.layout_ave = QHBoxLayout()
         obj.layout_refresh = QHBoxLayout()
+        obj.layout_display_rate = QHBoxLayout()
         obj.layout_x_axis = QHBoxLayout()
         obj.layout_percent.addWidget(obj.lbl_percent, 75)
         obj.layout_percent.addWidget(obj.le_percent)
@@ -107,6 +113,8 @@ class Controls_Ui(object):
         obj.layout_ave.addWidget(obj.le_ave_graph)
         obj.layout_refresh.addWidget(obj.lbl_refresh_rate, 75)
         obj.layout_refresh.addWidget(obj.le_refresh_rate)
+        obj.layout_display_rate.addWidget(obj.lbl_display_rate, 75)
+        obj.layout_display_rate.addWidget(obj.le_display_rate)
         obj.layout_x_axis.addWidget(obj.lbl_x_axis, 75)
         obj.layout_x_axis.addWidget(obj.le_x_axis)
         obj.layout_graph.addLayout(obj.layout_percent)
@@ -115,6 +123,7 @@ class Controls_Ui(object):
         obj.layout_graph.addWidget(obj.hline)
         obj.layout_graph.addLayout(obj.layout_ave)
         obj.layout_graph.addLayout(obj.layout_refresh)
+        obj.layout_graph.addLayout(obj.layout_display_rate)
         obj.layout_graph.addLayout(obj.layout_x_axis)
         obj.box_graph.setContentLayout(obj.layout_graph)
 
@@ -154,10 +163,11 @@ class Controls_Ui(object):
         obj.le_size.setToolTip('Move motor by this amount each step in basic '
                                'scans')
 
-        obj.le_ave_motor = LineEdit("10")
+        obj.le_ave_motor = LineEdit("20")
         obj.le_ave_motor.valRange(1, 300)
         obj.le_ave_motor.setToolTip('Number of points to average before moving'
-                                    ' motor')
+                                    ' motor, when there is no calibration to'
+                                    ' set it from the precision')
 
         obj.cbox_algorithm = ComboBox()
         obj.cbox_algorithm.setSizePolicy(QSizePolicy.Expanding,
@@ -166,6 +176,10 @@ class Controls_Ui(object):
         obj.cbox_algorithm.addItem("Basic Scan")
         obj.cbox_algorithm.addItem("Linear + Ternary")
         obj.cbox_algorithm.addItem("Dynamic Linear Scan")
+        obj.cbox_algorithm.addItem("Golden Section Search")
+        obj.cbox_algorithm.addItem("Model Fit Scan")
+        obj.cbox_algorithm.addItem("Noise Aware Ternary")
+        obj.cbox_algorithm.addItem("Fly Scan")
 
         obj.le_tolerance = LineEdit("0.001")
         obj.le_tolerance.setToolTip('Tolerance for ternary search, stops when '
@@ -0,0 +1,569 @@
+"""
+Analysis of the calibration small data, arrays in and results out
+
+Used by jt_cal.py on rank 0, or on every rank with the reductions of
+reduce_calibration and sweep_calibration.
+"""
+
+import logging
+
+import numpy as np
+from mpi4py import MPI
+from scipy.optimize import curve_fit
+
+logger = logging.getLogger(__name__)
+
+
+def gaussian(x, a, mean, std, m, b):
+    """
+    Equation for gaussian with linear component
+
+    Parameters
+    ----------
+    x : float
+        X-coordinate.
+
+    a : float
+        Amplitude of Gaussian.
+
+    mean : float
+        Mean of Gaussian.
+
+    std : float
+        Standard deviation of Gaussian.
+
+    m : float
+        Slope of linear baseline.
+
+    b : float
+        Y-intercept of linear baseline.
+
+    Returns
+    -------
+    y : float
+        The y-coordinate for the given x-coordinate as defined by the
+        parameters given for the Gaussian on a slope with offset.
+    """
+    return (a * np.exp(-((x - mean) / 2 / std) ** 2)) + (m * x + b)
+
+
+def fit_line(ave_azav, fit_points=5):
+    """
+    Fit the line from edges of array
+
+    Parameters
+    ----------
+    ave_azav: ndarray
+        The average azimuthal average from calibration data 1D array of floats.
+
+    fit_points: int (Default: 5)
+        Number of points at each end of average azimuthal average to fit.
+
+    Returns
+    -------
+    m: float
+        slope of the fit
+
+    b: float
+        y intercept of fit
+    """
+    azav_len = len(ave_azav)
+    x0 = fit_points / 2
+    x1 = azav_len - (fit_points / 2)
+    y0 = np.mean(ave_azav[:fit_points])
+    y1 = np.mean(ave_azav[azav_len - fit_points:])
+    m, b = np.polyfit((x0, x1), (y0, y1), 1)
+
+    return m, b
+
+
+def peak_lr(array_data, threshold=0.1, bins=50):
+    """Find max of normal distribution from histogram,
+    search right and left until population falls below threshold,
+    will run into problems with bimodal distribution.  This is naive,
+    look at KDE
+
+    Parameters
+    ----------
+    array_data: array like
+        1D array data to cut on
+
+    threshold: float
+        percent of max population to throw out.  Upper/lower
+
+    bins: int
+        Number of bins to generate for histogram we cut on
+
+    Returns
+    -------
+    hist: np.histogram
+        Histogram from array_data and bins
+
+    i0_low: float
+        lower i0 value of cut on histogram
+
+    i0_high: float
+        upper i0 value of cut on histogram
+
+    i0_med: float
+        median i0 value
+    """
+    hist_all, edges_all = np.histogram(array_data, bins=bins)
+    i0_low, i0_high, i0_med = hist_lr(hist_all, edges_all, threshold)
+
+    return hist_all, edges_all, i0_low, i0_high, i0_med
+
+
+def hist_lr(hist_all, edges_all, threshold=0.1):
+    """
+    The search of peak_lr on a histogram that is already made
+
+    Returns
+    -------
+    i0_low, i0_high, i0_med: float
+        lower and upper cut and peak value, see peak_lr
+    """
+    # avoid cases where there are a lot of 0 intensity shots (peak at 0)
+    hist = hist_all[1:]
+    edges = edges_all[1:]
+
+    # Find peak information
+    peak_val = hist.max()
+    peak_idx = np.where(hist == peak_val)[0][0]
+    i0_med = edges[peak_idx]
+
+    # search right
+    right = np.argmax(hist[peak_idx:] < threshold * peak_val)
+    right += peak_idx
+    i0_high = edges[right]
+
+    # search left
+    left_array = hist[:peak_idx]
+    left = peak_idx - np.argmax(left_array[::-1] < threshold * peak_val)
+    # ugly way to capture cases where the i0 does not drop to the threshold
+    # value on the left
+    if left == peak_idx:
+        print('New threshold: i0_med/2')
+        threshold = peak_val/2
+        left = peak_idx - np.argmax(left_array[::-1] < threshold)
+    i0_low = edges[left]
+
+    return i0_low, i0_high, i0_med
+
+
+def calc_azav_peak(ave_azav):
+    """
+    Get the peak from the gaussian fit with linear offset, if this
+    fails, just use the max value.  This could also use KDE.
+
+    Parameters
+    ----------
+    ave_azav: ndarray
+        radially binned average azimuthal intensity from used curves
+
+    Returns
+    -------
+    peak: int
+        index of the bin with the peak intensity
+    """
+    azav_len = len(ave_azav)
+    # Fit the gaussian with line offset, fails for skewed gaussian
+    m, b = fit_line(ave_azav)
+    x = np.arange(azav_len)
+    mean = np.sum(x * ave_azav) / np.sum(ave_azav)
+    std = np.sqrt(np.sum((x - mean) ** 2 / azav_len))
+
+    # Try to get the peak from fit
+    try:
+        # Guass/w line args
+        p0 = [max(ave_azav), mean, std, m, b]
+        popt, _ = curve_fit(gaussian, x, ave_azav, p0=p0)
+        peak = int(round(popt[1]))
+    except Exception:
+        logger.info('Failed to fit Gaussian, using peak')
+        peak = np.argmax(ave_azav)
+
+    return peak
+
+
+def get_integrated_intensity(ave_azav, peak_bin, delta_bin=3):
+    """
+    Get the average integrated intensity.  Sum the bin values from
+    the peak bin to delta bin on each side.
+
+    Parameters
+    ----------
+    ave_azav: ndarray
+        radially binned average azimuthal intensity from used curves
+
+    peak_bin: int
+        peak radial bin
+
+    delta_bin: int
+        number of bins on each side of peak to include in sum
+
+    Returns
+    -------
+    integrated_intensity: float
+        the calculated integrated intensity
+    """
+    low = peak_bin - delta_bin
+    high = peak_bin + delta_bin
+    integrated_intensity = ave_azav[low: high].sum(axis=0)
+
+    return integrated_intensity
+
+
+def fit_limits(i0_data, peak_vals, i_low, i_high, bins=100):
+    """
+    Get the line fit and standard deviation of the plot of i0
+    vs int_intensities.  This will give information about
+    distribution of integrated intensities for given i0 values
+
+    Parameters
+    ----------
+    i0_data: ndarray
+        Values of incoming intensities used in calibration
+
+    peak_vals: ndarray
+        Values of the integrated intensities corrspeconding to i0 values
+
+    """
+    m, b = np.polyfit(i0_data, peak_vals, 1)
+    x = np.linspace(i_low, i_high, bins)
+    sigma = np.std(peak_vals)
+    y = x * m + b
+
+    return x, y, m, b, sigma
+
+
+def _bin_index(values, edges):
+    """Bin of every value for evenly spaced edges, as np.histogram does"""
+    bins = len(edges) - 1
+    scale = bins / (edges[-1] - edges[0])
+    idx = ((values - edges[0]) * scale).astype(np.intp)
+    idx[idx == bins] -= 1
+    # rounding can put values next to an edge one bin off
+    idx[values < edges[idx]] -= 1
+    idx[(values >= edges[idx + 1]) & (idx != bins - 1)] += 1
+    return idx
+
+
+def histogram2d(x, y, bins=100):
+    """
+    np.histogram2d of x and y with evenly spaced bins over their ranges
+
+    Gives the same counts and edges, with one bincount instead of the
+    sorted search np.histogram2d does per dimension.
+    """
+    x_edges = np.histogram_bin_edges(x, bins)
+    y_edges = np.histogram_bin_edges(y, bins)
+    idx = _bin_index(x, x_edges) * bins + _bin_index(y, y_edges)
+    h = np.bincount(idx, minlength=bins * bins).reshape(bins, bins)
+    return h.astype(float), x_edges, y_edges
+
+
+def azav_sum(azav_data, use):
+    """
+    Sum of the azav of the events used, without copying the rows out
+
+    calibrate and reduce_calibration both average this, so they find the
+    peak of the same average.
+    """
+    return use.astype(azav_data.dtype) @ azav_data
+
+
+def calibrate(i0_data, azav_data, delta_bin, jet_loc=None, jet_peak=None):
+    """
+    Calibration results from the small data of every event
+
+    Parameters
+    ----------
+    i0_data: ndarray
+        i0 of every event
+
+    azav_data: ndarray
+        azav of every event, one row per event
+
+    delta_bin: int
+        number of bins on each side of peak to include in sum
+
+    jet_loc, jet_peak: ndarray, optional
+        jet camera location and peak of every event, if there is a camera
+
+    Returns
+    -------
+    cal: dict
+        results and the histograms and fits for the report
+    """
+    i0_data = np.asarray(i0_data)
+    azav_data = np.asarray(azav_data)
+    # Find I0 distribution and filter out unused values
+    i0_hist, edges, i0_low, i0_high, i0_med = peak_lr(i0_data)
+    use = (i0_data > i0_low) & (i0_data < i0_high)
+    i0_high = 2*i0_high
+    i0_data_use = i0_data[use]
+
+    cal = dict(i0_hist=i0_hist, edges=edges, i0_low=i0_low,
+               i0_high=i0_high, i0_med=i0_med)
+    for name, values in [('jet_location', jet_loc), ('jet_peak', jet_peak)]:
+        if values is None:
+            cal[f'{name}_mean'] = cal[f'{name}_std'] = None
+        else:
+            cal[f'{name}_mean'] = np.mean(values[use])
+            cal[f'{name}_std'] = np.std(values[use])
+
+    # Average of the azav values we'll use
+    ave_azav = azav_sum(azav_data, use) / use.sum()
+    # Find the peak bin from average azav values
+    peak_bin = calc_azav_peak(ave_azav)
+    cal.update(peak_results(ave_azav, peak_bin, delta_bin))
+
+    # Peak values of all the intensities, one sum over the window columns
+    low_bin = peak_bin - delta_bin
+    high_bin = peak_bin + delta_bin
+    peak_vals = azav_data[:, low_bin:high_bin][use].sum(axis=1)
+    # Now fit I0 vs diffraction intensities
+    x, y, slope, intercept, sigma = fit_limits(i0_data_use, peak_vals,
+                                               i0_low, i0_high)
+    cal.update(x=x, y=y, slope=slope, intercept=intercept, sigma=sigma)
+    cal['peak_hist'] = histogram2d(peak_vals, i0_data_use, bins=100)
+
+    # Ratio information
+    ratios = peak_vals / i0_data_use
+    cal['mean_ratio'] = np.mean(ratios)
+    cal['med_ratio'] = np.median(ratios)
+    cal['std_ratio'] = np.std(ratios)
+
+    return cal
+
+
+def peak_results(ave_azav, peak_bin, delta_bin):
+    """Integrated intensity of the average azav around the peak"""
+    integrated_intensity = get_integrated_intensity(
+        ave_azav, peak_bin, delta_bin)
+    int_hist, int_edges, int_low, int_high, int_med = peak_lr(
+        integrated_intensity)
+    return dict(ave_azav=ave_azav, peak_bin=peak_bin,
+                integrated_intensity=integrated_intensity, int_low=int_low,
+                int_high=int_high, int_median=int_med)
+
+
+def _allreduce(comm, values, op=MPI.SUM):
+    values = np.array(values, dtype=float)
+    if comm is not None:
+        comm.Allreduce(MPI.IN_PLACE, values, op=op)
+    return values
+
+
+def _i0_histogram(comm, i0_data):
+    """The i0 histogram of peak_lr over the events of all ranks"""
+    i0_min, i0_max = _allreduce(comm, [-i0_data.min(initial=np.inf),
+                                       i0_data.max(initial=-np.inf)], MPI.MAX)
+    i0_hist, edges = np.histogram(i0_data, bins=50, range=(-i0_min, i0_max))
+    if comm is not None:
+        comm.Allreduce(MPI.IN_PLACE, i0_hist, op=MPI.SUM)
+    return i0_hist, edges
+
+
+def _azav_peak(comm, ave_azav, root=0):
+    """calc_azav_peak on root, the same bin on every rank"""
+    if comm is None:
+        return calc_azav_peak(ave_azav)
+    peak_bin = None
+    if comm.Get_rank() == root:
+        peak_bin = calc_azav_peak(ave_azav)
+    return comm.bcast(peak_bin, root=root)
+
+
+def reduce_calibration(comm, i0_data, azav_data, delta_bin, jet_loc=None,
+                       jet_peak=None, root=0):
+    """
+    The results of calibrate, from the events of all ranks without
+    bringing them together
+
+    Every rank keeps its own events and calls this with them. The i0
+    histogram, the azav sum and the moments of the peak intensities are
+    added up over the ranks, only the ratios are gathered for their
+    median. The histograms use the edges calibrate would, from the global
+    minimum and maximum, so the results are the same up to rounding.
+
+    Parameters
+    ----------
+    comm: MPI.Comm or None
+        communicator of the ranks, every rank has to call this. None for
+        the events of one process
+
+    i0_data, azav_data, delta_bin, jet_loc, jet_peak:
+        as for calibrate, the events of this rank only
+
+    root: int
+        rank to return the results on
+
+    Returns
+    -------
+    cal: dict or None
+        as returned by calibrate, None on all ranks but root
+    """
+    i0_data = np.asarray(i0_data, dtype=float)
+    azav_data = np.asarray(azav_data, dtype=float)
+
+    # i0 histogram on the edges of all the events
+    i0_hist, edges = _i0_histogram(comm, i0_data)
+    i0_low, i0_high, i0_med = hist_lr(i0_hist, edges)
+    use = (i0_data > i0_low) & (i0_data < i0_high)
+    i0_high = 2*i0_high
+    i0_data_use = i0_data[use]
+
+    # average azav of the events used and the peak of it
+    count = _allreduce(comm, [use.sum()])[0]
+    ave_azav = _allreduce(comm, azav_sum(azav_data, use)) / count
+    peak_bin = _azav_peak(comm, ave_azav, root)
+    low_bin = peak_bin - delta_bin
+    high_bin = peak_bin + delta_bin
+    peak_vals = azav_data[use, low_bin:high_bin].sum(axis=1)
+    ratios = peak_vals / i0_data_use
+
+    # means first, then the centered moments around them
+    columns = [i0_data_use, peak_vals, ratios]
+    if jet_loc is not None:
+        columns += [np.asarray(jet_loc)[use], np.asarray(jet_peak)[use]]
+    means = _allreduce(comm, [c.sum() for c in columns]) / count
+    centered = [c - mean for c, mean in zip(columns, means)]
+    moments = _allreduce(comm, [(d * d).sum() for d in centered] +
+                         [(centered[0] * centered[1]).sum()]) / count
+    var = moments[:-1]
+    slope = moments[-1] / var[0]
+    intercept = means[1] - slope * means[0]
+    x = np.linspace(i0_low, i0_high, 100)
+    y = x * slope + intercept
+
+    # histogram of the peak values against i0 for the report
+    limits = _allreduce(comm, [-peak_vals.min(initial=np.inf),
+                               peak_vals.max(initial=-np.inf),
+                               -i0_data_use.min(initial=np.inf),
+                               i0_data_use.max(initial=-np.inf)], MPI.MAX)
+    h, y_edge, x_edge = np.histogram2d(
+        peak_vals, i0_data_use, bins=100,
+        range=[[-limits[0], limits[1]], [-limits[2], limits[3]]])
+    if comm is None:
+        all_ratios = [ratios]
+    else:
+        h = np.ascontiguousarray(h)
+        comm.Reduce(MPI.IN_PLACE if comm.Get_rank() == root else h, h,
+                    op=MPI.SUM, root=root)
+        all_ratios = comm.gather(ratios, root=root)
+        if comm.Get_rank() != root:
+            return None
+
+    cal = dict(i0_hist=i0_hist, edges=edges, i0_low=i0_low,
+               i0_high=i0_high, i0_med=i0_med, x=x, y=y, slope=slope,
+               intercept=intercept, sigma=np.sqrt(var[1]),
+               peak_hist=(h, y_edge, x_edge), mean_ratio=means[2],
+               med_ratio=np.median(np.concatenate(all_ratios)),
+               std_ratio=np.sqrt(var[2]))
+    cal.update(peak_results(ave_azav, peak_bin, delta_bin))
+    if jet_loc is None:
+        cal['jet_location_mean'] = cal['jet_location_std'] = None
+        cal['jet_peak_mean'] = cal['jet_peak_std'] = None
+    else:
+        cal['jet_location_mean'] = means[3]
+        cal['jet_location_std'] = np.sqrt(var[3])
+        cal['jet_peak_mean'] = means[4]
+        cal['jet_peak_std'] = np.sqrt(var[4])
+
+    return cal
+
+
+def sweep_calibration(i0_data, azav_data, delta_bins=(3,), peak_offsets=(0,),
+                      thresholds=(0.1,), comm=None, root=0):
+    """
+    Calibration results for every combination of integration window and
+    i0 cut, from one pass over the events
+
+    The peak values of all windows come from the running sum of each azav,
+    two lookups per event and window instead of one sum per window.
+
+    Parameters
+    ----------
+    i0_data, azav_data: ndarray
+        as for calibrate, or the events of this rank if comm is given
+
+    delta_bins: list of int
+        half widths of the integration window
+
+    peak_offsets: list of int
+        shifts of the window center from the peak bin found
+
+    thresholds: list of float
+        peak_lr thresholds of the i0 cut
+
+    comm: MPI.Comm, optional
+        communicator if the events are spread over the ranks, every rank
+        has to call this then
+
+    root: int
+        rank to return the results on
+
+    Returns
+    -------
+    rows: list of dict or None
+        one per combination, None on all ranks but root
+    """
+    i0_data = np.asarray(i0_data, dtype=float)
+    azav_data = np.asarray(azav_data, dtype=float)
+    nbins = azav_data.shape[1]
+    i0_hist, edges = _i0_histogram(comm, i0_data)
+    combos = [(d, o) for o in peak_offsets for d in delta_bins]
+    rows = []
+    for threshold in thresholds:
+        i0_low, i0_high, _ = hist_lr(i0_hist, edges, threshold)
+        use = (i0_data > i0_low) & (i0_data < i0_high)
+        i0_use = i0_data[use]
+        count = _allreduce(comm, [use.sum()])[0]
+        ave_azav = _allreduce(comm, azav_sum(azav_data, use)) / count
+        peak_bin = _azav_peak(comm, ave_azav, root)
+
+        # running sum with a leading 0, a window is the difference of two
+        cumsum = np.zeros((len(i0_use), nbins + 1))
+        np.cumsum(azav_data[use], axis=1, out=cumsum[:, 1:])
+        lows = np.clip([peak_bin + o - d for d, o in combos], 0, nbins)
+        highs = np.clip([peak_bin + o + d for d, o in combos], 0, nbins)
+        peak_vals = cumsum[:, highs] - cumsum[:, lows]
+        ratios = peak_vals / i0_use[:, None]
+
+        # means first, then the centered moments around them
+        k = len(combos)
+        means = _allreduce(comm, np.concatenate(
+            [[i0_use.sum()], peak_vals.sum(axis=0), ratios.sum(axis=0)]))
+        means /= count
+        di0 = i0_use - means[0]
+        dpeak = peak_vals - means[1:k + 1]
+        dratio = ratios - means[k + 1:]
+        moments = _allreduce(comm, np.concatenate(
+            [[(di0 * di0).sum()], (dpeak * dpeak).sum(axis=0),
+             (dratio * dratio).sum(axis=0), (di0[:, None] * dpeak).sum(axis=0)]
+        )) / count
+        slopes = moments[2 * k + 1:] / moments[0]
+        for i, (delta_bin, offset) in enumerate(combos):
+            mean_ratio = means[k + 1 + i]
+            std_ratio = np.sqrt(moments[k + 1 + i])
+            rows.append({
+                'threshold': threshold,
+                'peak_offset': offset,
+                'delta_bin': delta_bin,
+                'peak_bin': peak_bin + offset,
+                'events': int(count),
+                'i0_low': i0_low,
+                'i0_high': 2*i0_high,
+                'mean_ratio': mean_ratio,
+                'std_ratio': std_ratio,
+                'rel_std_ratio': std_ratio / mean_ratio,
+                'slope': slopes[i],
+                'intercept': means[1 + i] - slopes[i] * means[0],
+                'sigma': np.sqrt(moments[1 + i])
+            })
+    if comm is not None and comm.Get_rank() != root:
+        return None
+    # smallest relative spread of the ratio first
+    return sorted(rows, key=lambda row: row['rel_std_ratio'])
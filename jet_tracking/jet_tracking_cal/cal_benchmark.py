@@ -0,0 +1,90 @@
+"""
+Time of the rank 0 calibration analysis on synthetic small data
+
+    python cal_benchmark.py --events 1000000
+
+Compares calibrate with the per event loops it replaced, on the same
+events, and checks that both give the same results.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from cal_analysis import (calc_azav_peak, calibrate, fit_limits, peak_lr,
+                          peak_results)
+
+
+def synthetic_small_data(events, bins=100, peak=40, width=4, seed=0):
+    """
+    i0 and azav of events with a diffraction ring following i0
+
+    One in twenty events has almost no beam, as in real runs.
+    """
+    rng = np.random.default_rng(seed)
+    i0 = rng.normal(10, 1, events)
+    dark = rng.random(events) < 0.05
+    i0[dark] = rng.uniform(0, 1, dark.sum())
+    ring = np.exp(-0.5 * ((np.arange(bins) - peak) / width) ** 2)
+    azav = rng.normal(1, 0.1, (events, bins))
+    azav *= i0[:, None] * ring
+    azav += 1 + 0.01 * np.arange(bins)
+    return i0, azav
+
+
+def calibrate_loops(i0_data, azav_data, delta_bin):
+    """calibrate as it was, one python step per event used"""
+    i0_hist, edges, i0_low, i0_high, i0_med = peak_lr(i0_data)
+    i0_idxs = np.where((i0_data > i0_low) & (i0_data < i0_high))
+    i0_high = 2*i0_high
+    i0_data_use = i0_data[i0_idxs]
+    azav_use = [azav_data[idx] for idx in i0_idxs[0]]
+    ave_azav = np.array((np.sum(azav_use, axis=0)) / len(azav_use))
+    peak_bin = calc_azav_peak(ave_azav)
+    cal = peak_results(ave_azav, peak_bin, delta_bin)
+    low_bin = peak_bin - delta_bin
+    high_bin = peak_bin + delta_bin
+    peak_vals = [azav[low_bin:high_bin].sum(axis=0) for azav in azav_use]
+    x, y, slope, intercept, sigma = fit_limits(i0_data_use, peak_vals,
+                                               i0_low, i0_high)
+    cal.update(i0_low=i0_low, i0_high=i0_high, i0_med=i0_med, slope=slope,
+               intercept=intercept, sigma=sigma)
+    cal['peak_hist'] = np.histogram2d(peak_vals, i0_data_use, bins=100)
+    ratios = peak_vals / i0_data_use
+    cal['mean_ratio'] = np.mean(ratios)
+    cal['med_ratio'] = np.median(ratios)
+    cal['std_ratio'] = np.std(ratios)
+    return cal
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--bins', type=int, default=100)
+    parser.add_argument('--delta-bin', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    i0, azav = synthetic_small_data(args.events, args.bins)
+    print(f'{args.events} events, {args.bins} bins, '
+          f'{azav.nbytes / 1e6:.0f} MB of azav')
+    timings = {}
+    for name, func in [('loops', calibrate_loops), ('arrays', calibrate)]:
+        best = np.inf
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            cal = func(i0, azav, args.delta_bin)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = (best, cal)
+        print(f'{name:>6}: {best:.3f} s')
+    loops, arrays = timings['loops'][1], timings['arrays'][1]
+    same = all(np.allclose(loops[k], arrays[k]) for k in loops
+               if k != 'peak_hist')
+    same &= all(np.allclose(a, b) for a, b in zip(loops['peak_hist'],
+                                                  arrays['peak_hist']))
+    print(f'speedup {timings["loops"][0] / timings["arrays"][0]:.1f}x, '
+          f'same results: {same}')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,18 +10,19 @@ import h5py
 import matplotlib.pyplot as plt
 import numpy as np
 import panel as pn
-import psana
 import yaml
 from bokeh.models import ColorBar, Legend, LegendItem, LinearColorMapper, Span
 from bokeh.plotting import figure
 from mpi4py import MPI
-from scipy.optimize import curve_fit
 
 fpath = os.path.dirname(os.path.abspath(__file__))
 fpathup = '/'.join(fpath.split('/')[:-1])
 sys.path.append(fpathup)
 print(fpathup)
-from utils import get_evr_w_codes, get_r_masks  # NOQA
+from cal_analysis import (calibrate, reduce_calibration,  # NOQA
+                          sweep_calibration)
+from tools.cal_store import CalStore  # NOQA
+from utils import RadialIntegrator, get_evr_w_codes  # NOQA
 
 # Need to go to stdout for arp/sbatch
 logger = logging.getLogger(__name__)
@@ -35,213 +36,14 @@ SD_LOC = '/reg/d/psdm/'
 FFB_LOC = '/cds/data/drpsrcf/'
 
 
-def gaussian(x, a, mean, std, m, b):
-    """
-    Equation for gaussian with linear component
-
-    Parameters
-    ----------
-    x : float
-        X-coordinate.
-
-    a : float
-        Amplitude of Gaussian.
-
-    mean : float
-        Mean of Gaussian.
-
-    std : float
-        Standard deviation of Gaussian.
-
-    m : float
-        Slope of linear baseline.
-
-    b : float
-        Y-intercept of linear baseline.
-
-    Returns
-    -------
-    y : float
-        The y-coordinate for the given x-coordinate as defined by the
-        parameters given for the Gaussian on a slope with offset.
-    """
-    return (a * np.exp(-((x - mean) / 2 / std) ** 2)) + (m * x + b)
-
-
-def fit_line(ave_azav, fit_points=5):
-    """
-    Fit the line from edges of array
-
-    Parameters
-    ----------
-    ave_azav: ndarray
-        The average azimuthal average from calibration data 1D array of floats.
-
-    fit_points: int (Default: 5)
-        Number of points at each end of average azimuthal average to fit.
-
-    Returns
-    -------
-    m: float
-        slope of the fit
-
-    b: float
-        y intercept of fit
-    """
-    azav_len = len(ave_azav)
-    x0 = fit_points / 2
-    x1 = azav_len - (fit_points / 2)
-    y0 = np.mean(ave_azav[:fit_points])
-    y1 = np.mean(ave_azav[azav_len - fit_points:])
-    m, b = np.polyfit((x0, x1), (y0, y1), 1)
-
-    return m, b
-
-
-def peak_lr(array_data, threshold=0.1, bins=50):
-    """Find max of normal distribution from histogram,
-    search right and left until population falls below threshold,
-    will run into problems with bimodal distribution.  This is naive,
-    look at KDE
-
-    Parameters
-    ----------
-    array_data: array like
-        1D array data to cut on
-
-    threshold: float
-        percent of max population to throw out.  Upper/lower
-
-    bins: int
-        Number of bins to generate for histogram we cut on
-
-    Returns
-    -------
-    hist: np.histogram
-        Histogram from array_data and bins
-
-    i0_low: float
-        lower i0 value of cut on histogram
-
-    i0_high: float
-        upper i0 value of cut on histogram
-
-    i0_med: float
-        median i0 value
-    """
-    hist_all, edges_all = np.histogram(array_data, bins=bins)
-    # avoid cases where there are a lot of 0 intensity shots (peak at 0)
-    hist = hist_all[1:]
-    edges = edges_all[1:]
-
-    # Find peak information
-    peak_val = hist.max()
-    peak_idx = np.where(hist == peak_val)[0][0]
-    i0_med = edges[peak_idx]
-
-    # search right
-    right = np.argmax(hist[peak_idx:] < threshold * peak_val)
-    right += peak_idx
-    i0_high = edges[right]
-
-    # search left
-    left_array = hist[:peak_idx]
-    left = peak_idx - np.argmax(left_array[::-1] < threshold * peak_val)
-    # ugly way to capture cases where the i0 does not drop to the threshold
-    # value on the left
-    if left == peak_idx:
-        print('New threshold: i0_med/2')
-        threshold = peak_val/2
-        left = peak_idx - np.argmax(left_array[::-1] < threshold)
-    i0_low = edges[left]
-
-    return hist_all, edges_all, i0_low, i0_high, i0_med
-
-
-def calc_azav_peak(ave_azav):
-    """
-    Get the peak from the gaussian fit with linear offset, if this
-    fails, just use the max value.  This could also use KDE.
-
-    Parameters
-    ----------
-    ave_azav: ndarray
-        radially binned average azimuthal intensity from used curves
-
-    Returns
-    -------
-    peak: int
-        index of the bin with the peak intensity
-    """
-    azav_len = len(ave_azav)
-    # Fit the gaussian with line offset, fails for skewed gaussian
-    m, b = fit_line(ave_azav)
-    x = np.arange(azav_len)
-    mean = np.sum(x * ave_azav) / np.sum(ave_azav)
-    std = np.sqrt(np.sum((x - mean) ** 2 / azav_len))
-
-    # Try to get the peak from fit
-    try:
-        # Guass/w line args
-        p0 = [max(ave_azav), mean, std, m, b]
-        popt, _ = curve_fit(gaussian, x, ave_azav, p0=p0)
-        peak = int(round(popt[1]))
-    except Exception:
-        logger.info('Failed to fit Gaussian, using peak')
-        peak = np.argmax(ave_azav)
-
-    return peak
-
-
-def get_integrated_intensity(ave_azav, peak_bin, delta_bin=3):
-    """
-    Get the average integrated intensity.  Sum the bin values from
-    the peak bin to delta bin on each side.
-
-    Parameters
-    ----------
-    ave_azav: ndarray
-        radially binned average azimuthal intensity from used curves
-
-    peak_bin: int
-        peak radial bin
-
-    delta_bin: int
-        number of bins on each side of peak to include in sum
-
-    Returns
-    -------
-    integrated_intensity: float
-        the calculated integrated intensity
-    """
-    low = peak_bin - delta_bin
-    high = peak_bin + delta_bin
-    integrated_intensity = ave_azav[low: high].sum(axis=0)
-
-    return integrated_intensity
-
-
-def fit_limits(i0_data, peak_vals, i_low, i_high, bins=100):
-    """
-    Get the line fit and standard deviation of the plot of i0
-    vs int_intensities.  This will give information about
-    distribution of integrated intensities for given i0 values
-
-    Parameters
-    ----------
-    i0_data: ndarray
-        Values of incoming intensities used in calibration
-
-    peak_vals: ndarray
-        Values of the integrated intensities corrspeconding to i0 values
-
-    """
-    m, b = np.polyfit(i0_data, peak_vals, 1)
-    x = np.linspace(i_low, i_high, bins)
-    sigma = np.std(peak_vals)
-    y = x * m + b
-
-    return x, y, m, b, sigma
+def sweep_table(rows):
+    """The sweep results as an html table for the report"""
+    columns = list(rows[0]) if rows else []
+    head = ''.join(f'<th>{c}</th>' for c in columns)
+    body = ''.join(
+        '<tr>' + ''.join(f'<td>{row[c]:.4g}</td>' for c in columns) + '</tr>'
+        for row in rows)
+    return f'<table><tr>{head}</tr>{body}</table>'
 
 
 # Bokeh Figures
@@ -298,7 +100,8 @@ def intensity_hist(intensity_hist, edges):
     return fig
 
 
-def intensity_vs_peak_fig(intensity, peak_vals, x, y, slope, intercept, sigma):
+def intensity_vs_peak_fig(peak_hist, x, y, slope, intercept, sigma, i0_low,
+                          i0_high):
     """Simple plot of intensity vs peak value.txt"""
     fig = figure(
         title=f'Peak value vs Intensity. Slope = {round(slope, 2)}, '
@@ -307,7 +110,7 @@ def intensity_vs_peak_fig(intensity, peak_vals, x, y, slope, intercept, sigma):
         y_axis_label='Peak Values'
     )
     fig.x_range.range_padding = fig.y_range.range_padding = 0
-    h, y_edge, x_edge = np.histogram2d(peak_vals, intensity, bins=100)
+    h, y_edge, x_edge = peak_hist
     fig.image(image=[h], x=x_edge[0], y=y_edge[0], dh=y_edge[-1]-y_edge[0],
               dw=x_edge[-1]-x_edge[0], palette="Spectral11")
     color_mapper = LinearColorMapper(palette="Spectral11", low=h.min(),
@@ -326,8 +129,17 @@ if __name__ == '__main__':
     parser.add_argument('--cfg', type=str, default=(
         ''.join([JT_LOC, 'jt_configs/xcs_config.yml'])))
     parser.add_argument('--run', type=int, default=None)
+    parser.add_argument('--fake_psana', action='store_true', help='calibrate '
+                        'on events generated by fake_psana, the results go '
+                        'to ./fake_psdm')
     args = parser.parse_args()
 
+    if args.fake_psana:
+        import fake_psana as psana
+        SD_LOC = FFB_LOC = 'fake_psdm/'
+    else:
+        import psana
+
     # Start spinning up processes
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
@@ -349,9 +161,14 @@ if __name__ == '__main__':
         if run is None or run == 0:
             run = yml_dict['run']
         cal_params = yml_dict['cal_params']
+        # reduce over the ranks instead of saving small data for rank 0
+        stream = cal_params.get('stream', False)
         ffb = yml_dict['ffb']
         evr_name = yml_dict['evr_name']
         event_code = yml_dict['event_code']
+        if args.fake_psana:
+            psana.configure(**{'shape': det_map['shape'],
+                               **yml_dict.get('fake_psana', {})})
 
     if jet_cam_name == 'None' or jet_cam_name == 'none':
         jet_cam_name = None
@@ -378,9 +195,13 @@ if __name__ == '__main__':
     else:
         jt_file_path = ''.join([SD_LOC, hutch, '/', exp, '/scratch/',
                                 jt_file])
-    if rank == 0:
-        logger.info('Will save small data to {}'.format(jt_file_path))
-    smd = ds.small_data(jt_file_path, gather_interval=100)
+    if stream:
+        # each rank keeps its events, see reduce_calibration
+        i0_rows, azav_rows, jet_peak_rows, jet_loc_rows = [], [], [], []
+    else:
+        if rank == 0:
+            logger.info('Will save small data to {}'.format(jt_file_path))
+        smd = ds.small_data(jt_file_path, gather_interval=100)
 
     # Get the detectors from the config
     try:
@@ -392,7 +213,13 @@ if __name__ == '__main__':
         if jet_cam_name is not None:
             jet_cam = psana.Detector(jet_cam_name)
         evr = psana.Detector(evr_name)
-        masks = get_r_masks(det_map['shape'], cal_params['azav_bins'])
+        integrator = RadialIntegrator(det_map['shape'],
+                                      cal_params['azav_bins'])
+        # must match the integration the workers use
+        integration = det_map.get('integration', 'image')
+        if integration == 'raw':
+            integrator = integrator.raw_panels(
+                detector.indexes_xy(int(run)), psana_mask)
     except Exception as e:
         logger.warning('Unable to create psana detectors: {}'.format(e))
         sys.exit()
@@ -413,9 +240,10 @@ if __name__ == '__main__':
                 continue
             # Get image and azav
             calib = detector.calib(evt)
-            calib = calib * psana_mask
-            det_image = detector.image(evt, calib)
-            azav = np.array([np.mean(det_image[mask]) for mask in masks])
+            if integration != 'raw':
+                calib = calib * psana_mask
+                calib = detector.image(evt, calib)
+            azav = integrator.integrate(calib)
 
             # Get i0 Data this is different for differe ipm detectors
             # Be nice not to waste cycles on getattr at some point
@@ -435,99 +263,87 @@ if __name__ == '__main__':
             else:
                 max_jet_val = 1e6
                 max_jet_idx = 1e6
-            smd.event(azav=azav, i0=i0_data, jet_peak=max_jet_val,
-                      jet_loc=max_jet_idx)
+            if stream:
+                i0_rows.append(i0_data)
+                azav_rows.append(azav)
+                jet_peak_rows.append(max_jet_val)
+                jet_loc_rows.append(max_jet_idx)
+            else:
+                smd.event(azav=azav, i0=i0_data, jet_peak=max_jet_val,
+                          jet_loc=max_jet_idx)
         except Exception as e:
             logger.info('Unable to process event {}: {}'.format(evt_idx, e))
 
         if evt_idx > num_events:
             break
 
-    smd.save()
-    if rank == 0:
-        while not os.path.exists(jt_file_path):
-            time.sleep(0.1)
-        logger.info('Saved Small Data, Processing...')
-
-        f = h5py.File(jt_file_path, 'r')
-        i0_data = np.array(f['i0'])
-        azav_data = np.array(f['azav'])
-        jet_loc = np.array(f['jet_loc'])
-        jet_peak = np.array(f['jet_peak'])
-
-        # Find I0 distribution and filter out unused values
-        i0_data = np.array(i0_data)
-        i0_hist, edges, i0_low, i0_high, i0_med = peak_lr(i0_data)
-        i0_idxs = np.where((i0_data > i0_low) & (i0_data < i0_high))
-        i0_high = 2*i0_high
-        i0_data_use = i0_data[i0_idxs]
+    # windows and cuts to compare in the report, see sweep_calibration
+    sweep = cal_params.get('sweep')
+    sweep_rows = None
+    if stream:
+        if jet_cam_name is None:
+            jet_loc_rows = jet_peak_rows = None
+        azav_rows = np.reshape(azav_rows, (-1, integrator.nbins))
+        cal = reduce_calibration(
+            comm, i0_rows, azav_rows, cal_params['delta_bin'],
+            jet_loc=jet_loc_rows, jet_peak=jet_peak_rows)
+        if sweep:
+            sweep_rows = sweep_calibration(i0_rows, azav_rows, comm=comm,
+                                           **sweep)
+    else:
+        smd.save()
+        if rank == 0:
+            while not os.path.exists(jt_file_path):
+                time.sleep(0.1)
+            logger.info('Saved Small Data, Processing...')
 
-        if jet_cam_name is not None:
-            jet_loc_use = jet_loc[i0_idxs]
-            jet_loc_mean = np.mean(jet_loc_use)
-            jet_loc_std = np.std(jet_loc_use)
-            jet_peak_use = jet_peak[i0_idxs]
-            jet_peak_mean = np.mean(jet_peak_use)
-            jet_peak_std = np.std(jet_peak_use)
-        else:
-            jet_loc_mean = None
-            jet_loc_std = None
-            jet_peak_mean = None
-            jet_peak_std = None
-
-        # Generate figure for i0 params
-        p = peak_fig(f'{ipm_name}', i0_hist, edges, i0_med, i0_low, i0_high)
-
-        # Get the azav value we'll use
-        azav_use = [azav_data[idx] for idx in i0_idxs[0]]
-        ave_azav = np.array((np.sum(azav_use, axis=0)) / len(azav_use))
-        # Find the peak bin from average azav values
-        peak_bin = calc_azav_peak(ave_azav)
-
-        # Get the integrated intensity and generate fig
-        integrated_intensity = get_integrated_intensity(
-            ave_azav, peak_bin, cal_params['delta_bin'])
-        int_hist, int_edges, int_low, int_high, int_med = peak_lr(
-            integrated_intensity)
-        p1 = azav_fig(
-            ave_azav, peak_bin, integrated_intensity, cal_params['delta_bin'])
-
-        # Go back through indices and find peak values for all the intensities
-        low_bin = peak_bin - cal_params['delta_bin']
-        high_bin = peak_bin + cal_params['delta_bin']
-        peak_vals = [azav[low_bin:high_bin].sum(axis=0) for azav in azav_use]
-        # Now fit I0 vs diffraction intensities
-        x, y, slope, intercept, sigma = fit_limits(i0_data_use, peak_vals,
-                                                   i0_low, i0_high)
-        p2 = intensity_vs_peak_fig(i0_data_use, peak_vals, x, y, slope,
-                                   intercept, sigma)
-
-        # Ratio information
-        ratios = peak_vals / i0_data_use
-        mean_ratio = np.mean(ratios)
-        med_ratio = np.median(ratios)
-        std_ratio = np.std(ratios)
+            f = h5py.File(jt_file_path, 'r')
+            if jet_cam_name is not None:
+                jet_loc = np.array(f['jet_loc'])
+                jet_peak = np.array(f['jet_peak'])
+            else:
+                jet_loc = jet_peak = None
+            i0_data = np.array(f['i0'])
+            azav_data = np.array(f['azav'])
+            cal = calibrate(i0_data, azav_data, cal_params['delta_bin'],
+                            jet_loc=jet_loc, jet_peak=jet_peak)
+            if sweep:
+                sweep_rows = sweep_calibration(i0_data, azav_data, **sweep)
+
+    if rank == 0:
+        i0_low, i0_high = cal['i0_low'], cal['i0_high']
+        # Generate figures for i0 params, azav and fit
+        p = peak_fig(f'{ipm_name}', cal['i0_hist'], cal['edges'],
+                     cal['i0_med'], i0_low, i0_high)
+        p1 = azav_fig(cal['ave_azav'], cal['peak_bin'],
+                      cal['integrated_intensity'], cal_params['delta_bin'])
+        p2 = intensity_vs_peak_fig(cal['peak_hist'], cal['x'], cal['y'],
+                                   cal['slope'], cal['intercept'],
+                                   cal['sigma'], i0_low, i0_high)
 
         # Accumulate results
         results = {
             'i0_low': i0_low,
             'i0_high': i0_high,
-            'i0_median': i0_med,
-            'int_low': int_low,
-            'int_high': int_high,
-            'int_median': int_med,
-            'peak_bin': peak_bin,
+            'i0_median': cal['i0_med'],
+            'int_low': cal['int_low'],
+            'int_high': cal['int_high'],
+            'int_median': cal['int_median'],
+            'peak_bin': cal['peak_bin'],
             'delta_bin': cal_params['delta_bin'],
-            'mean_ratio': mean_ratio,
-            'med_ratio': med_ratio,
-            'std_ratio': std_ratio,
-            'jet_location_mean': jet_loc_mean,
-            'jet_location_std': jet_loc_std,
-            'jet_peak_mean': jet_peak_mean,
-            'jet_peak_std': jet_peak_std
+            'integration': integration,
+            'mean_ratio': cal['mean_ratio'],
+            'med_ratio': cal['med_ratio'],
+            'std_ratio': cal['std_ratio'],
+            'jet_location_mean': cal['jet_location_mean'],
+            'jet_location_std': cal['jet_location_std'],
+            'jet_peak_mean': cal['jet_peak_mean'],
+            'jet_peak_std': cal['jet_peak_std']
         }
 
         logger.info('Results: {}'.format(results))
+        if sweep_rows:
+            logger.info('Best of the sweep: {}'.format(sweep_rows[0]))
 
         # Set report directory
         results_dir = ''.join([SD_LOC, hutch, '/', exp,
@@ -547,8 +363,9 @@ if __name__ == '__main__':
         # Write metadata to file
         res_file = ''.join([calib_dir, '/jt_cal_', run, '_results'])
         with open(res_file, 'w') as f:
-            results = {k: str(v) for k, v in results.items()}
-            json.dump(results, f)
+            json.dump({k: str(v) for k, v in results.items()}, f)
+        # typed, and found by the driver and GUI without a directory scan
+        CalStore(calib_dir).add(exp, run, results, source=res_file)
         logger.info(f'Saved calibration to {res_file}')
 
         # try to also save calib results to exp directory in hutch opr home
@@ -559,8 +376,8 @@ if __name__ == '__main__':
                 Path(hopr_dir).mkdir(mode=777, parents=True)
             res_file = ''.join([hopr_dir, '/jt_cal_', run, '_results'])
             with open(res_file, 'w') as f:
-                results = {k: str(v) for k, v in results.items()}
-                json.dump(results, f)
+                json.dump({k: str(v) for k, v in results.items()}, f)
+            CalStore(hopr_dir).add(exp, run, results, source=res_file)
             logger.info('Saved calibration to {}'.format(res_file))
         except Exception as e:
             logger.warning(f'Unable to write to {hutch}opr experiment '
@@ -573,6 +390,12 @@ if __name__ == '__main__':
         gspec[4:6, 0:3] = p1
         gspec[7:12, 0:3] = p2
         tabs = pn.Tabs(gspec)
+        if sweep_rows:
+            tabs.append(pn.pane.HTML(sweep_table(sweep_rows),
+                                     name='Calibration Sweep'))
+            with open(''.join([results_dir, '/sweep.json']), 'w') as f:
+                json.dump([{k: float(v) for k, v in row.items()}
+                           for row in sweep_rows], f, indent=1)
 
         report_file = ''.join([results_dir, '/report.html'])
         logger.info('Saving report to {}'.format(report_file))
@@ -0,0 +1,53 @@
+from mpi4py import MPI
+
+CONTROL_TAG = 7
+
+
+class ControlChannel(object):
+    """
+    Commands from the master to the workers over MPI.
+
+    Uses its own communicator so commands never mix with the data the
+    workers send. The master sends each command to every worker without
+    waiting, and the workers poll for commands between events. A command
+    therefore takes effect from the first event a worker starts after it
+    arrives, on every node of the job and without extra threads or
+    sockets.
+
+    Parameters
+    ----------
+    comm : MPI.Comm
+        Communicator of all ranks, duplicated here. Creating the channel
+        is collective, every rank has to do it.
+    master : int, optional
+        Rank sending the commands.
+    """
+
+    def __init__(self, comm, master=0):
+        self.comm = comm.Dup()
+        self.master = master
+        self._pending = []
+
+    @property
+    def workers(self):
+        return [r for r in range(self.comm.Get_size()) if r != self.master]
+
+    def send(self, message):
+        """Send a command dictionary to every worker, master side"""
+        self._pending = [r for r in self._pending if not r.Test()]
+        for worker in self.workers:
+            self._pending.append(self.comm.isend(message, dest=worker,
+                                                 tag=CONTROL_TAG))
+
+    def wait(self):
+        """Block until every command has been delivered, master side"""
+        MPI.Request.Waitall(self._pending)
+        self._pending = []
+
+    def poll(self):
+        """Commands that arrived since the last poll, oldest first"""
+        messages = []
+        while self.comm.Iprobe(source=self.master, tag=CONTROL_TAG):
+            messages.append(self.comm.recv(source=self.master,
+                                           tag=CONTROL_TAG))
+        return messages
@@ -17,16 +17,16 @@ context = zmq.Context()
 socket = context.socket(zmq.PAIR)
 socket.connect(''.join(['tcp://localhost:', str(api_port)]))
 
-# Example for subscribing to np arrays zmq
+# Example for subscribing to np arrays zmq, see also
+# tools/zmq_subscriber.py which the GUI uses
 # context_data = zmq.Context()
 # socket_data = context_data.socket(zmq.SUB)
 # socket_data.connect(''.join(['tcp://localhost:', '8123']))
 # socket_data.subscribe("")  # All topics
 # while True:
-#     md = socket_data.recv_json(flags=0)
-#     msg = socket.recv(flags=0, copy=False, track=False)
-#     buf = memoryview(msg)
-#     data = np.frombuffer(buf, dtype=md['dtype'])
+#     md_frame, msg = socket_data.recv_multipart(copy=False)
+#     md = json.loads(md_frame.bytes)
+#     data = np.frombuffer(msg.buffer, dtype=md['dtype'])
 #     print('data ', data.reshape(md['shape']))
 
 
@@ -1,12 +1,11 @@
 import argparse
-import json
 import logging
 import os
 import sys
 from pathlib import Path
 
-import psana
 import yaml
+from control import ControlChannel
 from mpi4py import MPI
 from mpi_master import MpiMaster
 from mpi_worker import MpiWorker
@@ -14,7 +13,8 @@ from mpi_worker import MpiWorker
 fpath = os.path.dirname(os.path.abspath(__file__))
 fpathup = '/'.join(fpath.split('/')[:-1])
 sys.path.append(fpathup)
-from utils import get_evr_w_codes, get_r_masks  # NOQA
+from tools.cal_store import CalStore  # NOQA
+from utils import RadialIntegrator, get_evr_w_codes  # NOQA
 
 logger = logging.getLogger(__name__)
 
@@ -26,8 +26,16 @@ rank = comm.Get_rank()
 parser = argparse.ArgumentParser()
 parser.add_argument('--cfg_file', help='if specified, has information about '
                     'what metadata to use', type=str, default='xcs_config.yml')
+parser.add_argument('--fake_psana', action='store_true', help='generate the '
+                    'events with fake_psana instead of reading them, see the '
+                    'fake_psana section of the config')
 args = parser.parse_args()
 
+if args.fake_psana:
+    import fake_psana as psana
+else:
+    import psana
+
 # Parse config file to hand to workers
 with open(args.cfg_file) as f:
     yml_dict = yaml.load(f, Loader=yaml.FullLoader)
@@ -44,24 +52,41 @@ with open(args.cfg_file) as f:
     run = yml_dict['run']
     evr_name = yml_dict['evr_name']
     event_code = yml_dict['event_code']
+    # events per worker message and how long the first one may wait
+    batch = yml_dict.get('batch', {})
+    batch_events = batch.get('events', 16)
+    batch_time = batch.get('time_ms', 50) / 1000
+    # what the master does when publishing falls behind
+    queue = yml_dict.get('queue', {})
+    # how often the PVs get a summary of the shots, see summary.py
+    publish = yml_dict.get('publish', {})
+    # 'mpi' sends commands to the workers over MPI, 'zmq' over a socket on
+    # localhost, which only works with every rank on the master's node
+    control_mode = yml_dict.get('control', 'mpi')
     # wf_length = yml_dict['wf_length']
+    if args.fake_psana:
+        psana.configure(**{'shape': det_map['shape'],
+                           **yml_dict.get('fake_psana', {})})
 
 if jet_cam_name == 'None' or jet_cam_name == 'none':
     jet_cam_name = None
 
-# Get calibration results
-calib_dir = Path(''.join(['/cds/data/psdm/', hutch, '/', exp, '/calib/']))
+# Get calibration results, jt_cal.py --fake_psana keeps them in ./fake_psdm
+psdm_dir = 'fake_psdm/' if args.fake_psana else '/cds/data/psdm/'
+calib_dir = Path(''.join([psdm_dir, hutch, '/', exp, '/calib/']))
 jt_dir = Path(''.join([str(calib_dir), '/jt_results/']))
 
-# cal_files = sorted(os.listdir(jt_dir))
-cal_files = list(jt_dir.glob('jt_cal*'))
-cal_files.sort(key=os.path.getmtime)
-if cal_files:
-    cal_file_path = cal_files[-1]
-    # cal_file_path = ''.join([jt_dir, cal_file])
-    print('Calibration file: {}'.format(cal_file_path))
-    with open(cal_file_path) as f:
-        cal_results = json.load(f)
+cal_record = CalStore(jt_dir).latest(exp)
+if cal_record is not None:
+    print('Calibration file: {}, run {}'.format(cal_record['source'],
+                                                cal_record['run']))
+    cal_results = cal_record['results']
+elif args.fake_psana:
+    # what a calibration of the generated data would find
+    cal_results = psana.nominal_calibration(
+        delta_bin=yml_dict['cal_params']['delta_bin'],
+        integration=det_map.get('integration', 'image'))
+    print('Calibration: {}'.format(cal_results))
 else:
     logger.warning('You must run a calibration before starting jet tracking')
     sys.exit()
@@ -83,15 +108,29 @@ if jet_cam_name is not None:
 else:
     jet_cam = None
 evr = psana.Detector(evr_name)
-r_mask = get_r_masks(det_map['shape'])
+integrator = RadialIntegrator(det_map['shape'])
+# collective, every rank makes the channel before splitting up
+control = ControlChannel(comm) if control_mode == 'mpi' else None
 
 if rank == 0:
-    master = MpiMaster(rank, api_port, det_map, pv_map, sim=sim)
+    master = MpiMaster(rank, api_port, det_map, pv_map, sim=sim,
+                       batch_events=batch_events,
+                       queue_size=queue.get('size', 64),
+                       queue_policy=queue.get('policy', 'drop_oldest'),
+                       max_age=queue.get('max_age_ms', 500) / 1000,
+                       publish_rate=publish.get('rate', 1.),
+                       summary_pvs=publish.get('summary_pvs'),
+                       put_wait=publish.get('wait', False),
+                       dropped_threshold=publish.get('dropped_threshold', 0.5),
+                       control=control)
     master.start_run()
 else:
     peak_bin = int(cal_results['peak_bin'])
     delta_bin = int(cal_results['delta_bin'])
-    worker = MpiWorker(ds, detector, ipm, jet_cam, jet_cam_axis, evr, r_mask,
-                       cal_results, event_code=event_code)
+    worker = MpiWorker(ds, detector, ipm, jet_cam, jet_cam_axis, evr,
+                       integrator, cal_results, event_code=event_code,
+                       integration=det_map.get('integration', 'image'),
+                       batch_events=batch_events, batch_time=batch_time,
+                       control=control)
     print('Worker')
     worker.start_run()
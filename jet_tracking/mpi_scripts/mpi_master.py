@@ -3,19 +3,30 @@ import time
 from collections import deque
 from threading import Lock, Thread
 
-import numpy as np
 import zmq
-from epics import caput
+from epics import PV
 from mpi4py import MPI
+from packet_queue import PacketQueue
+from packets import PACKET_FIELDS, BatchReceiver
+from summary import SummaryAggregator
 
 f = '%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s - %(message)s'
 logging.basicConfig(level=logging.DEBUG, format=f)
 logger = logging.getLogger(__name__)
 
+# summary value put to each PV of the pv_map, DROPPED stays a flag like the
+# per shot value, the fraction of dropped shots can go to a summary_pvs PV
+PV_SUMMARY_KEYS = {'diff': 'diff_mean', 'i0': 'i0_mean',
+                   'ratio': 'ratio_mean', 'dropped': 'dropped'}
+
 
 class MpiMaster(object):
     def __init__(self, rank, api_port, det_map, pv_map, sim=True,
-                 data_port=8123, wf_length=None):
+                 data_port=8123, wf_length=None, batch_events=16,
+                 recv_depth=4, report_interval=10, queue_size=64,
+                 queue_policy='drop_oldest', max_age=0.5, publish_rate=1.,
+                 summary_pvs=None, put_wait=False, dropped_threshold=0.5,
+                 control=None):
         self._rank = rank
         self._det_map = det_map
         self._pv_map = pv_map
@@ -24,15 +35,36 @@ class MpiMaster(object):
         self._workers = range(self._comm.Get_size())[1:]
         self._running = False
         self._abort = False
-        self._queue = deque()
-        self._data_socket = self.get_data_socket()
-        self._pub_socket = self.get_pub_socket()
+        # batches wait here for the publisher thread, when it falls behind
+        # the queue sheds load by policy and never holds anything older
+        # than max_age seconds
+        self._queue = PacketQueue(queue_size, queue_policy, max_age)
+        self._seq = 0
+        # workers send up to batch_events events per message, recv_depth
+        # receives are kept posted so that no worker waits on the master
+        self._batch_events = batch_events
+        self._recv_depth = recv_depth
+        self._report_interval = report_interval
+        # every shot goes out over ZMQ, the PVs only get a summary
+        # publish_rate times a second
+        self._aggregator = SummaryAggregator(1 / publish_rate,
+                                             dropped_threshold)
+        self._summary_pvs = summary_pvs or {}
+        self._put_wait = put_wait
+        self._pvs = None
+        self.pair_ctx = None
+        self.msg_ctx = None
+        self._data_socket = self.get_data_socket(data_port)
+        # commands for the workers go through the MPI control channel if
+        # there is one, the API thread queues them for the main loop
+        self._control = control
+        self._commands = deque()
+        if control is None:
+            self._pub_socket = self.get_pub_socket()
         self._msg_lock = Lock()
         self._msg_thread = Thread(target=self.start_msg_thread,
-                                  args=(api_port))
+                                  args=(api_port,))
         self._msg_thread.start()
-        self.pair_ctx = None
-        self.msg_ctx = None
 
     @property
     def rank(self):
@@ -76,15 +108,23 @@ class MpiMaster(object):
             with self._msg_lock:
                 self._abort = val
 
-    def get_data_socket(self, data_port=8124):
-        """Setup the socket we'll use for client data messaging"""
-        if self._sim:
-            self.msg_ctx = zmq.Context()
-            socket = self.msg_ctx.socket(zmq.PUB)
-            socket.bind(''.join(['tcp://*:', str(data_port)]))
-            return socket
+    def get_data_socket(self, data_port=8123):
+        """Setup the socket we'll use for the per shot data stream"""
+        self.msg_ctx = zmq.Context()
+        socket = self.msg_ctx.socket(zmq.PUB)
+        socket.bind(''.join(['tcp://*:', str(data_port)]))
+        return socket
 
-        return None
+    def get_pvs(self):
+        """PVs for the summaries, keyed by summary value"""
+        if self._pvs is None:
+            names = {PV_SUMMARY_KEYS[PACKET_FIELDS[k-1]]: v
+                     for k, v in self._pv_map.items()}
+            names.update(self._summary_pvs)
+            # kept for the whole run so every put reuses the connection
+            self._pvs = {key: PV(name, auto_monitor=False)
+                         for key, name in names.items()}
+        return self._pvs
 
     def get_pub_socket(self, data_port=1235):
         """Socket for publishing API calls to workers"""
@@ -94,22 +134,64 @@ class MpiMaster(object):
         return socket
 
     def start_run(self):
-        """Main process loop, we can probably get more async
-        but for now it's a one to one recive/send
+        """Main process loop, hands the batches of the workers to the
+        publisher thread in the order they arrive
         """
-        while not self.abort:
-            start = time.time()
-            data = np.empty(len(self._pv_map),
-                            dtype=np.dtype(self.det_map['dtype']))
-            req = self.comm.Irecv(data, source=MPI.ANY_SOURCE)
-            self.send_from_queue()
-            req.Wait()
-            self.queue.append(data)
-            print(time.time() - start)
+        receiver = BatchReceiver(self.comm, self._batch_events,
+                                 self._recv_depth)
+        publisher = Thread(target=self.start_publisher, daemon=True)
+        publisher.start()
+        last_report = time.time()
+        last_counts = (0, 0)
+        while True:
+            self.forward_commands()
+            if self.abort:
+                break
+            batch = receiver.receive(timeout=0.1)
+            if batch is not None:
+                self.queue.put(batch)
+            now = time.time()
+            if now - last_report >= self._report_interval:
+                elapsed = now - last_report
+                messages = receiver.messages - last_counts[0]
+                events = receiver.events - last_counts[1]
+                logger.info(f'Received {messages / elapsed:.1f} messages/s, '
+                            f'{events / elapsed:.1f} events/s')
+                logger.info('Queue depth {depth}, dropped {dropped}, '
+                            'expired {expired}, published {published}, '
+                            'age {age:.3f} s, worst age {worst_age:.3f} s'
+                            .format(**self.queue.stats()))
+                last_report = now
+                last_counts = (receiver.messages, receiver.events)
+        receiver.cancel()
+        if self._control is not None:
+            # an abort may have been queued after the last forward
+            self.forward_commands()
+            self._control.wait()
+        publisher.join()
         self.pair_ctx.close()
         self.msg_ctx.close()
         MPI.Finalize()
 
+    def send_to_workers(self, message):
+        """Pass a command on to the workers"""
+        if self._control is not None:
+            self._commands.append(message)
+        else:
+            self._pub_socket.send_pyobj(message)
+
+    def forward_commands(self):
+        """Send the queued commands through the MPI control channel"""
+        while self._commands:
+            self._control.send(self._commands.popleft())
+
+    def start_publisher(self):
+        """Publish batches as fast as the output side allows"""
+        while not self.abort:
+            self.send_from_queue(timeout=0.1)
+            if not self._sim and self._aggregator.due():
+                self.publish_summary()
+
     def start_msg_thread(self, api_port):
         """The thread runs a PAIR communication and acts as server side,
         this allows for control of the parameters during data aquisition
@@ -126,34 +208,46 @@ class MpiMaster(object):
             cmd = message['cmd']
             value = message['value']
             if cmd == 'abort':
-                self._pub_socket.send_pyobj(message)
+                self.send_to_workers(message)
                 self.abort = True
                 logger.info('aborting jet tracking data analysis process')
             elif cmd == 'peak_bin':
-                self._pub_socket.send_pyobj(message)
+                self.send_to_workers(message)
                 msg_string = 'Changing peak bin to {}'.format(value)
                 logger.info(msg_string)
             elif cmd == 'delta_bin':
-                self._pub_socket.send_pyobj(message)
+                self.send_to_workers(message)
                 msg_string = 'Changing delta bin to {}'.format(value)
                 logger.info(msg_string)
             else:
                 print('Received Message with no definition ', message)
 
-    def send_from_queue(self):
-        if len(self.queue) > 0:
-            data = self.queue.popleft()
-            if self._sim:
-                # Could need this if sending large arrays,
-                # Could end up getting md info from config file
-                md = dict(dtype=str(data.dtype), shape=data.shape)
-                self._data_socket.send_json(md, 0 | zmq.NOBLOCK)
-                self._data_socket.send(data, 0, copy=False, track=False)
-            else:
-                # consider caput_many with lots, ok for now
-                for k, v in self._pv_map.items():
-                    caput(v, data[k-1])
-                # caput('XCS:JTRK:REQ:DIFF_INTENSITY', data[1])
-                # caput('XCS:JTRK:REQ:I0', data[0])
+    def send_from_queue(self, timeout=None):
+        data = self.queue.get(timeout)
+        if data is not None:
+            # Metadata and data go out as one multipart message so a
+            # subscriber can never pair them up wrong, seq lets it spot
+            # dropped messages
+            md = dict(dtype=data.dtype.descr, shape=data.shape,
+                      seq=self._seq)
+            self._seq += 1
+            self._data_socket.send_json(md, zmq.SNDMORE | zmq.NOBLOCK)
+            self._data_socket.send(data, zmq.NOBLOCK, copy=False,
+                                   track=False)
+            if not self._sim:
+                self._aggregator.add(data)
         else:
             pass
+
+    def publish_summary(self):
+        """Put the summary of the last interval to the PVs"""
+        summary = self._aggregator.summary()
+        if summary is None:
+            return
+        for key, pv in self.get_pvs().items():
+            if key not in summary:
+                logger.warning(f'No summary value {key} for {pv.pvname}')
+            elif not pv.connected:
+                logger.warning(f'{pv.pvname} is not connected')
+            else:
+                pv.put(summary[key], wait=self._put_wait)
@@ -4,6 +4,7 @@ from threading import Lock, Thread
 import numpy as np
 import zmq
 from mpi4py import MPI
+from packets import BatchSender, PacketBatcher
 
 f = '%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s - %(message)s'
 logging.basicConfig(level=logging.DEBUG, format=f)
@@ -13,8 +14,10 @@ logger = logging.getLogger(__name__)
 class MpiWorker(object):
     """This worker will collect events and do whatever
     necessary processing, then send to master"""
-    def __init__(self, ds, detector, ipm, jet_cam, jet_cam_axis, evr, r_mask,
-                 calib_results, event_code=40, plot=False, data_port=1235):
+    def __init__(self, ds, detector, ipm, jet_cam, jet_cam_axis, evr,
+                 integrator, calib_results, event_code=40, plot=False,
+                 data_port=1235, integration='image', batch_events=16,
+                 batch_time=0.05, control=None):
         self._ds = ds  # We probably need to use kwargs to make this general
         self._detector = detector
         self._ipm = ipm
@@ -23,18 +26,34 @@ class MpiWorker(object):
         self._evr = evr
         self._comm = MPI.COMM_WORLD
         self._rank = self._comm.Get_rank()
-        self._r_mask = r_mask
+        self._integrator = integrator
+        # 'image' integrates assembled images, 'raw' the raw panels
+        self._integration = integration
+        cal_integration = calib_results.get('integration', 'image')
+        if cal_integration != integration:
+            logger.warning(f'Calibration used {cal_integration} integration '
+                           f'but the workers use {integration}, the peak '
+                           f'bin and thresholds may not match')
         self._plot = plot
+        # events go to the master in batches of up to batch_events, or
+        # whatever arrived within batch_time seconds
+        self._batcher = PacketBatcher(self._rank, batch_events, batch_time)
+        self._sender = BatchSender(self._comm, dest=0, tag=self._rank)
         self._event_code = event_code
         self._peak_bin = int(calib_results['peak_bin'])
         self._delta_bin = int(calib_results['delta_bin'])
         self._i0_thresh = [float(calib_results['i0_low']),
                            float(calib_results['i0_high'])]
         self._state = None
-        self._msg_thread = Thread(target=self.start_msg_thread,
-                                  args=(data_port))
-        self._msg_thread.start()
+        self.abort = False
         self._attr_lock = Lock()
+        # commands come through the MPI control channel if there is one,
+        # otherwise from the master's ZMQ socket, which needs the same node
+        self._control = control
+        if self._control is None:
+            self._msg_thread = Thread(target=self.start_msg_thread,
+                                      args=(data_port,))
+            self._msg_thread.start()
 
         print('I0 threshold: {}, {}'.format(self._i0_thresh[0],
                                             self._i0_thresh[1]))
@@ -117,7 +136,18 @@ class MpiWorker(object):
         psana_mask = self.detector.mask(int(run), calib=True, status=True,
                                         edges=True, central=False,
                                         unbond=False, unbondnbrs=False)
+        if self._integration == 'raw':
+            # bins of the raw panel pixels with the masked ones left out, so
+            # neither the mask nor the image assembly are needed per event
+            self._integrator = self._integrator.raw_panels(
+                self.detector.indexes_xy(int(run)), psana_mask)
         for evt_idx, evt in enumerate(self.ds.events()):
+            # commands apply from the first event after they arrive
+            if self._control is not None:
+                for message in self._control.poll():
+                    self.handle_message(message)
+            if self.abort:
+                break
             # Definitely not a fan of wrapping the world in a try/except
             # but too many possible failure modes from the data
             try:
@@ -141,10 +171,12 @@ class MpiWorker(object):
 
                     # Detector images
                     calib = self.detector.calib(evt)
-                    calib = calib*psana_mask
-                    det_image = self.detector.image(evt, calib)
-                    az_bins = (np.array([np.mean(det_image[mask])
-                               for mask in self._r_mask[low_bin:hi_bin]]))
+                    if self._integration != 'raw':
+                        calib = calib*psana_mask
+                        calib = self.detector.image(evt, calib)
+                    # subsets are cached, only rebuilt when the bins change
+                    az_bins = self._integrator.subset(
+                        low_bin, hi_bin).integrate(calib)
                     intensity = np.sum(az_bins)
                     # Normalized intensity
                     inorm = intensity/i0
@@ -161,13 +193,18 @@ class MpiWorker(object):
                 #
                 # packet = np.array([i0, intensity, inorm, max_jet_val,
                 #                    max_jet_idx], dtype='float32')
-                packet = np.array([intensity, i0, inorm, dropped],
-                                  dtype='float32')
-                self.comm.Isend(packet, dest=0, tag=self.rank)
+                batch = self._batcher.add(evt_idx, intensity, i0, inorm,
+                                          dropped)
+                if batch is not None:
+                    self._sender.send(batch)
             # else:
             except Exception as e:
                 logger.warning('Unable to Process Event: {}'.format(e))
                 continue
+        batch = self._batcher.flush()
+        if batch is not None:
+            self._sender.send(batch)
+        self._sender.wait()
 
     def start_msg_thread(self, data_port=1235):
         """The thread runs a PAIR communication and acts as server side,
@@ -183,21 +220,24 @@ class MpiWorker(object):
         socket.subscribe('')
         print('running worker message thread')
         while True:
-            message = socket.recv_pyobj()
-            cmd = message['cmd']
-            value = message['value']
-            if cmd == 'abort':
-                self.abort = True
-                logger.info('aborting jet tracking data analysis process')
-            elif cmd == 'peak_bin':
-                msg_string = f'Worker {self.rank} changing peak bin to {value}'
-                logger.info(msg_string)
-                self.peak_bin = int(value)
-            elif cmd == 'delta_bin':
-                msg_string = (f'Worker {self.rank} changing delta bin to '
-                              f'{value}')
-                logger.info(msg_string)
-                self.delta_bin = int(value)
-            else:
-                logger.warning(f'Worker {self.rank} received message with no '
-                               f'definition {message}')
+            self.handle_message(socket.recv_pyobj())
+
+    def handle_message(self, message):
+        """Apply a command from the master"""
+        cmd = message['cmd']
+        value = message['value']
+        if cmd == 'abort':
+            self.abort = True
+            logger.info('aborting jet tracking data analysis process')
+        elif cmd == 'peak_bin':
+            msg_string = f'Worker {self.rank} changing peak bin to {value}'
+            logger.info(msg_string)
+            self.peak_bin = int(value)
+        elif cmd == 'delta_bin':
+            msg_string = (f'Worker {self.rank} changing delta bin to '
+                          f'{value}')
+            logger.info(msg_string)
+            self.delta_bin = int(value)
+        else:
+            logger.warning(f'Worker {self.rank} received message with no '
+                           f'definition {message}')
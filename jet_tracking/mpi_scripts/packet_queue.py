@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+POLICIES = ('drop_oldest', 'conflate', 'aggregate')
+
+
+class PacketQueue(object):
+    """
+    Bounded queue of packet batches between the MPI receive loop and the
+    publisher.
+
+    When the publisher falls behind, the queue sheds load according to its
+    policy instead of growing:
+
+    * 'drop_oldest' keeps the newest maxlen batches
+    * 'conflate' keeps only the newest event
+    * 'aggregate' merges everything pending into one event for the shots
+      that were not dropped and one for those that were, see aggregate
+
+    Events older than max_age seconds when they are taken out are thrown
+    away, so whatever is published is never older than that.
+
+    Parameters
+    ----------
+    maxlen : int
+        Most batches held.
+    policy : str
+        One of POLICIES.
+    max_age : float, optional
+        Oldest an event may be when it is taken out, in seconds. Needs a
+        'time' field in the batches.
+    """
+
+    def __init__(self, maxlen=64, policy='drop_oldest', max_age=None):
+        if policy not in POLICIES:
+            raise ValueError(f'unknown queue policy {policy}, use one of '
+                             f'{POLICIES}')
+        self.maxlen = maxlen
+        self.policy = policy
+        self.max_age = max_age
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.received = 0
+        self.dropped = 0
+        self.expired = 0
+        self.published = 0
+        self.age = 0.
+        self.worst_age = 0.
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    @property
+    def depth(self):
+        """Number of events waiting"""
+        with self._cond:
+            return sum(len(batch) for batch in self._items)
+
+    def put(self, batch):
+        """Add a batch, shedding load if the queue is full"""
+        with self._cond:
+            self.received += len(batch)
+            if self.policy == 'conflate':
+                self.dropped += sum(len(b) for b in self._items)
+                self.dropped += len(batch) - 1
+                self._items.clear()
+                self._items.append(batch[-1:])
+            else:
+                self._items.append(batch)
+                if len(self._items) > self.maxlen:
+                    if self.policy == 'drop_oldest':
+                        self.dropped += len(self._items.popleft())
+                    else:
+                        merged = aggregate(np.concatenate(self._items))
+                        self.dropped += (sum(len(b) for b in self._items) -
+                                         len(merged))
+                        self._items.clear()
+                        self._items.append(merged)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Take the oldest batch, waiting up to timeout seconds for one.
+
+        Returns None if nothing arrived in time or everything that did was
+        too old.
+        """
+        with self._cond:
+            if not self._items and timeout:
+                self._cond.wait(timeout)
+            while self._items:
+                batch = self._items.popleft()
+                if self.max_age is not None:
+                    fresh = time.time() - batch['time'] <= self.max_age
+                    self.expired += len(batch) - int(fresh.sum())
+                    batch = batch[fresh]
+                if len(batch):
+                    self.published += len(batch)
+                    if 'time' in batch.dtype.names:
+                        self.age = time.time() - float(batch['time'].min())
+                    self.worst_age = max(self.worst_age, self.age)
+                    return batch
+            return None
+
+    def stats(self):
+        """Counters for monitoring, ages in seconds"""
+        with self._cond:
+            return dict(depth=sum(len(b) for b in self._items),
+                        received=self.received, dropped=self.dropped,
+                        expired=self.expired, published=self.published,
+                        age=self.age, worst_age=self.worst_age)
+
+
+def shot_weights(batch):
+    """Number of shots each event stands for, 1 without a 'shots' field"""
+    if 'shots' in batch.dtype.names:
+        return batch['shots'].astype(float)
+    return np.ones(len(batch))
+
+
+def aggregate(batch):
+    """
+    Events summarizing a batch.
+
+    The shots that were not dropped and the dropped shots are merged
+    separately, so there are at most two events and 'dropped' stays 0 or
+    1. diff, i0 and ratio are the means over the merged shots, shots, if
+    the batch has that field, is their number and events that were merged
+    before count with their number of shots. event is the newest event and
+    time the oldest, so the age of the summary is the age of the oldest
+    shot in it.
+    """
+    weights = shot_weights(batch)
+    dropped = batch['dropped'] != 0
+    parts = [keep for keep in (~dropped, dropped) if keep.any()]
+    out = np.zeros(len(parts), dtype=batch.dtype)
+    for i, keep in enumerate(parts):
+        use = batch[keep]
+        for name in batch.dtype.names:
+            if name == 'dropped':
+                out[name][i] = float(dropped[keep][0])
+            elif name == 'shots':
+                out[name][i] = use['shots'].sum()
+            elif name == 'event':
+                out[name][i] = use['event'].max()
+            elif name == 'time':
+                out[name][i] = use['time'].min()
+            elif name == 'rank':
+                out[name][i] = -1
+            else:
+                out[name][i] = np.average(use[name], weights=weights[keep])
+    return out
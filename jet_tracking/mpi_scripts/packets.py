@@ -0,0 +1,153 @@
+import time
+
+import numpy as np
+from mpi4py import MPI
+
+# one entry per event, the workers send several of them in one message.
+# time is when the worker processed the event, in seconds since the epoch,
+# shots the number of shots the entry stands for, 1 unless the master
+# merged entries, see packet_queue.aggregate
+PACKET_DTYPE = np.dtype([('rank', 'i4'), ('event', 'i8'), ('time', 'f8'),
+                         ('diff', 'f4'), ('i0', 'f4'), ('ratio', 'f4'),
+                         ('dropped', 'f4'), ('shots', 'u4')])
+# order of the values in the pv_map of the config
+PACKET_FIELDS = ('diff', 'i0', 'ratio', 'dropped')
+
+
+class PacketBatcher(object):
+    """
+    Collects the per event packets of a worker into batches.
+
+    A batch is ready when it holds max_events events or when its first
+    event is max_time seconds old, whichever comes first. The age is only
+    checked when an event is added.
+
+    Parameters
+    ----------
+    rank : int
+        Rank of the worker, stored with every event.
+    max_events : int
+        Most events in one batch.
+    max_time : float
+        Longest time in seconds an event waits for its batch to be sent.
+    """
+
+    def __init__(self, rank, max_events=16, max_time=0.05):
+        self.rank = rank
+        self.max_events = max_events
+        self.max_time = max_time
+        self._batch = np.empty(max_events, dtype=PACKET_DTYPE)
+        self._size = 0
+        self._started = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, event, diff, i0, ratio, dropped):
+        """Add one event, returns the batch to send if it is ready"""
+        if self._size == 0:
+            self._started = time.monotonic()
+        self._batch[self._size] = (self.rank, event, time.time(), diff, i0,
+                                   ratio, dropped, 1)
+        self._size += 1
+        if (self._size == self.max_events or
+                time.monotonic() - self._started >= self.max_time):
+            return self.flush()
+        return None
+
+    def flush(self):
+        """The events collected so far, or None if there are none"""
+        if self._size == 0:
+            return None
+        # the batch is handed over and stays untouched while it is sent
+        batch = self._batch[:self._size]
+        self._batch = np.empty(self.max_events, dtype=PACKET_DTYPE)
+        self._size = 0
+        return batch
+
+
+class BatchSender(object):
+    """
+    Sends batches to the master without waiting for each one.
+
+    Keeps every batch alive until its send has completed.
+    """
+
+    def __init__(self, comm, dest=0, tag=0):
+        self.comm = comm
+        self.dest = dest
+        self.tag = tag
+        self._pending = []
+
+    def send(self, batch):
+        req = self.comm.Isend([batch.view(np.uint8), MPI.BYTE],
+                              dest=self.dest, tag=self.tag)
+        self._pending.append((req, batch))
+        self._pending = [(r, b) for r, b in self._pending if not r.Test()]
+
+    def wait(self):
+        """Block until every batch has been sent"""
+        MPI.Request.Waitall([r for r, _ in self._pending])
+        self._pending = []
+
+
+class BatchReceiver(object):
+    """
+    Receives batches from any worker with several receives posted.
+
+    Parameters
+    ----------
+    comm : MPI.Comm
+    max_events : int
+        Largest batch a worker sends.
+    depth : int
+        Number of receives kept posted at all times.
+    """
+
+    def __init__(self, comm, max_events=16, depth=4):
+        self.comm = comm
+        self.max_events = max_events
+        self.messages = 0
+        self.events = 0
+        self._buffers = [self._new_buffer() for _ in range(depth)]
+        self._requests = [self._post(buf) for buf in self._buffers]
+        self._status = MPI.Status()
+
+    def _new_buffer(self):
+        return np.empty(self.max_events, dtype=PACKET_DTYPE)
+
+    def _post(self, buf):
+        return self.comm.Irecv([buf.view(np.uint8), MPI.BYTE],
+                               source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG)
+
+    def receive(self, timeout=None):
+        """
+        Wait for whichever receive completes first and return its batch.
+
+        Returns None if nothing arrived within timeout seconds.
+        """
+        if timeout is None:
+            idx = MPI.Request.Waitany(self._requests, self._status)
+        else:
+            deadline = time.monotonic() + timeout
+            while True:
+                idx, done = MPI.Request.Testany(self._requests, self._status)
+                if done:
+                    break
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(0.0005)
+        n = self._status.Get_count(MPI.BYTE) // PACKET_DTYPE.itemsize
+        batch = self._buffers[idx][:n]
+        # swap in a fresh buffer rather than copying the batch out
+        self._buffers[idx] = self._new_buffer()
+        self._requests[idx] = self._post(self._buffers[idx])
+        self.messages += 1
+        self.events += n
+        return batch
+
+    def cancel(self):
+        """Cancel the receives still posted"""
+        for req in self._requests:
+            req.Cancel()
+        MPI.Request.Waitall(self._requests)
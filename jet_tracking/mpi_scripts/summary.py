@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+
+# per shot values summarized, dropped shots are left out of them. Events
+# merged by the packet queue count with their number of shots
+SUMMARY_FIELDS = ('diff', 'i0', 'ratio')
+SUMMARY_STATS = ('mean', 'median', 'sigma')
+
+
+class SummaryAggregator(object):
+    """
+    Collects packet batches and summarizes them every interval seconds.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds covered by one summary.
+    dropped_threshold : float
+        Fraction of dropped shots above which the summary as a whole
+        counts as dropped.
+    """
+
+    def __init__(self, interval=1., dropped_threshold=0.5):
+        self.interval = interval
+        self.dropped_threshold = dropped_threshold
+        self._batches = []
+        self._started = time.monotonic()
+
+    def add(self, batch):
+        self._batches.append(batch)
+
+    def due(self):
+        """Whether the current interval is over"""
+        return time.monotonic() - self._started >= self.interval
+
+    def summary(self):
+        """
+        Summarize the batches of the interval and start the next one.
+
+        Returns
+        -------
+        summary : dict or None
+            'count' of shots, 'dropped_fraction' of dropped shots,
+            'dropped', 1 if that is above dropped_threshold and 0
+            otherwise, and '<field>_<stat>' for every field and stat, e.g.
+            'ratio_mean'.
+            The stats are NaN if every shot was dropped. None if no shot
+            arrived during the interval.
+        """
+        self._started = time.monotonic()
+        if not self._batches:
+            return None
+        data = np.concatenate(self._batches)
+        self._batches = []
+        if 'shots' in data.dtype.names:
+            weights = data['shots'].astype(float)
+        else:
+            weights = np.ones(len(data))
+        good = data['dropped'] == 0
+        count = weights.sum()
+        fraction = float(weights[~good].sum() / count)
+        summary = {'count': int(count), 'dropped_fraction': fraction,
+                   'dropped': int(fraction > self.dropped_threshold)}
+        for field in SUMMARY_FIELDS:
+            values = data[field][good].astype(float)
+            w = weights[good]
+            if w.sum():
+                mean = np.average(values, weights=w)
+                summary[f'{field}_mean'] = float(mean)
+                summary[f'{field}_median'] = weighted_median(values, w)
+                summary[f'{field}_sigma'] = float(np.sqrt(
+                    np.average((values - mean) ** 2, weights=w)))
+            else:
+                for stat in SUMMARY_STATS:
+                    summary[f'{field}_{stat}'] = float('nan')
+        return summary
+
+
+def weighted_median(values, weights):
+    """
+    Median of values where each one counts weights times, the same as
+    np.median for equal weights
+    """
+    order = np.argsort(values)
+    values = values[order]
+    cum = np.cumsum(weights[order])
+    half = cum[-1] / 2
+    idx = int(np.searchsorted(cum, half))
+    if cum[idx] == half and idx + 1 < len(values):
+        return float((values[idx] + values[idx + 1]) / 2)
+    return float(values[idx])
@@ -0,0 +1,75 @@
+"""
+Throughput of the worker to master transport, without psana
+
+    mpirun -n 9 python transport_benchmark.py --protocol single
+    mpirun -n 9 python transport_benchmark.py --protocol batch
+
+'single' is the old protocol, one 4 float message per event with one
+receive posted at a time on the master. 'batch' is the PacketBatcher,
+BatchSender and BatchReceiver protocol of MpiWorker and MpiMaster.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from mpi4py import MPI
+from packets import BatchReceiver, BatchSender, PacketBatcher
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--protocol', choices=['single', 'batch'],
+                    default='batch')
+parser.add_argument('--events', type=int, default=20000,
+                    help='events sent by each worker')
+parser.add_argument('--batch-events', type=int, default=16)
+parser.add_argument('--batch-time', type=float, default=0.05)
+parser.add_argument('--depth', type=int, default=4,
+                    help='receives posted on the master')
+args = parser.parse_args()
+
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+total = args.events * (comm.Get_size() - 1)
+
+comm.Barrier()
+start = time.perf_counter()
+if rank == 0:
+    messages = 0
+    events = 0
+    if args.protocol == 'single':
+        while events < total:
+            data = np.empty(4, dtype=np.float32)
+            req = comm.Irecv(data, source=MPI.ANY_SOURCE)
+            req.Wait()
+            messages += 1
+            events += 1
+    else:
+        receiver = BatchReceiver(comm, args.batch_events, args.depth)
+        while receiver.events < total:
+            receiver.receive()
+        messages, events = receiver.messages, receiver.events
+        receiver.cancel()
+    elapsed = time.perf_counter() - start
+    print(f'{args.protocol}: {comm.Get_size() - 1} workers, {events} events '
+          f'in {messages} messages, {elapsed:.2f} s, '
+          f'{messages / elapsed:.0f} messages/s, '
+          f'{events / elapsed:.0f} events/s')
+else:
+    values = np.random.default_rng(rank).random((args.events, 4))
+    if args.protocol == 'single':
+        requests = []
+        for diff, i0, ratio, dropped in values:
+            packet = np.array([diff, i0, ratio, dropped], dtype='float32')
+            requests.append(comm.Isend(packet, dest=0, tag=rank))
+        MPI.Request.Waitall(requests)
+    else:
+        batcher = PacketBatcher(rank, args.batch_events, args.batch_time)
+        sender = BatchSender(comm, dest=0, tag=rank)
+        for event, (diff, i0, ratio, dropped) in enumerate(values):
+            batch = batcher.add(event, diff, i0, ratio, dropped)
+            if batch is not None:
+                sender.send(batch)
+        batch = batcher.flush()
+        if batch is not None:
+            sender.send(batch)
+        sender.wait()
@@ -48,6 +48,9 @@ class Signals(QtCore.QObject):
     # connect in
     changeRefreshRate = QtCore.pyqtSignal(float)
     # emit in Context
+    # connect in StatusThread
+    changeDisplayRate = QtCore.pyqtSignal(float)
+    # emit in Context
     # connect in
     changeDisplayTime = QtCore.pyqtSignal(int)
     # emit in Context
@@ -65,6 +68,9 @@ class Signals(QtCore.QObject):
     # emit in statusthread
     # connect in motorthread
     intensitiesForMotor = QtCore.pyqtSignal(dict)
+    # emit in statusthread
+    # connect in motorthread
+    valuesBatch = QtCore.pyqtSignal(list)
     # emit in motorthread
     # connect in statusthread
     valuesRequest = QtCore.pyqtSignal()
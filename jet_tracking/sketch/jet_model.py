@@ -0,0 +1,139 @@
+import numpy as np
+import yaml
+
+# parameters of JetModel that a scenario event may set
+PARAMETERS = ('center', 'radius', 'drift', 'wander', 'jump_rate',
+              'jump_size', 'breathing_amplitude', 'breathing_period')
+
+
+class JetModel(object):
+    """
+    Time-evolving jet center and radius for the simulator.
+
+    The center moves with a constant drift, a random walk and sudden jumps
+    of fixed size in a random direction. The radius breathes sinusoidally
+    around its nominal value. Scripted events change any parameter at a
+    given time, or shift the jet by a fixed amount.
+
+    Parameters
+    ----------
+    center : float
+        Jet center in motor units at time 0.
+    radius : float
+        Nominal jet radius in motor units.
+    drift : float, optional
+        Constant drift of the center, in motor units per second.
+    wander : float, optional
+        Random walk of the center, in motor units per square root second.
+    jump_rate : float, optional
+        Mean number of sudden jumps per second.
+    jump_size : float, optional
+        Size of each jump in motor units.
+    breathing_amplitude : float, optional
+        Relative amplitude of the radius oscillation.
+    breathing_period : float, optional
+        Period of the radius oscillation in seconds.
+    events : list of dict, optional
+        Scripted events, each with a 'time' in seconds and the parameters to
+        set, or a 'shift' to add to the center.
+    seed : int, optional
+        Seed for the random walk and the jumps.
+    """
+
+    def __init__(self, center, radius, drift=0., wander=0., jump_rate=0.,
+                 jump_size=0., breathing_amplitude=0., breathing_period=1.,
+                 events=(), seed=None):
+        self.start = dict(center=center, radius=radius, drift=drift,
+                          wander=wander, jump_rate=jump_rate,
+                          jump_size=jump_size,
+                          breathing_amplitude=breathing_amplitude,
+                          breathing_period=breathing_period)
+        for event in events:
+            unknown = set(event) - set(PARAMETERS) - {'time', 'shift'}
+            if unknown or 'time' not in event:
+                raise ValueError(f'invalid jet model event {event}')
+        self.events = sorted(events, key=lambda e: e['time'])
+        self.seed = seed
+        self.reset()
+
+    @classmethod
+    def from_scenario(cls, scenario):
+        """
+        Make a model from a scenario file or the dictionary read from one.
+
+        A scenario holds the starting parameters under 'jet', the list of
+        scripted 'events' and an optional 'seed'.
+        """
+        if not isinstance(scenario, dict):
+            with open(scenario) as f:
+                scenario = yaml.load(f, Loader=yaml.FullLoader)
+        return cls(events=scenario.get('events', []),
+                   seed=scenario.get('seed'), **scenario['jet'])
+
+    def reset(self):
+        """Go back to time 0 and restart the random number generator"""
+        self.rng = np.random.default_rng(self.seed)
+        self.__dict__.update(self.start)
+        self.time = 0.
+        self._next_event = 0
+
+    def sample(self, times):
+        """
+        Advance the jet to each of the given times.
+
+        Parameters
+        ----------
+        times : array_like
+            Increasing times in seconds, none earlier than the current time.
+
+        Returns
+        -------
+        center, radius : np.ndarray
+            Jet center and radius at each time.
+        """
+        times = np.asarray(times, dtype=float)
+        center = np.empty(len(times))
+        radius = np.empty(len(times))
+        start = 0
+        while start < len(times):
+            # run up to the next scripted event with fixed parameters
+            stop = len(times)
+            if self._next_event < len(self.events):
+                t_event = self.events[self._next_event]['time']
+                stop = start + int(np.searchsorted(times[start:], t_event))
+                if stop == start:
+                    # the jet moves with the old parameters up to the event
+                    if t_event > self.time:
+                        self._walk(np.array([t_event]))
+                    self._apply(self.events[self._next_event])
+                    self._next_event += 1
+                    continue
+            center[start:stop] = self._walk(times[start:stop])
+            radius[start:stop] = self.radius * (
+                1 + self.breathing_amplitude *
+                np.sin(2 * np.pi * times[start:stop] / self.breathing_period))
+            start = stop
+        return center, radius
+
+    def _walk(self, times):
+        """Center at each time with the current parameters"""
+        dt = np.diff(times, prepend=self.time)
+        step = self.drift * dt
+        if self.wander:
+            step += self.wander * np.sqrt(dt) * self.rng.standard_normal(
+                len(dt))
+        if self.jump_rate:
+            jumps = self.rng.poisson(self.jump_rate * dt)
+            up = self.rng.binomial(jumps, 0.5)
+            step += self.jump_size * (2 * up - jumps)
+        center = self.center + np.cumsum(step)
+        if len(times):
+            self.center = center[-1]
+            self.time = times[-1]
+        return center
+
+    def _apply(self, event):
+        for key in PARAMETERS:
+            if key in event:
+                setattr(self, key, event[key])
+        self.center += event.get('shift', 0.)
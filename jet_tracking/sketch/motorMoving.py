@@ -17,10 +17,174 @@ following functions:
 """
 
 import logging
+import time
+
+import numpy as np
+from scipy import stats
+from scipy.optimize import curve_fit
 
 logger = logging.getLogger(__name__)
 
 
+def integration_done(shots, averaging, target=None, min_averaging=5,
+                     max_averaging=100):
+    """
+    Whether enough shots were averaged at a motor position.
+
+    Without a target a fixed number of shots is averaged. With a target,
+    shots are averaged until the standard error of their mean is below it,
+    at least min_averaging and at most max_averaging of them. Positions
+    with a steady signal are then left early and noisy ones, as at the
+    edges of the jet, get the shots they need.
+
+    Parameters
+    ----------
+    shots : list of float
+        Ratios of the shots taken at the position so far.
+    averaging : int
+        Shots to average without a target.
+    target : float or None
+        Standard error of the mean wanted.
+    min_averaging, max_averaging : int
+        Bounds on the number of shots with a target.
+
+    Returns
+    -------
+    done : bool
+    sem : float
+        Standard error of the mean of the shots, inf below two shots.
+    """
+    n = len(shots)
+    sem = np.std(shots, ddof=1) / np.sqrt(n) if n > 1 else np.inf
+    if target is None:
+        return n >= averaging, sem
+    return (n >= max_averaging or
+            (n >= min_averaging and sem <= target)), sem
+
+
+def target_sem(calibration_values, precision):
+    """
+    Standard error of the mean wanted at each motor position.
+
+    Parameters
+    ----------
+    calibration_values : dict
+        Calibration of the StatusThread, the 'stddev' of 'ratio' is the
+        shot to shot sigma of the ratio.
+    precision : float
+        Fraction of that sigma wanted.
+
+    Returns
+    -------
+    target : float or None
+        None without a calibration or precision, integration_done then
+        averages a fixed number of shots.
+    """
+    sigma = calibration_values.get('ratio', {}).get('stddev')
+    if not sigma or not precision:
+        return None
+    return precision * sigma
+
+
+def chord_profile(x, amplitude, center, radius, background):
+    """Scattering of a cylindrical jet, following the chord length"""
+    inside = np.clip(1 - ((x - center) / radius) ** 2, 0, None)
+    return background + amplitude * np.sqrt(inside)
+
+
+def gaussian_profile(x, amplitude, center, sigma, background):
+    return background + amplitude * np.exp(-0.5 * ((x - center) / sigma) ** 2)
+
+
+def parabola_profile(x, curvature, center, top):
+    return top - curvature * (x - center) ** 2
+
+
+PEAK_MODELS = {'chord': chord_profile, 'gaussian': gaussian_profile,
+               'parabola': parabola_profile}
+
+
+def fit_peak(positions, intensities,
+             models=('chord', 'gaussian', 'parabola'), z=1.96):
+    """
+    Fit a peak profile to a scan and return where its center is.
+
+    The models are tried in order and the first fit that pins the center
+    down is used. A fit is rejected if it does not converge, if the center
+    lies outside the scan, if its confidence interval is wider than the
+    spacing of the scan, or if fewer than two positions are on the peak,
+    as then the width and center are not both known.
+
+    The chord and gaussian models are fit to the whole scan, the parabola
+    only to the top half of the peak and needs four positions there.
+
+    Parameters
+    ----------
+    positions : array_like
+        Motor positions of the scan.
+    intensities : array_like
+        Averaged intensity at each position.
+    models : sequence of str
+        Names from PEAK_MODELS.
+    z : float
+        Half width of the confidence interval in standard errors.
+
+    Returns
+    -------
+    fit : dict or None
+        'model', 'center', 'error' (half width of the confidence
+        interval), 'peak' (fitted intensity at the center) and the fitted
+        'params'. None if no model fits.
+    """
+    x = np.asarray(positions, dtype=float)
+    y = np.asarray(intensities, dtype=float)
+    order = np.argsort(x)
+    x, y = x[order], y[order]
+    if len(x) < 4:
+        return None
+    spacing = (x[-1] - x[0]) / (len(x) - 1)
+    span = x[-1] - x[0]
+    top = int(np.argmax(y))
+    background = float(np.min(y))
+    amplitude = float(y[top]) - background
+    if spacing <= 0 or amplitude <= 0:
+        return None
+    for name in models:
+        model = PEAK_MODELS[name]
+        use = np.ones(len(x), dtype=bool)
+        if name == 'parabola':
+            use = y >= background + amplitude / 2
+            if use.sum() < 4:
+                continue
+            p0 = [amplitude / span ** 2, x[top], y[top]]
+            bounds = ([0, x[0], -np.inf], [np.inf, x[-1], np.inf])
+        else:
+            p0 = [amplitude, x[top], spacing, background]
+            bounds = ([0, x[0] - spacing, spacing / 4, -np.inf],
+                      [np.inf, x[-1] + spacing, span, np.inf])
+        try:
+            params, cov = curve_fit(model, x[use], y[use], p0=p0,
+                                    bounds=bounds)
+        except (RuntimeError, ValueError) as e:
+            logger.debug("%s fit failed: %s", name, e)
+            continue
+        center = params[1]
+        error = z * np.sqrt(cov[1, 1])
+        if not np.isfinite(error) or error > spacing:
+            continue
+        if not x[0] <= center <= x[-1]:
+            continue
+        if name != 'parabola':
+            signal = model(x, *params) - params[3]
+            if np.sum(signal > 0.1 * params[0]) < 2:
+                continue
+        return {'model': name, 'center': float(center),
+                'error': float(error),
+                'peak': float(model(center, *params)),
+                'params': params.tolist()}
+    return None
+
+
 class MotorAction(object):
     def __init__(self, motor_thread, context, signals):
         self.context = context
@@ -30,6 +194,11 @@ class MotorAction(object):
         self.basic_scan = BasicScan(self.motor_thread, signals)
         self.linear_ternary = LinearTernary(self.motor_thread, signals)
         self.dyn_linear = DynamicLinear(self.motor_thread, signals)
+        self.golden_section = GoldenSectionSearch(self.motor_thread, signals)
+        self.fit_scan = FitScan(self.motor_thread, signals)
+        self.noise_aware_ternary = NoiseAwareTernarySearch(self.motor_thread,
+                                                           signals)
+        self.fly_scan = FlyScan(self.motor_thread, signals)
         self.motor = self.motor_thread.motor
         self.stop_search = False
         self.last_direction = "none"  # positive or negative or none
@@ -48,6 +217,22 @@ class MotorAction(object):
     def stop_the_search(self):
         self.stop_search = True
 
+    def add_samples(self, samples):
+        """
+        Every sample of one StatusThread read, for the algorithms that use
+        each shot rather than averages at positions.
+
+        Returns
+        -------
+        result : tuple or None
+            What execute returns after the samples were used, None if the
+            algorithm does not use them.
+        """
+        if self.motor_thread.algorithm == "Fly Scan":
+            self.fly_scan.add_samples(samples)
+            return self.execute()
+        return None
+
     def execute(self):
         if self.motor_thread.algorithm == "Ternary Search":
             if self.stop_search:
@@ -87,6 +272,44 @@ class MotorAction(object):
                 return(True, self.dyn_linear.max_value)
             else:
                 return(False, self.dyn_linear.max_value)
+        elif self.motor_thread.algorithm == "Golden Section Search":
+            if self.stop_search:
+                self.stop_search = False
+                return True, self.golden_section.max_value
+            self.golden_section.search()
+            if self.golden_section.done:
+                return True, self.golden_section.max_value
+            else:
+                return False, self.golden_section.max_value
+        elif self.motor_thread.algorithm == "Noise Aware Ternary":
+            if self.stop_search:
+                self.stop_search = False
+                return True, self.noise_aware_ternary.max_value
+            self.noise_aware_ternary.search()
+            if self.noise_aware_ternary.done:
+                return True, self.noise_aware_ternary.max_value
+            else:
+                return False, self.noise_aware_ternary.max_value
+        elif self.motor_thread.algorithm == "Fly Scan":
+            if self.stop_search:
+                self.fly_scan.stop()
+                self.stop_search = False
+                return True, self.fly_scan.max_value
+            self.fly_scan.scan()
+            if self.fly_scan.done:
+                return True, self.fly_scan.max_value
+            else:
+                return False, self.fly_scan.max_value
+        elif self.motor_thread.algorithm == "Model Fit Scan":
+            if self.stop_search:
+                self.fit_scan.move_to_max()
+                self.stop_search = False
+                return True, self.fit_scan.max_value
+            self.fit_scan.scan()
+            if self.fit_scan.done:
+                return True, self.fit_scan.max_value
+            else:
+                return False, self.fit_scan.max_value
 
 
 class LinearTernary(object):
@@ -435,3 +658,639 @@ class TernarySearch(object):
             self.low = self.mid1
             self.high = self.high
             self.max_value = i2
+
+
+class NoiseAwareTernarySearch(object):
+    """
+    Ternary search that only trusts a comparison of the two probes once
+    their shots tell them apart.
+
+    The ternary search compares the means of the two probes, and when the
+    difference is in the noise it keeps the wrong third about half of the
+    time. Here the shots of each probe are kept and compared with Welch's
+    t-test. If they are not different at the alpha level, another average
+    is taken at the probe with fewer shots, up to max_rounds more. Probes
+    still not told apart have about the same intensity, either on both
+    sides of the peak or both off the jet. The range then shrinks to the
+    thirds holding the best position seen in the search, from both sides
+    if it lies between the probes.
+
+    search is called with the intensity at the current motor position in
+    motor_thread.moves[-1], the shots of the average as its third item,
+    and moves the motor to the next probe.
+    """
+
+    alpha = 0.05
+    max_rounds = 1
+
+    def __init__(self, motor_thread, signals):
+        self.motor_thread = motor_thread
+        self.signals = signals
+        self.beginning = True
+        self.done = False
+        self.max_value = 0
+        self.low = 0
+        self.high = 0
+        self.mids = {1: 0, 2: 0}
+        self.samples = {1: [], 2: []}
+        self.rounds = 0
+        # which of the mids the motor was last sent to
+        self.probe = None
+        # [intensity, position] of every average in the search
+        self.seen = []
+
+    def end_scan(self):
+        self.done = True
+        self.beginning = True
+
+    def check_motor_options(self):
+        if self.beginning:
+            ll = float(self.motor_thread.low_limit)
+            hl = float(self.motor_thread.high_limit)
+            self.low = min(ll, hl)
+            self.high = max(ll, hl)
+            self.seen = [list(self.motor_thread.moves[-1][:2])]
+            self.max_value = 0
+            self.done = False
+            self.beginning = False
+            self.start_iteration()
+
+    def start_iteration(self):
+        third = (self.high - self.low) / 3.0
+        self.mids = {1: self.low + third, 2: self.high - third}
+        self.samples = {1: [], 2: []}
+        self.rounds = 0
+        self.probe = None
+        # the nearer probe first
+        position = self.motor_thread.motor.position
+        if abs(self.mids[2] - position) < abs(self.mids[1] - position):
+            self.move_to(2)
+        else:
+            self.move_to(1)
+
+    def move_to(self, probe):
+        if probe != self.probe:
+            self.probe = probe
+            self.motor_thread.motor.move(self.mids[probe], wait=True)
+            self.signals.changeMotorPosition.emit(self.mids[probe])
+
+    def separated(self):
+        """Whether the shots of the probes have different means"""
+        shots1, shots2 = self.samples[1], self.samples[2]
+        if min(len(shots1), len(shots2)) < 2:
+            # no shots kept, as good as the means
+            return np.mean(shots1) != np.mean(shots2)
+        _, p_value = stats.ttest_ind(shots1, shots2, equal_var=False)
+        return bool(p_value < self.alpha)
+
+    def search(self):
+        if self.beginning:
+            self.check_motor_options()
+            return
+        move = self.motor_thread.moves[-1]
+        self.seen.append(list(move[:2]))
+        self.samples[self.probe].extend(move[2] if len(move) > 2
+                                        else [move[0]])
+        if not self.samples[1]:
+            self.move_to(1)
+            return
+        if not self.samples[2]:
+            self.move_to(2)
+            return
+        mean1 = np.mean(self.samples[1])
+        mean2 = np.mean(self.samples[2])
+        if self.separated():
+            if mean1 > mean2:
+                self.high = self.mids[2]
+            else:
+                self.low = self.mids[1]
+        elif self.rounds < self.max_rounds:
+            self.rounds += 1
+            fewer = 1 if len(self.samples[1]) < len(self.samples[2]) else 2
+            if len(self.samples[1]) == len(self.samples[2]):
+                # no move needed to average again where the motor is
+                fewer = self.probe
+            self.move_to(fewer)
+            return
+        else:
+            _, best = max(self.seen)
+            if best <= self.mids[1]:
+                self.high = self.mids[2]
+            elif best >= self.mids[2]:
+                self.low = self.mids[1]
+            else:
+                self.low, self.high = self.mids[1], self.mids[2]
+        self.max_value = max(mean1, mean2)
+        logger.info("noise aware ternary range: %s %s", self.low, self.high)
+        if abs(self.high - self.low) < self.motor_thread.tolerance:
+            position = (self.high + self.low) * 0.5
+            self.probe = None
+            self.motor_thread.motor.move(position, wait=True)
+            self.signals.changeMotorPosition.emit(position)
+            self.end_scan()
+        else:
+            self.start_iteration()
+
+
+class GoldenSectionSearch(object):
+    """
+    Search for the maximum intensity between the motor limits, keeping one
+    probe of each iteration for the next.
+
+    Like the ternary search the range is narrowed around two interior
+    points, but these sit at the golden ratio, so after narrowing one of
+    them is already one of the next two points. Every iteration needs one
+    motor move and one averaged intensity instead of two, and narrows the
+    range to 0.618 of its size instead of 0.667.
+
+    search is called with the intensity at the current motor position in
+    motor_thread.moves[-1] and moves the motor to the next probe.
+    """
+
+    ratio = (5 ** 0.5 - 1) / 2
+
+    def __init__(self, motor_thread, signals):
+        self.motor_thread = motor_thread
+        self.signals = signals
+        self.beginning = True
+        self.done = False
+        self.max_value = 0
+        self.low = 0
+        self.high = 0
+        self.mid1 = 0
+        self.mid2 = 0
+        self.value1 = None
+        self.value2 = None
+        # which of the mids the motor was last sent to
+        self.probe = None
+
+    def end_scan(self):
+        self.done = True
+        self.beginning = True
+
+    def check_motor_options(self):
+        if self.beginning:
+            ll = float(self.motor_thread.low_limit)
+            hl = float(self.motor_thread.high_limit)
+            self.low = min(ll, hl)
+            self.high = max(ll, hl)
+            self.mid1 = self.high - self.ratio * (self.high - self.low)
+            self.mid2 = self.low + self.ratio * (self.high - self.low)
+            self.value1 = None
+            self.value2 = None
+            self.probe = None
+            self.max_value = 0
+            self.done = False
+            self.beginning = False
+
+    def move_to(self, probe):
+        self.probe = probe
+        position = self.mid1 if probe == 1 else self.mid2
+        self.motor_thread.motor.move(position, wait=True)
+        self.signals.changeMotorPosition.emit(position)
+
+    def search(self):
+        self.check_motor_options()
+        if self.probe == 1:
+            self.value1 = self.motor_thread.moves[-1][0]
+        elif self.probe == 2:
+            self.value2 = self.motor_thread.moves[-1][0]
+        if self.value1 is None:
+            self.move_to(1)
+            return
+        if self.value2 is None:
+            self.move_to(2)
+            return
+        if self.value1 > self.value2:
+            # the maximum is below mid2, mid1 becomes the upper probe
+            self.high = self.mid2
+            self.mid2, self.value2 = self.mid1, self.value1
+            self.mid1 = self.high - self.ratio * (self.high - self.low)
+            self.value1 = None
+            next_probe = 1
+        else:
+            self.low = self.mid1
+            self.mid1, self.value1 = self.mid2, self.value2
+            self.mid2 = self.low + self.ratio * (self.high - self.low)
+            self.value2 = None
+            next_probe = 2
+        self.max_value = max(v for v in (self.value1, self.value2)
+                             if v is not None)
+        logger.info("golden section range: %s %s", self.low, self.high)
+        if abs(self.high - self.low) < self.motor_thread.tolerance:
+            position = (self.high + self.low) * 0.5
+            self.motor_thread.motor.move(position, wait=True)
+            self.signals.changeMotorPosition.emit(position)
+            self.end_scan()
+        else:
+            self.move_to(next_probe)
+
+
+class FitScan(object):
+    """
+    Coarse scan between the motor limits, then a move straight to the
+    center of a peak profile fit to it.
+
+    The argmax of a scan is only as good as its step size and the noise of
+    one average, so finding the jet to a fraction of its width that way
+    takes a fine scan. Fitting the profile of the jet uses every position
+    of the scan, and a scan with a few positions on the jet finds its
+    center more accurately than a fine scan finds its maximum. See
+    fit_peak for the models and when a fit is not trusted. Without a
+    trusted fit the motor goes to the maximum of the scan, like the basic
+    scan.
+
+    scan is called with the intensity at the current motor position in
+    motor_thread.moves[-1] and moves the motor to the next position.
+    """
+
+    def __init__(self, motor_thread, signals):
+        self.motor_thread = motor_thread
+        self.signals = signals
+        self.beginning = True
+        self.done = False
+        self.max_value = 0
+        self.positions = []
+        self.scan_moves = []
+        self.fit = None
+
+    def end_scan(self):
+        self.done = True
+        self.beginning = True
+
+    def check_motor_options(self):
+        if self.beginning:
+            ll = float(self.motor_thread.low_limit)
+            hl = float(self.motor_thread.high_limit)
+            step = abs(float(self.motor_thread.step_size))
+            steps = max(int(round(abs(hl - ll) / step)), 1)
+            self.positions = list(np.linspace(min(ll, hl), max(ll, hl),
+                                              steps + 1))
+            self.scan_moves = []
+            self.fit = None
+            self.max_value = 0
+            self.done = False
+
+    def move_to(self, position):
+        self.motor_thread.motor.move(position, wait=True)
+        self.signals.changeMotorPosition.emit(position)
+
+    def find_max_location(self):
+        if self.scan_moves:
+            intensity, location = max(self.scan_moves)
+            self.max_value = intensity
+            return location
+        else:
+            return self.motor_thread.motor.position
+
+    def move_to_max(self):
+        self.move_to(self.find_max_location())
+
+    def scan(self):
+        self.check_motor_options()
+        if self.beginning:
+            self.beginning = False
+        else:
+            self.scan_moves.append(list(self.motor_thread.moves[-1][:2]))
+        if len(self.scan_moves) < len(self.positions):
+            self.move_to(self.positions[len(self.scan_moves)])
+            return
+        intensities, positions = zip(*self.scan_moves)
+        self.fit = fit_peak(positions, intensities)
+        if self.fit is None:
+            location = self.find_max_location()
+            message = (f"No fit of the scan, moving to its maximum at "
+                       f"{location:.4f}")
+        else:
+            location = self.fit['center']
+            self.max_value = self.fit['peak']
+            message = (f"{self.fit['model']} fit center: {location:.4f} "
+                       f"+/- {self.fit['error']:.4f}")
+        logger.info(message)
+        self.signals.message.emit(message)
+        self.move_to(location)
+        self.end_scan()
+
+
+class FlyScanProfile(object):
+    """
+    Mean intensity in bins of motor position, filled as shots come in.
+
+    Parameters
+    ----------
+    low, high : float
+        Range of the bins, shots outside of it are left out. Shots at high
+        go into the last bin.
+    bin_width : float
+    """
+
+    def __init__(self, low, high, bin_width):
+        self.low = low
+        self.high = high
+        self.bin_width = bin_width
+        self.bins = max(int(np.ceil((high - low) / bin_width)), 1)
+        self.sums = np.zeros(self.bins)
+        self.counts = np.zeros(self.bins, dtype=int)
+
+    def add(self, positions, intensities):
+        positions = np.asarray(positions)
+        index = np.floor((positions - self.low) /
+                         self.bin_width).astype(int)
+        # the end of a sweep
+        index[positions == self.high] = self.bins - 1
+        use = (index >= 0) & (index < self.bins)
+        self.sums += np.bincount(index[use],
+                                 np.asarray(intensities)[use],
+                                 minlength=self.bins)
+        self.counts += np.bincount(index[use], minlength=self.bins)
+
+    def profile(self):
+        """
+        Centers, mean intensities and shot counts of the bins with shots
+        """
+        filled = self.counts > 0
+        centers = self.low + (np.arange(self.bins) + 0.5) * self.bin_width
+        return (centers[filled], self.sums[filled] / self.counts[filled],
+                self.counts[filled])
+
+
+class FlyScan(object):
+    """
+    Continuous sweeps of the motor through the jet, with every shot binned
+    by the motor position at its time.
+
+    Instead of moving, settling and averaging at one position after the
+    other, the motor flies from the nearer limit to the other one and back
+    at motor_thread.fly_velocity. add_samples is given every sample the
+    StatusThread reads, and the position at the time of each shot is
+    interpolated between the readbacks of the motor. Each sweep fills a
+    FlyScanProfile with bins of motor_thread.fly_bin and gets a peak fit,
+    see fit_peak.
+
+    The shot times and the readback times come from different clocks and
+    the shots reach the GUI late, so a sweep sees the jet shifted by the
+    latency times the velocity, in the direction of the sweep. The two
+    sweeps are shifted the opposite way, the motor goes to the mean of
+    their fitted centers and half their difference gives the latency.
+    Without both fits the sweeps are fit together, and without that fit
+    the motor goes to the brightest bin.
+
+    A sweep ends when the motor gets to its end, when the status of the
+    move is done or, for motors without one, when the motor stops moving,
+    so a motor stopping short of the end, in its deadband, at a limit
+    switch or stopped by the user, still ends it. A sweep taking more than
+    timeout_factor times its travel time plus timeout_margin seconds is
+    stopped. The velocity of the motor is put back after the sweeps, also
+    when the scan is stopped or fails.
+
+    Motors give their readback either with a readback method, as the
+    simulated ones do, or as the user_readback signal of ophyd motors.
+    """
+
+    timeout_factor = 2
+    timeout_margin = 5.
+
+    def __init__(self, motor_thread, signals):
+        self.motor_thread = motor_thread
+        self.signals = signals
+        self.beginning = True
+        self.done = False
+        self.max_value = 0
+        self.start = 0
+        self.end = 0
+        self.sweeping = False
+        self.move_status = None
+        self.sweep_start = 0
+        self.timeout = 0
+        self.original_velocity = None
+        self.profiles = []
+        self.fit = None
+        self.latency = None
+        self.readbacks = [[], []]
+        self.shots = [[], []]
+
+    def end_scan(self):
+        self.done = True
+        self.beginning = True
+
+    def get_velocity(self):
+        velocity = self.motor_thread.motor.velocity
+        return velocity.get() if hasattr(velocity, 'get') else velocity
+
+    def set_velocity(self, velocity):
+        motor = self.motor_thread.motor
+        if hasattr(motor.velocity, 'put'):
+            motor.velocity.put(velocity)
+        else:
+            motor.velocity = velocity
+
+    def clock(self):
+        """Time of the motor, virtual for the simulated motors"""
+        motor = self.motor_thread.motor
+        if hasattr(motor, 'readback'):
+            return motor.readback()[0]
+        return time.time()
+
+    def readback(self, now=False):
+        """
+        Add the latest time and position of the motor. With now the
+        position is taken to be the position at this time, for a motor
+        standing still since its last readback.
+        """
+        motor = self.motor_thread.motor
+        if hasattr(motor, 'readback'):
+            when, position = motor.readback()
+        else:
+            when = motor.user_readback.timestamp
+            position = motor.user_readback.get()
+            if now:
+                when = time.time()
+        times, positions = self.readbacks
+        if not times or when > times[-1]:
+            times.append(when)
+            positions.append(position)
+
+    def add_samples(self, samples):
+        """
+        Keep the shots of a batch of StatusThread samples until the motor
+        position at their time is known. Dropped shots are left out, and
+        samples without a time, as read by polling, get the time now.
+        """
+        if not self.sweeping:
+            return
+        now = time.time()
+        for sample in samples:
+            if not sample.get('dropped'):
+                self.shots[0].append(sample.get('time', now))
+                self.shots[1].append(sample['ratio'])
+        self.readback()
+
+    def bin_shots(self, everything=False):
+        """
+        Bin the shots taken before the last readback, or all of them at
+        the end of the sweep, when the motor stands at the end
+        """
+        times, positions = self.readbacks
+        when = np.asarray(self.shots[0])
+        ready = when <= times[-1]
+        if everything:
+            ready[:] = True
+        # shots before the sweep started are not on its way
+        use = ready & (when >= times[0])
+        self.profiles[-1].add(np.interp(when[use], times, positions),
+                              np.asarray(self.shots[1])[use])
+        self.shots = [list(when[~ready]),
+                      list(np.asarray(self.shots[1])[~ready])]
+
+    def start_sweeps(self):
+        ll = float(self.motor_thread.low_limit)
+        hl = float(self.motor_thread.high_limit)
+        low, high = min(ll, hl), max(ll, hl)
+        self.profiles = []
+        self.fit = None
+        self.latency = None
+        self.max_value = 0
+        self.done = False
+        # from the nearer limit
+        position = self.motor_thread.motor.position
+        if abs(position - high) < abs(position - low):
+            self.start, self.end = high, low
+        else:
+            self.start, self.end = low, high
+        self.motor_thread.motor.move(self.start, wait=True)
+        self.signals.changeMotorPosition.emit(self.start)
+        self.original_velocity = self.get_velocity()
+        self.set_velocity(self.motor_thread.fly_velocity)
+        self.sweep(self.end)
+
+    def sweep(self, end):
+        """Fly to end, binning the shots into a new profile"""
+        low = min(self.start, self.end)
+        high = max(self.start, self.end)
+        self.profiles.append(FlyScanProfile(low, high,
+                                            self.motor_thread.fly_bin))
+        self.readbacks = [[], []]
+        self.shots = [[], []]
+        self.readback(now=True)
+        self.sweeping = True
+        self.sweep_start = self.clock()
+        travel = (abs(end - self.readbacks[1][-1]) /
+                  self.motor_thread.fly_velocity)
+        self.timeout = self.timeout_factor * travel + self.timeout_margin
+        # ophyd motors return the status of the move
+        self.move_status = self.motor_thread.motor.move(end, wait=False)
+        logger.info("fly scan to %s at %s", end,
+                    self.motor_thread.fly_velocity)
+
+    def sweep_ended(self, end):
+        """
+        True once the motor is at end or has stopped anywhere else, the
+        motor is stopped if the sweep timed out
+        """
+        position = self.readbacks[1][-1]
+        if abs(position - end) < self.motor_thread.tolerance:
+            return True
+        if self.move_status is not None:
+            stopped = self.move_status.done
+        else:
+            stopped = not getattr(self.motor_thread.motor, 'moving', True)
+        if not stopped and self.clock() - self.sweep_start > self.timeout:
+            message = (f"Fly scan sweep to {end} timed out after "
+                       f"{self.timeout:.1f} s, stopping the motor")
+            self.motor_thread.motor.stop()
+            stopped = True
+        elif stopped:
+            message = (f"Fly scan sweep to {end} stopped at "
+                       f"{position:.4f}")
+        if stopped:
+            logger.warning(message)
+            self.signals.message.emit(message)
+        return stopped
+
+    def finish_sweeps(self):
+        self.sweeping = False
+        self.set_velocity(self.original_velocity)
+
+    def stop(self):
+        if self.sweeping:
+            self.motor_thread.motor.stop()
+            self.finish_sweeps()
+        self.end_scan()
+
+    def combined_profile(self):
+        """Both sweeps binned together"""
+        first = self.profiles[0]
+        combined = FlyScanProfile(first.low, first.high, first.bin_width)
+        for profile in self.profiles:
+            combined.sums += profile.sums
+            combined.counts += profile.counts
+        return combined
+
+    def locate(self):
+        """Location of the jet from the sweeps and a message about it"""
+        fits = [fit_peak(*profile.profile()[:2])
+                for profile in self.profiles]
+        positions, intensities, counts = self.combined_profile().profile()
+        # the scan is shown like the scans stepping from position to
+        # position
+        self.motor_thread.moves.extend(
+            [intensity, position, [], None]
+            for position, intensity in zip(positions, intensities))
+        if all(fit is not None for fit in fits):
+            forward, back = fits
+            location = (forward['center'] + back['center']) / 2
+            direction = np.sign(self.end - self.start)
+            self.latency = ((forward['center'] - back['center']) *
+                            direction / (2 * self.motor_thread.fly_velocity))
+            error = np.hypot(forward['error'], back['error']) / 2
+            self.fit = dict(forward, center=location, error=error,
+                            peak=(forward['peak'] + back['peak']) / 2)
+            self.max_value = self.fit['peak']
+            return location, (
+                f"{forward['model']} fits of the fly scan center: "
+                f"{location:.4f} +/- {error:.4f}, shot latency "
+                f"{self.latency:.3f} s, {counts.sum()} shots")
+        self.fit = fit_peak(positions, intensities)
+        if self.fit is not None:
+            self.max_value = self.fit['peak']
+            return self.fit['center'], (
+                f"{self.fit['model']} fit of both fly scan sweeps: "
+                f"{self.fit['center']:.4f} +/- {self.fit['error']:.4f}, "
+                f"{counts.sum()} shots")
+        if not len(counts):
+            return self.motor_thread.motor.position, "No shots in the fly scan"
+        brightest = int(np.argmax(intensities))
+        self.max_value = intensities[brightest]
+        return positions[brightest], (
+            f"No fit of the fly scan, moving to its brightest bin at "
+            f"{positions[brightest]:.4f}")
+
+    def scan(self):
+        try:
+            self.step()
+        except Exception:
+            # the motor is not left flying at the fly scan velocity
+            self.stop()
+            raise
+
+    def step(self):
+        if self.beginning:
+            self.beginning = False
+            self.start_sweeps()
+            return
+        self.readback()
+        end = self.end if len(self.profiles) == 1 else self.start
+        arrived = self.sweep_ended(end)
+        self.bin_shots(everything=arrived)
+        if not arrived:
+            return
+        if len(self.profiles) == 1:
+            self.sweep(self.start)
+            return
+        self.finish_sweeps()
+        location, message = self.locate()
+        logger.info(message)
+        self.signals.message.emit(message)
+        self.motor_thread.motor.move(location, wait=True)
+        self.signals.changeMotorPosition.emit(location)
+        self.end_scan()
@@ -0,0 +1,420 @@
+"""
+Headless benchmark of the motor moving algorithms
+
+Runs MotorAction against the simulator without Qt or time.sleep. A virtual
+clock advances by one shot period for every simulated shot and by the
+travel time for every motor move, so thousands of randomized trials take
+seconds instead of hours of beam time.
+
+The fly scan gets its shots in batches, as StatusThread hands them over
+once per display period, and the shot times are late by a latency, as the
+times stamped by the MPI workers are.
+
+Run it from the jet_tracking directory with e.g.
+
+    python -m sketch.motor_benchmark --trials 2000 --workers 8
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from .motorMoving import MotorAction, integration_done, target_sem
+from .num_gen import SimulationGenerator
+
+log = logging.getLogger(__name__)
+
+ALGORITHMS = ['Ternary Search', 'Basic Scan', 'Linear + Ternary',
+              'Dynamic Linear Scan', 'Golden Section Search',
+              'Model Fit Scan', 'Noise Aware Ternary', 'Fly Scan']
+
+
+class HeadlessSignal(object):
+    """Stand-in for a pyqtSignal that calls its slots right away"""
+
+    def __init__(self):
+        self.slots = []
+
+    def connect(self, slot):
+        self.slots.append(slot)
+
+    def emit(self, *args):
+        for slot in self.slots:
+            slot(*args)
+
+
+class HeadlessSignals(object):
+    """Stand-in for Signals, making any signal on first use"""
+
+    def __getattr__(self, name):
+        signal = HeadlessSignal()
+        setattr(self, name, signal)
+        return signal
+
+
+class VirtualMotor(object):
+    """
+    Motor that moves the simulated jet position and charges the travel time
+    to the simulator's virtual clock.
+
+    A move with wait takes the travel and settle time at once. A move
+    without wait leaves the motor flying towards the target while the
+    clock runs on with the shots, as in a fly scan.
+
+    Parameters
+    ----------
+    simgen : SimulationGenerator
+    position : float
+        Starting position.
+    velocity : float
+        Speed in motor units per second.
+    settle : float
+        Extra time in seconds spent at the end of every move.
+    readback_rate : float
+        Updates per second of the readback.
+    """
+
+    def __init__(self, simgen, position, velocity, settle, readback_rate=10):
+        self.simgen = simgen
+        self._velocity = velocity
+        self.settle = settle
+        self.readback_rate = readback_rate
+        self.moves = 0
+        self._start_time = 0
+        self.position = position
+        self.simgen.motor_position = position
+
+    @property
+    def velocity(self):
+        return self._velocity
+
+    @velocity.setter
+    def velocity(self, velocity):
+        # the rest of the way at the new speed
+        self._start = self.position
+        self._start_time = self.simgen.time
+        self._velocity = velocity
+
+    def position_at(self, when):
+        travelled = max(when - self._start_time, 0) * self.velocity
+        distance = self._target - self._start
+        if travelled >= abs(distance):
+            return self._target
+        return self._start + travelled * np.sign(distance)
+
+    @property
+    def position(self):
+        return self.position_at(self.simgen.time)
+
+    @position.setter
+    def position(self, position):
+        self._start = self._target = position
+
+    @property
+    def moving(self):
+        """Whether the motor moves, as far as the readback shows"""
+        return self.readback()[1] != self._target
+
+    def readback(self):
+        """Time and position of the last readback update"""
+        when = np.floor(self.simgen.time * self.readback_rate)
+        when /= self.readback_rate
+        return when, self.position_at(when)
+
+    def stop(self):
+        self.position = self.position
+
+    def move(self, position, wait=False):
+        position = float(position)
+        self.moves += 1
+        self._start = self.position
+        self._target = position
+        self._start_time = self.simgen.time
+        if wait:
+            self.simgen.time += (abs(position - self._start) /
+                                 self.velocity + self.settle)
+            self.simgen.motor_position = position
+
+
+class BenchmarkMotorThread(object):
+    """
+    The parts of MotorThread that the algorithms use, fed from the
+    simulator instead of StatusThread.
+
+    The algorithms averaging at positions get average_intensity, the fly
+    scan gets every shot with fly_batch.
+    """
+
+    def __init__(self, simgen, motor, options, sigma=None):
+        self.simgen = simgen
+        self.motor = motor
+        self.moves = []
+        self.algorithm = options['algorithm']
+        self.low_limit = options['low_limit']
+        self.high_limit = options['high_limit']
+        self.step_size = options['step_size']
+        self.tolerance = options['tolerance']
+        self.averaging = options['averaging']
+        self.min_averaging = options.get('min_averaging', 5)
+        self.max_averaging = options.get('max_averaging', 100)
+        self.fly_velocity = options.get('fly_velocity', 0.03)
+        self.fly_bin = options.get('fly_bin', 0.005)
+        self.latency = options.get('latency', 0.1)
+        self.batch_size = max(round(options['rate'] /
+                                    options.get('display_rate', 10)), 1)
+        self.action = None
+        self.target = target_sem({'ratio': {'stddev': sigma}},
+                                 options.get('precision'))
+
+    def average_intensity(self):
+        """
+        Mean ratio of the shots that were not dropped, as many as
+        integration_done asks for
+        """
+        ratios = []
+        done, sem = False, np.inf
+        while not done:
+            # shots that are needed anyway come in one batch
+            needed = (self.averaging if self.target is None
+                      else self.min_averaging) - len(ratios)
+            batch = self.simgen.sim_batch(max(needed, 1))
+            for ratio in batch['ratio'][~batch['dropped']].tolist():
+                ratios.append(ratio)
+                done, sem = integration_done(ratios, self.averaging,
+                                             self.target, self.min_averaging,
+                                             self.max_averaging)
+                if done:
+                    break
+        self.moves.append([float(np.mean(ratios)), self.motor.position,
+                           ratios, sem])
+
+    def fly_batch(self):
+        """
+        One display period of shots for MotorAction.add_samples, taken
+        while the motor flies and stamped latency seconds late
+
+        Returns
+        -------
+        result : tuple
+            What MotorAction.add_samples returns.
+        """
+        samples = []
+        for _ in range(self.batch_size):
+            # the motor moves from shot to shot
+            self.simgen.motor_position = self.motor.position_at(
+                self.simgen.time + 1 / self.simgen.shot_rate)
+            batch = self.simgen.sim_batch(1)
+            samples.append({'ratio': float(batch['ratio'][0]),
+                            'dropped': bool(batch['dropped'][0]),
+                            'time': float(batch['time'][0]) + self.latency})
+        return self.action.add_samples(samples)
+
+
+def calibration_sigma(simgen, shots=500):
+    """
+    Sigma of the ratio on the jet center, as the calibration would give it,
+    without charging the shots to the virtual clock. The jet must not be
+    moved by a scenario yet.
+    """
+    time, position = simgen.time, simgen.motor_position
+    simgen.motor_position = simgen.center
+    batch = simgen.sim_batch(shots)
+    simgen.time, simgen.motor_position = time, position
+    return float(np.std(batch['ratio'][~batch['dropped']]))
+
+
+def run_trial(options, seed):
+    """
+    Track the jet once from a random start.
+
+    The jet center and the starting motor position are drawn uniformly
+    between the limits. A trial fails if the algorithm raises, has not
+    finished after max_moves moves, or max_time seconds of beam time for
+    the fly scan, or ends off the jet.
+
+    Parameters
+    ----------
+    options : dict
+        Benchmark options, see the command line arguments.
+    seed : int
+        Seed for the starting positions and the shot noise.
+
+    Returns
+    -------
+    result : dict
+    """
+    rng = np.random.default_rng(seed)
+    ctx = SimpleNamespace(refresh_rate=options['rate'])
+    simgen = SimulationGenerator(ctx, seed=seed)
+    simgen.change_noise(options.get('background', simgen.bg))
+    # calibrated before the jet starts to move
+    sigma = calibration_sigma(simgen) if options.get('precision') else None
+    if options['scenario']:
+        simgen.load_scenario(options['scenario'])
+        simgen.seed(seed)
+        simgen.jet.seed = seed
+        simgen.jet.reset()
+    low, high = options['low_limit'], options['high_limit']
+    simgen.change_center(rng.uniform(low, high))
+    motor = VirtualMotor(simgen, rng.uniform(low, high),
+                         options['velocity'], options['settle'])
+    thread = BenchmarkMotorThread(simgen, motor, options, sigma)
+    signals = HeadlessSignals()
+    error = None
+    done = False
+    try:
+        # the algorithms report their progress with print
+        with contextlib.redirect_stdout(io.StringIO()):
+            action = MotorAction(thread, ctx, signals)
+            thread.action = action
+            if options['algorithm'] == 'Fly Scan':
+                while (not done and
+                       simgen.time < options.get('max_time', 600)):
+                    done, _ = thread.fly_batch()
+            else:
+                while not done and len(thread.moves) < options['max_moves']:
+                    thread.average_intensity()
+                    done, _ = action.execute()
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    distance = abs(motor.position - simgen.center)
+    return {'algorithm': options['algorithm'], 'seed': seed,
+            'moves': motor.moves, 'beam_time': simgen.time,
+            'distance': distance,
+            'failed': bool(error or not done or distance >= simgen.radius),
+            'error': error}
+
+
+def _run_trials(args):
+    options, seeds = args
+    return [run_trial(options, seed) for seed in seeds]
+
+
+def run_benchmark(options, trials, seed=0, workers=None):
+    """
+    Run trials of one algorithm across a process pool.
+
+    Returns
+    -------
+    results : list of dict
+        One result of run_trial per trial.
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(trials).tolist()
+    workers = workers or os.cpu_count() or 1
+    chunks = [(options, seeds[i::workers]) for i in range(workers)]
+    if workers == 1:
+        return _run_trials(chunks[0])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [r for chunk in pool.map(_run_trials, chunks) for r in chunk]
+
+
+def summarize(results):
+    """Moves, beam time and final distance statistics of a set of trials"""
+    failed = np.array([r['failed'] for r in results])
+    good = [r for r in results if not r['failed']]
+    summary = {'trials': len(results),
+               'failure_rate': float(failed.mean()) if results else np.nan,
+               'errors': sorted(set(r['error'] for r in results
+                                    if r['error']))}
+    for key in ['moves', 'beam_time', 'distance']:
+        values = np.array([r[key] for r in good], dtype=float)
+        summary[key] = ((float(np.median(values)),
+                         float(np.percentile(values, 90)))
+                        if len(values) else (np.nan, np.nan))
+    return summary
+
+
+def format_table(summaries):
+    lines = [f"{'algorithm':<22}{'trials':>8}{'failed':>9}"
+             f"{'moves':>14}{'beam time s':>16}{'distance':>20}",
+             f"{'':<22}{'':>8}{'':>9}{'median/p90':>14}"
+             f"{'median/p90':>16}{'median/p90':>20}"]
+    for name, s in summaries.items():
+        lines.append(f"{name:<22}{s['trials']:>8}"
+                     f"{s['failure_rate']:>9.1%}"
+                     f"{s['moves'][0]:>7.0f}/{s['moves'][1]:<6.0f}"
+                     f"{s['beam_time'][0]:>8.1f}/{s['beam_time'][1]:<7.1f}"
+                     f"{s['distance'][0]:>10.4f}/{s['distance'][1]:<9.4f}")
+    for name, s in summaries.items():
+        for error in s['errors']:
+            lines.append(f'{name} raised {error}')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the motor moving algorithms offline.')
+    parser.add_argument('--algorithm', action='append', choices=ALGORITHMS,
+                        help='algorithm to run, all of them by default')
+    parser.add_argument('--trials', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--scenario', type=str, default=None,
+                        help='jet model scenario file')
+    parser.add_argument('--rate', type=float, default=120,
+                        help='shots per second')
+    parser.add_argument('--averaging', type=int, default=20,
+                        help='shots averaged at every position')
+    parser.add_argument('--background', type=float, default=0.05,
+                        help='shot to shot noise of the simulator')
+    parser.add_argument('--precision', type=float, default=None,
+                        help='average until the standard error is this '
+                             'fraction of the calibration sigma, instead of '
+                             'a fixed number of shots')
+    parser.add_argument('--min-averaging', type=int, default=5)
+    parser.add_argument('--max-averaging', type=int, default=100)
+    parser.add_argument('--fly-velocity', type=float, default=0.03,
+                        help='motor speed of the fly scan')
+    parser.add_argument('--fly-bin', type=float, default=0.005,
+                        help='position bin width of the fly scan')
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help='seconds the shot times of the fly scan are '
+                             'late by')
+    parser.add_argument('--display-rate', type=float, default=10,
+                        help='batches of shots per second for the fly scan')
+    parser.add_argument('--low-limit', type=float, default=-0.1)
+    parser.add_argument('--high-limit', type=float, default=0.1)
+    parser.add_argument('--step-size', type=float, default=0.02)
+    parser.add_argument('--tolerance', type=float, default=0.001)
+    parser.add_argument('--velocity', type=float, default=0.1,
+                        help='motor speed in units per second')
+    parser.add_argument('--settle', type=float, default=0.5,
+                        help='seconds spent at the end of every move')
+    parser.add_argument('--max-moves', type=int, default=200)
+    args = parser.parse_args()
+
+    summaries = {}
+    for algorithm in args.algorithm or ALGORITHMS:
+        options = dict(algorithm=algorithm, scenario=args.scenario,
+                       rate=args.rate, averaging=args.averaging,
+                       background=args.background,
+                       precision=args.precision,
+                       min_averaging=args.min_averaging,
+                       max_averaging=args.max_averaging,
+                       fly_velocity=args.fly_velocity,
+                       fly_bin=args.fly_bin, latency=args.latency,
+                       display_rate=args.display_rate,
+                       low_limit=args.low_limit, high_limit=args.high_limit,
+                       step_size=args.step_size, tolerance=args.tolerance,
+                       velocity=args.velocity, settle=args.settle,
+                       max_moves=args.max_moves)
+        start = time.perf_counter()
+        results = run_benchmark(options, args.trials, args.seed,
+                                args.workers)
+        log.info('%s: %d trials in %.1f s', algorithm, args.trials,
+                 time.perf_counter() - start)
+        summaries[algorithm] = summarize(results)
+    print(format_table(summaries))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger(MotorAction.__module__).setLevel(logging.WARNING)
+    main()
@@ -1,13 +1,29 @@
-import math
-import random
+import numpy as np
+import yaml
+
+from .jet_model import JetModel
 
 
 class SimulationGenerator(object):
-    def __init__(self, context, signals):
+    """
+    Simulated i0 and diffraction intensities for a jet crossing the beam.
+
+    Parameters
+    ----------
+    context : Context
+    signals : Signals, optional
+        Control widget signals that update the simulation parameters. If
+        None the parameters are only changed through the attributes.
+    seed : int, optional
+        Seed for the random number generator, so that runs can be repeated.
+    """
+
+    def __init__(self, context, signals=None, seed=None):
 
         # initial values from the control widget
         self.context = context
         self.signals = signals
+        self.rng = np.random.default_rng(seed)
         self.percent_dropped = 10
         self.peak_intensity = 10
         self.motor_position = 0
@@ -16,6 +32,15 @@ class SimulationGenerator(object):
         self.max = 10
         self.bg = 0.05
         self.percent = 0
+        # optional time-evolving jet, see load_scenario
+        self.jet = None
+        self.scenario_rate = None
+        # virtual time of the last simulated shot in seconds
+        self.time = 0.
+        if self.signals is not None:
+            self.connect_signals()
+
+    def connect_signals(self):
         # get current simulated motor position
         self.signals.update.connect(self.updateVals)
         # self.signals.changeMotorPosition.connect(self.change_motor)
@@ -41,9 +66,13 @@ class SimulationGenerator(object):
 
     def change_radius(self, radius):
         self.radius = radius
+        if self.jet is not None:
+            self.jet.radius = radius
 
     def change_center(self, center):
         self.center = center
+        if self.jet is not None:
+            self.jet.center = center
 
     def change_max(self, maxi):
         self.max = maxi
@@ -67,44 +96,92 @@ class SimulationGenerator(object):
         elif name == "background":
             self.bg = vals
 
-    def sim(self):
+    def seed(self, seed=None):
+        """Restart the random number generator from seed"""
+        self.rng = np.random.default_rng(seed)
+
+    def load_scenario(self, scenario):
+        """
+        Move the jet as described in a scenario file.
+
+        Besides the JetModel parameters, the scenario may give the 'rate'
+        of shots per second that the virtual clock runs at and the 'seed'
+        of the shot to shot noise. Passing None goes back to a static jet.
+        """
+        self.time = 0.
+        if scenario is None:
+            self.jet = None
+            self.scenario_rate = None
+            return
+        if not isinstance(scenario, dict):
+            with open(scenario) as f:
+                scenario = yaml.load(f, Loader=yaml.FullLoader)
+        self.jet = JetModel.from_scenario(scenario)
+        self.scenario_rate = scenario.get('rate')
+        self.center = self.jet.center
+        self.radius = self.jet.radius
+        if 'seed' in scenario:
+            self.seed(scenario['seed'])
+
+    @property
+    def shot_rate(self):
+        """Shots per second of the virtual clock"""
+        if self.scenario_rate:
+            return self.scenario_rate
+        return getattr(self.context, 'refresh_rate', 120)
 
-        val = {}
-        val["i0"] = self.peak_intensity
-        val["diff"] = self.max
-        val["ratio"] = 1
-        val["dropped"] = False
-
-        a = random.random()
-        # dropped shots. for input percentage of shots, 0 is returned for the
-        # scattering intensity
-        b = random.random()
-        c = random.random()
+    def sim(self):
+        """Simulate one shot, as a dictionary of floats"""
+        batch = self.sim_batch(1)
+        return {"i0": float(batch["i0"][0]),
+                "diff": float(batch["diff"][0]),
+                "ratio": float(batch["ratio"][0]),
+                "dropped": bool(batch["dropped"][0])}
+
+    def sim_batch(self, n):
+        """
+        Simulate n consecutive shots at the current motor position.
+
+        Draws the random numbers in the same order as n calls to sim, so
+        with the same seed both give the same shots.
+
+        Parameters
+        ----------
+        n : int
+            Number of shots.
+
+        Returns
+        -------
+        batch : dict
+            Arrays of length n for 'i0', 'diff', 'ratio' and 'dropped', and the
+            virtual 'time' of each shot.
+        """
+        a, b, c = self.rng.random((n, 3)).T
         self.percent = self.percent_dropped/100
-
-        # dropped shots
-        if b < self.percent:
-            # val["diff"] = 0
-            val["dropped"] = True
-            val["diff"] = (self.bg / 10) * (1 + (a - 0.5))
-            val["i0"] = self.bg * (1 + (c - 0.5))
-
-        # on jet
-        else:
-            # calculates length of chord of a circle if on jet or sets diff
-            # to 0 (plus noise) if off jet
-            if abs(self.motor_position - self.center) < self.radius:
-                val["diff"] = (self.max * ((2 * math.sqrt(self.radius ** 2 -
-                               abs(self.motor_position - self.center) ** 2)) /
-                               (2 * self.radius)) * (1 + self.bg * (a - 0.5)))
-                val["dropped"] = False
-                val["i0"] = self.peak_intensity * 1 + self.bg * (c - 0.5)
-
-            # off jet
-            else:
-                val["diff"] = self.bg * (1 + (a - 0.5))
-                val["dropped"] = False
-                val["i0"] = self.peak_intensity * 1 + self.bg * (c - 0.5)
-
-        val["ratio"] = val["diff"] / val["i0"]
-        return val
+        # dropped shots. for input percentage of shots, only background is
+        # returned for the scattering intensity
+        dropped = b < self.percent
+
+        times = self.time + np.arange(1, n + 1) / self.shot_rate
+        self.time = times[-1] if n else self.time
+        center, radius = self.center, self.radius
+        if self.jet is not None:
+            center, radius = self.jet.sample(times)
+            if n:
+                self.center, self.radius = center[-1], radius[-1]
+
+        distance = abs(self.motor_position - center)
+        # on jet, calculates length of chord of a circle. off jet, diff is 0
+        # plus noise
+        on_jet = distance < radius
+        chord = np.sqrt(np.where(on_jet, radius ** 2 - distance ** 2, 0))
+        diff = np.where(on_jet,
+                        (self.max * ((2 * chord) / (2 * radius)) *
+                         (1 + self.bg * (a - 0.5))),
+                        self.bg * (1 + (a - 0.5)))
+        i0 = self.peak_intensity * 1 + self.bg * (c - 0.5)
+
+        diff = np.where(dropped, (self.bg / 10) * (1 + (a - 0.5)), diff)
+        i0 = np.where(dropped, self.bg * (1 + (c - 0.5)), i0)
+        return {"i0": i0, "diff": diff, "ratio": diff / i0,
+                "dropped": dropped, "time": times}
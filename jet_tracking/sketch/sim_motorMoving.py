@@ -5,12 +5,24 @@ log = logging.getLogger(__name__)
 
 
 class SimulatedMotor(object):
+    """
+    Motor of the simulator, moving at velocity in units per second.
+
+    A move without wait returns right away and the position follows the
+    motor on its way to the target, so the motor can be flown through the
+    jet. A move with wait sleeps for the travel and then for wait seconds
+    of settling.
+    """
+
     def __init__(self, context, signals):
 
         # initial values from the control widget
         self.context = context
         self.signals = signals
-        self.position = 0
+        self._velocity = 0.1
+        self._start = 0
+        self._target = 0
+        self._start_time = 0
         self.i0 = 0
         self.i0_ave = 0
         self.left = -0.1
@@ -30,9 +42,54 @@ class SimulatedMotor(object):
 #    def make_connections(self):
 #        self.box_motor_pos.checkVal.connect(self.context.update_motor_position)
 
+    @property
+    def velocity(self):
+        return self._velocity
+
+    @velocity.setter
+    def velocity(self, velocity):
+        # the rest of the way at the new speed
+        self._start = self.position
+        self._start_time = time.time()
+        self._velocity = velocity
+
+    @property
+    def position(self):
+        """Where the motor is now, on its way to the target"""
+        travelled = (time.time() - self._start_time) * self.velocity
+        distance = self._target - self._start
+        if travelled >= abs(distance):
+            return self._target
+        return self._start + travelled * (1 if distance > 0 else -1)
+
+    @position.setter
+    def position(self, position):
+        self._start = self._target = position
+
+    @property
+    def moving(self):
+        return self.position != self._target
+
+    def readback(self):
+        """
+        Time and position of the motor, like the readback PV of a real
+        motor. The simulator is told where the motor is as well, so the
+        jet is hit where the motor is while it flies.
+        """
+        now = time.time()
+        position = self.position
+        self.signals.changeMotorPosition.emit(position)
+        return now, position
+
+    def stop(self):
+        self.position = self.position
+
     def move(self, position, wait=False):
-        self.position = position
+        self._start = self.position
+        self._target = position
+        self._start_time = time.time()
         if wait:
+            time.sleep(abs(position - self._start) / self.velocity)
             time.sleep(self.wait)
         self.signals.changeMotorPosition.emit(self.position)
 
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the application modules import each other relative to the jet_tracking
+# directory (from sketch.num_gen import ..., from utils import ...), as
+# they do when run from there, and the MPI scripts relative to their own
+# directory
+JT_LOC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [JT_LOC, os.path.join(JT_LOC, 'mpi_scripts')]
@@ -0,0 +1,116 @@
+import logging
+
+import numpy as np
+import pytest
+from mpi4py import MPI
+
+from jet_tracking.jet_tracking_cal.cal_analysis import (calibrate,
+                                                        histogram2d,
+                                                        reduce_calibration,
+                                                        sweep_calibration)
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(params=[2, 0])
+def small_data(request):
+    rng = np.random.default_rng(request.param)
+    events = 5000
+    i0 = rng.normal(10, 1, events)
+    i0[:250] = rng.uniform(0, 1, 250)
+    ring = np.exp(-0.5 * ((np.arange(100) - 40) / 4) ** 2)
+    azav = rng.normal(1, 0.1, (events, 100)) * i0[:, None] * ring + 1
+    return i0, azav
+
+
+def test_histogram2d_matches_numpy():
+    logger.debug("test_histogram2d_matches_numpy")
+    rng = np.random.default_rng(0)
+    x = rng.normal(0, 1, 10000)
+    y = rng.uniform(3, 7, 10000)
+    # values on the edges, including the last one
+    x[:3] = [x.min(), x.max(), 0.]
+    for bins in [7, 100]:
+        h, x_edges, y_edges = histogram2d(x, y, bins)
+        h_np, x_np, y_np = np.histogram2d(x, y, bins)
+        assert np.array_equal(h, h_np)
+        assert np.array_equal(x_edges, x_np)
+        assert np.array_equal(y_edges, y_np)
+
+
+def test_calibrate(small_data):
+    logger.debug("test_calibrate")
+    i0, azav = small_data
+    cal = calibrate(i0, azav, 5)
+    assert cal['peak_bin'] == 40
+    # the shots without beam are cut
+    assert 1 < cal['i0_low'] < 10 < cal['i0_high']
+    use = (i0 > cal['i0_low']) & (i0 < cal['i0_high'] / 2)
+    ratios = azav[use, 35:45].sum(axis=1) / i0[use]
+    assert cal['mean_ratio'] == pytest.approx(ratios.mean())
+    assert cal['med_ratio'] == pytest.approx(np.median(ratios))
+    assert cal['peak_hist'][0].sum() == use.sum()
+    assert cal['jet_location_mean'] is None
+
+
+def test_calibrate_jet_camera(small_data):
+    logger.debug("test_calibrate_jet_camera")
+    i0, azav = small_data
+    jet_loc = np.where(i0 > 5, 30., 1e6)
+    cal = calibrate(i0, azav, 5, jet_loc=jet_loc, jet_peak=jet_loc * 2)
+    assert cal['jet_location_mean'] == 30
+    assert cal['jet_peak_mean'] == 60
+    assert cal['jet_location_std'] == 0
+
+
+def assert_same_calibration(cal, expected):
+    assert cal.keys() == expected.keys()
+    for key, value in expected.items():
+        if value is None:
+            assert cal[key] is None
+        elif key == 'peak_hist':
+            for got, want in zip(cal[key], value):
+                np.testing.assert_allclose(got, want)
+        else:
+            np.testing.assert_allclose(cal[key], value, rtol=1e-9,
+                                       err_msg=key)
+
+
+@pytest.mark.parametrize('comm', [None, MPI.COMM_WORLD])
+def test_reduce_calibration(small_data, comm):
+    logger.debug("test_reduce_calibration")
+    i0, azav = small_data
+    cal = reduce_calibration(comm, i0, azav, 5)
+    expected = calibrate(i0, azav, 5)
+    # the same average azav, so the same peak
+    assert cal['peak_bin'] == expected['peak_bin']
+    np.testing.assert_array_equal(cal['ave_azav'], expected['ave_azav'])
+    assert_same_calibration(cal, expected)
+    jet_loc = np.where(i0 > 5, 30., 1e6) + i0
+    cal = reduce_calibration(comm, i0, azav, 5, jet_loc=jet_loc,
+                             jet_peak=jet_loc * 2)
+    assert_same_calibration(cal, calibrate(i0, azav, 5, jet_loc=jet_loc,
+                                           jet_peak=jet_loc * 2))
+
+
+def test_sweep_calibration(small_data):
+    logger.debug("test_sweep_calibration")
+    i0, azav = small_data
+    # the sweep of the config comment
+    sweep = dict(delta_bins=[3, 5, 7, 9], peak_offsets=[-2, -1, 0, 1, 2],
+                 thresholds=[0.05, 0.1, 0.2])
+    rows = sweep_calibration(i0, azav, **sweep)
+    assert len(rows) == 4 * 5 * 3
+    spread = [row['rel_std_ratio'] for row in rows]
+    assert spread == sorted(spread)
+    # the row of the delta_bin of the config and the default cut
+    row = next(row for row in rows if row['delta_bin'] == 7 and
+               row['peak_offset'] == 0 and row['threshold'] == 0.1)
+    cal = calibrate(i0, azav, 7)
+    assert row['peak_bin'] == cal['peak_bin']
+    assert row['events'] == cal['peak_hist'][0].sum()
+    for key in ['i0_low', 'i0_high', 'mean_ratio', 'std_ratio', 'slope',
+                'intercept', 'sigma']:
+        assert row[key] == pytest.approx(cal[key], rel=1e-9), key
+    # the same rows reduced over the ranks
+    assert sweep_calibration(i0, azav, comm=MPI.COMM_WORLD, **sweep) == rows
@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+from jet_tracking.tools.cal_store import INDEX_NAME, CalStore, typed
+
+logger = logging.getLogger(__name__)
+
+
+def test_typed():
+    logger.debug("test_typed")
+    assert typed(np.float32(1.5)) == 1.5
+    assert typed(np.int64(3)) == 3 and isinstance(typed(np.int64(3)), int)
+    assert typed(np.arange(2)) == [0, 1]
+    assert typed('7') == 7 and isinstance(typed('7'), int)
+    assert typed('0.25') == 0.25
+    assert typed('None') is None
+    assert typed('image') == 'image'
+
+
+def test_add_and_lookup(tmp_path):
+    logger.debug("test_add_and_lookup")
+    store = CalStore(tmp_path)
+    assert store.latest('exp1') is None
+    store.add('exp1', 5, {'peak_bin': np.int64(40), 'i0_low': np.float64(2)})
+    store.add('exp1', '6', {'peak_bin': 41, 'i0_low': 3.})
+    store.add('exp2', 1, {'peak_bin': 10})
+    record = store.latest('exp1')
+    assert record['run'] == '6'
+    assert record['results'] == {'peak_bin': 41, 'i0_low': 3.}
+    assert store.get('exp1', 5)['results']['peak_bin'] == 40
+    assert store.get('exp1', 7) is None
+    assert store.latest()['experiment'] == 'exp2'
+    assert store.runs('exp1') == ['5', '6']
+    # a run calibrated again replaces the earlier results
+    store.add('exp1', 5, {'peak_bin': 39})
+    assert store.get('exp1', 5)['results']['peak_bin'] == 39
+    assert store.latest('exp1')['run'] == '5'
+
+
+def test_other_writers_are_seen(tmp_path):
+    logger.debug("test_other_writers_are_seen")
+    reader = CalStore(tmp_path)
+    writer = CalStore(tmp_path)
+    writer.add('exp', 1, {'peak_bin': 1})
+    assert reader.latest('exp')['run'] == '1'
+    offset = reader._offset
+    writer.add('exp', 2, {'peak_bin': 2})
+    assert reader.latest('exp')['run'] == '2'
+    # only the new line was read
+    assert reader._offset > offset
+    assert len(reader._runs) == 2
+    # a half written line waits for the rest
+    with open(tmp_path / INDEX_NAME, 'a') as f:
+        f.write('{"experiment": "exp"')
+    assert reader.latest('exp')['run'] == '2'
+    os.remove(tmp_path / INDEX_NAME)
+    assert reader.latest('exp') is None
+
+
+def test_legacy_files(tmp_path):
+    logger.debug("test_legacy_files")
+    for run, peak in [(1, 30), (2, 35)]:
+        path = tmp_path / f'jt_cal_{run}_results'
+        with open(path, 'w') as f:
+            json.dump({'peak_bin': str(peak), 'jet_peak_std': 'None'}, f)
+        os.utime(path, (run, run))
+    record = CalStore(tmp_path).latest('exp')
+    assert record['results'] == {'peak_bin': 35, 'jet_peak_std': None}
+    assert record['source'].endswith('jt_cal_2_results')
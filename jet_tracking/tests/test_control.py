@@ -0,0 +1,79 @@
+import logging
+import pickle
+from collections import defaultdict, deque
+
+from mpi4py import MPI
+
+from jet_tracking.mpi_scripts.control import CONTROL_TAG, ControlChannel
+from jet_tracking.mpi_scripts.mpi_master import MpiMaster
+
+logger = logging.getLogger(__name__)
+
+
+class StubComm(object):
+    """
+    Communicator of one rank of a job, the messages go through a dictionary
+    shared by all ranks instead of MPI
+    """
+
+    def __init__(self, rank, size, network):
+        self.rank = rank
+        self.size = size
+        self.network = network
+        self.dups = 0
+
+    def Dup(self):
+        self.dups += 1
+        return self
+
+    def Get_size(self):
+        return self.size
+
+    def isend(self, obj, dest, tag):
+        self.network[dest, self.rank, tag].append(pickle.dumps(obj))
+        # delivered at once, nothing to wait for
+        return MPI.Request()
+
+    def Iprobe(self, source, tag):
+        return bool(self.network[self.rank, source, tag])
+
+    def recv(self, source, tag):
+        return pickle.loads(self.network[self.rank, source, tag].popleft())
+
+
+def make_job(size):
+    network = defaultdict(deque)
+    return [ControlChannel(StubComm(rank, size, network))
+            for rank in range(size)]
+
+
+def test_commands_reach_every_worker():
+    logger.debug("test_commands_reach_every_worker")
+    master, *workers = make_job(3)
+    assert master.comm.dups == 1
+    assert master.workers == [1, 2]
+    assert workers[0].poll() == []
+    master.send({'cmd': 'peak_bin', 'value': 30})
+    master.send({'cmd': 'delta_bin', 'value': 4})
+    master.wait()
+    for worker in workers:
+        assert worker.poll() == [{'cmd': 'peak_bin', 'value': 30},
+                                 {'cmd': 'delta_bin', 'value': 4}]
+        assert worker.poll() == []
+    assert not master.comm.network[0, 0, CONTROL_TAG]
+
+
+def test_master_forwards_queued_commands():
+    logger.debug("test_master_forwards_queued_commands")
+    channel, worker = make_job(2)
+    # only the command queue of the master is needed
+    master = MpiMaster.__new__(MpiMaster)
+    master._control = channel
+    master._commands = deque()
+    # the API thread queues, the main loop forwards between receives
+    master.send_to_workers({'cmd': 'peak_bin', 'value': 12})
+    master.send_to_workers({'cmd': 'abort', 'value': None})
+    assert worker.poll() == []
+    master.forward_commands()
+    assert not master._commands
+    assert [m['cmd'] for m in worker.poll()] == ['peak_bin', 'abort']
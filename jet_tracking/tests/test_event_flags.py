@@ -0,0 +1,31 @@
+import logging
+
+from jet_tracking.tools.event_flags import EventFlagWindow
+
+logger = logging.getLogger(__name__)
+
+
+def test_counts_follow_overwrites():
+    logger.debug("test_counts_follow_overwrites")
+    flags = EventFlagWindow(4)
+    flags.set('missed shot', 0, 0.2)
+    flags.set('missed shot', 1, 0.3)
+    assert flags.count('missed shot') == 2
+    flags.set('missed shot', 0, 0.1)
+    assert flags.count('missed shot') == 2
+    flags.set('missed shot', 1, 0)
+    assert flags.count('missed shot') == 1
+    assert flags.count('dropped shot') == 0
+
+
+def test_resize_recounts():
+    logger.debug("test_resize_recounts")
+    flags = EventFlagWindow(4)
+    flags.set('dropped shot', 0, 1)
+    flags.set('dropped shot', 3, 1)
+    flags.resize(2)
+    assert flags.count('dropped shot') == 1
+    flags.resize(6)
+    assert len(flags['dropped shot']) == 6
+    flags.set('dropped shot', 5, 1)
+    assert flags.count('dropped shot') == 2
@@ -0,0 +1,87 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+
+from jet_tracking import fake_psana
+from jet_tracking.jet_tracking_cal import cal_analysis
+from jet_tracking.utils import RadialIntegrator
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """Small and fast fake data, CONFIG is restored afterwards"""
+    for key, value in dict(shape=(128, 128), panel_gap=4, events=400,
+                           rate=0).items():
+        monkeypatch.setitem(fake_psana.CONFIG, key, value)
+    return fake_psana.CONFIG
+
+
+def test_events(config):
+    logger.debug("test_events")
+    ds = fake_psana.DataSource('shmem=psana.0:stop=no')
+    assert next(ds.runs()).run() == config['run']
+    events = list(ds.events())
+    assert [evt.index for evt in events] == list(range(400))
+    # the same run every time
+    again = list(fake_psana.MPIDataSource().events())
+    assert [evt.i0 for evt in again] == [evt.i0 for evt in events]
+    evr = fake_psana.Detector('evr')
+    assert all(config['event_code'] in evr.eventCodes(evt)
+               for evt in events)
+    dropped = np.array([evt.dropped for evt in events])
+    assert 0 < dropped.sum() < 100
+    ipm = fake_psana.Detector('ipm')
+    i0 = np.array([ipm.get(evt).TotalIntensity() for evt in events])
+    assert np.array_equal(i0, [evt.i0 for evt in events])
+    # the beam intensity jitters, the ratio only follows the jet
+    good = ~dropped
+    assert np.std(i0[good]) / np.mean(i0[good]) == pytest.approx(
+        config['i0_jitter'], rel=0.3)
+    ratio = np.array([evt.diff / evt.i0 for evt in events])[good]
+    assert np.std(ratio) / np.mean(ratio) < config['i0_jitter'] / 2
+
+
+def test_rate(config):
+    logger.debug("test_rate")
+    config['events'] = 20
+    config['rate'] = 500.
+    start = time.monotonic()
+    assert len(list(fake_psana.DataSource().events())) == 20
+    assert time.monotonic() - start >= 19 / 500.
+
+
+def test_frames(config):
+    logger.debug("test_frames")
+    det = fake_psana.Detector('detector')
+    low, high = (fake_psana.Event(0, 1., diff, False, 0., [40])
+                 for diff in (1., 20.))
+    assert det.calib(low).shape == det.shape == (4, 60, 60)
+    ring = det.calib(high) - det.calib(low)
+    assert ring.max() > 10 * config['noise']
+    assert det.image(high, det.calib(high)).shape == config['shape']
+    assert det.image(high).shape == (64, 128)
+
+
+def test_nominal_calibration(config):
+    logger.debug("test_nominal_calibration")
+    det = fake_psana.Detector('detector')
+    ipm = fake_psana.Detector('ipm')
+    integrator = RadialIntegrator(config['shape']).raw_panels(
+        det.indexes_xy(None), det.mask(None))
+    i0 = []
+    azav = []
+    for evt in fake_psana.MPIDataSource().events():
+        i0.append(ipm.get(evt).TotalIntensity())
+        azav.append(integrator.integrate(det.calib(evt)))
+    cal = cal_analysis.calibrate(np.array(i0), np.nan_to_num(azav), 3)
+    nominal = fake_psana.nominal_calibration()
+    assert nominal['peak_bin'] == cal['peak_bin']
+    assert nominal['delta_bin'] == 3
+    # the nominal i0 cut keeps every shot the calibration keeps, calibrate
+    # doubles the upper end of its cut
+    assert nominal['i0_low'] < cal['i0_low'] < cal['i0_med']
+    assert cal['i0_high'] / 2 < nominal['i0_high']
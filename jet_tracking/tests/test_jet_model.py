@@ -0,0 +1,49 @@
+import logging
+import os
+
+import numpy as np
+import pytest
+
+from jet_tracking.sketch.jet_model import JetModel
+from jet_tracking.sketch.num_gen import SimulationGenerator
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = os.path.join(os.path.dirname(__file__), '..', 'jt_configs',
+                         'scenarios')
+
+
+def test_drift_and_events():
+    logger.debug("test_drift_and_events")
+    jet = JetModel(0., 0.02, drift=0.01,
+                   events=[{'time': 1.0, 'shift': 0.5},
+                           {'time': 2.0, 'drift': 0.}])
+    center, radius = jet.sample(np.arange(1, 31) / 10)
+    assert center[8] == pytest.approx(0.009)
+    assert center[9] == pytest.approx(0.51)
+    assert center[-1] == pytest.approx(0.52)
+    assert np.all(radius == 0.02)
+
+
+def test_seeded_noise_repeats():
+    logger.debug("test_seeded_noise_repeats")
+    params = dict(wander=0.01, jump_rate=2, jump_size=0.1,
+                  breathing_amplitude=0.1, seed=4)
+    times = np.arange(1, 1001) / 100
+    jet = JetModel(0., 0.02, **params)
+    center, radius = jet.sample(times)
+    jet.reset()
+    assert np.array_equal(jet.sample(times)[0], center)
+    jumps = np.abs(np.diff(center)) > 0.05
+    assert 5 < jumps.sum() < 40
+    assert radius.min() < 0.02 < radius.max()
+
+
+def test_scenario_files():
+    logger.debug("test_scenario_files")
+    for name in sorted(os.listdir(SCENARIOS)):
+        gen = SimulationGenerator(None)
+        gen.load_scenario(os.path.join(SCENARIOS, name))
+        batch = gen.sim_batch(gen.shot_rate * 60)
+        assert batch['time'][-1] == pytest.approx(60)
+        assert np.all(np.isfinite(batch['ratio']))
@@ -0,0 +1,55 @@
+import logging
+
+from jet_tracking.tools.monitor_assembler import MonitorAssembler
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('diff', 'i0', 'ratio', 'dropped')
+
+
+def test_sample_needs_every_field():
+    logger.debug("test_sample_needs_every_field")
+    assembler = MonitorAssembler(FIELDS, tolerance=0.1)
+    # the master puts diff, i0, ratio and dropped in that order
+    assert assembler.update('diff', 2., 10.001) is None
+    assert assembler.update('i0', 4., 10.002) is None
+    assert assembler.update('ratio', .5, 10.003) is None
+    sample = assembler.update('dropped', False, 10.004)
+    assert sample == {'diff': 2., 'i0': 4., 'ratio': .5, 'dropped': False,
+                      'time': 10.001}
+    assert assembler.incomplete == 0
+
+
+def test_interleaved_updates_are_matched_by_timestamp():
+    logger.debug("test_interleaved_updates_are_matched_by_timestamp")
+    assembler = MonitorAssembler(FIELDS, tolerance=0.1)
+    samples = []
+    # dropped of the first put arrives after the second put started
+    updates = [('diff', 1, 1.0), ('i0', 1, 1.0), ('ratio', 1, 1.01),
+               ('diff', 2, 2.0), ('dropped', True, 1.02), ('i0', 2, 2.0),
+               ('ratio', 2, 2.01), ('dropped', False, 2.02)]
+    for name, value, timestamp in updates:
+        sample = assembler.update(name, value, timestamp)
+        if sample is not None:
+            samples.append(sample)
+    assert [s['ratio'] for s in samples] == [1, 2]
+    assert [s['dropped'] for s in samples] == [True, False]
+    assert [s['diff'] for s in samples] == [1, 2]
+    assert assembler.incomplete == 0
+
+
+def test_incomplete_samples_are_discarded():
+    logger.debug("test_incomplete_samples_are_discarded")
+    assembler = MonitorAssembler(FIELDS, tolerance=0.1, depth=2)
+    # the ratio update of the first put was lost
+    for name in ('diff', 'i0', 'dropped'):
+        assembler.update(name, 1, 1.)
+    for name in FIELDS[:-1]:
+        assembler.update(name, 2, 2.)
+    sample = assembler.update('dropped', 2, 2.)
+    assert sample['ratio'] == 2
+    assert assembler.incomplete == 1
+    # a stream of partial samples never holds more than depth of them
+    for t in range(3, 10):
+        assembler.update('diff', t, float(t))
+    assert assembler.incomplete == 6
@@ -0,0 +1,42 @@
+import logging
+
+from jet_tracking.sketch.motor_benchmark import (run_benchmark, run_trial,
+                                                 summarize)
+
+logger = logging.getLogger(__name__)
+
+OPTIONS = dict(algorithm='Basic Scan', scenario=None, rate=120, averaging=20,
+               low_limit=-0.1, high_limit=0.1, step_size=0.02,
+               tolerance=0.001, velocity=0.1, settle=0.5, max_moves=200)
+
+
+def test_trial_is_repeatable():
+    logger.debug("test_trial_is_repeatable")
+    first = run_trial(OPTIONS, 5)
+    assert first == run_trial(OPTIONS, 5)
+    assert first['error'] is None
+    assert first['moves'] > 0
+    assert first['beam_time'] > first['moves'] * OPTIONS['settle']
+
+
+def test_summary():
+    logger.debug("test_summary")
+    results = run_benchmark(OPTIONS, 20, workers=1)
+    summary = summarize(results)
+    assert summary['trials'] == 20
+    assert 0 <= summary['failure_rate'] <= 1
+    assert summary['moves'][0] <= summary['moves'][1]
+
+
+def test_fly_scan_trial():
+    logger.debug("test_fly_scan_trial")
+    options = dict(OPTIONS, algorithm='Fly Scan')
+    for seed in range(3):
+        result = run_trial(options, seed)
+        assert not result['failed']
+        # to the start, the sweeps both ways and to the peak
+        assert result['moves'] == 4
+        assert result['distance'] < 0.002
+    # a latency a one way sweep would see as 0.003 off
+    late = dict(options, latency=0.1, fly_velocity=0.03)
+    assert run_trial(late, 0)['distance'] < 0.001
@@ -0,0 +1,408 @@
+import logging
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from jet_tracking.signals import Signals
+from jet_tracking.sketch import sim_motorMoving
+from jet_tracking.sketch.motor_benchmark import (BenchmarkMotorThread,
+                                                 HeadlessSignals,
+                                                 VirtualMotor)
+from jet_tracking.sketch.motorMoving import (FlyScanProfile, MotorAction,
+                                             chord_profile, fit_peak,
+                                             gaussian_profile,
+                                             integration_done, target_sem)
+from jet_tracking.sketch.num_gen import SimulationGenerator
+from jet_tracking.sketch.sim_motorMoving import SimulatedMotor
+from jet_tracking.tools.calibration import (results_calibration,
+                                            shots_calibration)
+
+logger = logging.getLogger(__name__)
+
+
+class PeakThread(object):
+    """Motor thread measuring a noiseless peak at center"""
+
+    def __init__(self, algorithm, center, position=0., profile=None):
+        self.algorithm = algorithm
+        self.center = center
+        self.profile = profile
+        self.low_limit = -0.1
+        self.high_limit = 0.1
+        self.step_size = 0.02
+        self.tolerance = 0.001
+        self.motor = SimpleNamespace(position=position, moves=0)
+        self.motor.move = self.move
+        self.moves = []
+
+    def move(self, position, wait=True):
+        self.motor.position = position
+        self.motor.moves += 1
+
+    def measure(self):
+        x = self.motor.position
+        if self.profile is None:
+            value = 1 - abs(x - self.center)
+        else:
+            value = self.profile(x, self.center)
+        self.moves.append([value, x])
+
+
+class NoisyPeakThread(PeakThread):
+    """Motor thread averaging noisy shots and keeping them"""
+
+    def __init__(self, algorithm, center, seed, noise=0.05):
+        super().__init__(algorithm, center)
+        self.rng = np.random.default_rng(seed)
+        self.noise = noise
+
+    def measure(self):
+        x = self.motor.position
+        shots = 1 - abs(x - self.center) + self.rng.normal(0, self.noise, 20)
+        self.moves.append([shots.mean(), x, shots.tolist()])
+
+
+def run(thread, max_moves=200):
+    action = MotorAction(thread, None, HeadlessSignals())
+    done = False
+    while not done and len(thread.moves) < max_moves:
+        thread.measure()
+        done, _ = action.execute()
+    return action, done
+
+
+def track(algorithm, center, max_moves=200):
+    thread = PeakThread(algorithm, center)
+    _, done = run(thread, max_moves)
+    return thread, done
+
+
+@pytest.mark.parametrize('center', [-0.09, -0.03, 0., 0.042, 0.099])
+def test_golden_section_finds_peak(center):
+    logger.debug("test_golden_section_finds_peak")
+    thread, done = track('Golden Section Search', center)
+    assert done
+    assert thread.motor.position == pytest.approx(center, abs=0.001)
+
+
+def test_golden_section_reuses_probes():
+    logger.debug("test_golden_section_reuses_probes")
+    golden, _ = track('Golden Section Search', 0.042)
+    ternary, _ = track('Ternary Search', 0.042)
+    assert golden.motor.moves < 0.6 * ternary.motor.moves
+    assert len(golden.moves) < 0.5 * len(ternary.moves)
+
+
+def test_golden_section_restarts():
+    logger.debug("test_golden_section_restarts")
+    thread, _ = track('Golden Section Search', 0.042)
+    action = MotorAction(thread, None, HeadlessSignals())
+    for center in [0.042, -0.05]:
+        thread.center = center
+        done = False
+        while not done:
+            thread.measure()
+            done, _ = action.execute()
+        assert thread.motor.position == pytest.approx(center, abs=0.001)
+
+
+def jet(x, center):
+    return float(chord_profile(x, 1., center, 0.025, 0.1))
+
+
+@pytest.mark.parametrize('profile, center', [(chord_profile, 0.0123),
+                                             (gaussian_profile, -0.031)])
+def test_fit_peak(profile, center):
+    logger.debug("test_fit_peak")
+    rng = np.random.default_rng(0)
+    x = np.linspace(-0.05, 0.05, 9)
+    y = profile(x, 1., center, 0.02, 0.1) + rng.normal(0, 0.01, len(x))
+    fit = fit_peak(x, y)
+    assert fit is not None
+    assert fit['error'] < x[1] - x[0]
+    assert fit['center'] == pytest.approx(center, abs=2 * fit['error'])
+    assert fit['peak'] == pytest.approx(1.1, abs=0.05)
+
+
+def test_fit_peak_rejects_unpinned_peak():
+    logger.debug("test_fit_peak_rejects_unpinned_peak")
+    x = np.linspace(-0.1, 0.1, 5)
+    # only one position is on the jet
+    y = chord_profile(x, 1., 0.01, 0.025, 0.1)
+    assert fit_peak(x, y) is None
+    assert fit_peak(x, np.ones(len(x))) is None
+    assert fit_peak(x[:3], y[:3]) is None
+
+
+@pytest.mark.parametrize('center', [-0.04, -0.011, 0.0, 0.027])
+def test_fit_scan_moves_to_fitted_center(center):
+    logger.debug("test_fit_scan_moves_to_fitted_center")
+    thread = PeakThread('Model Fit Scan', center, profile=jet)
+    thread.low_limit, thread.high_limit = -0.05, 0.05
+    thread.step_size = 0.01
+    action, done = run(thread)
+    assert done
+    assert action.fit_scan.fit['model'] == 'chord'
+    # 11 positions and the move to the center
+    assert thread.motor.moves == 12
+    assert thread.motor.position == pytest.approx(center, abs=0.001)
+
+
+def test_fit_scan_falls_back_to_maximum():
+    logger.debug("test_fit_scan_falls_back_to_maximum")
+    thread = PeakThread('Model Fit Scan', 0.043, profile=jet)
+    thread.step_size = 0.05
+    action, done = run(thread)
+    assert done
+    assert action.fit_scan.fit is None
+    assert thread.motor.position == pytest.approx(0.05)
+    assert action.fit_scan.max_value == pytest.approx(jet(0.05, 0.043))
+
+
+@pytest.mark.parametrize('center', [-0.09, -0.03, 0., 0.042, 0.099])
+def test_noise_aware_ternary_finds_peak(center):
+    logger.debug("test_noise_aware_ternary_finds_peak")
+    thread, done = track('Noise Aware Ternary', center)
+    assert done
+    assert thread.motor.position == pytest.approx(center, abs=0.001)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_noise_aware_ternary_with_noise(seed):
+    logger.debug("test_noise_aware_ternary_with_noise")
+    thread = NoisyPeakThread('Noise Aware Ternary', 0.042, seed)
+    _, done = run(thread)
+    assert done
+    assert thread.motor.position == pytest.approx(0.042, abs=0.01)
+    # close probes were averaged again before being compared
+    assert len(thread.moves) > thread.motor.moves
+
+
+def test_noise_aware_ternary_ties_keep_best():
+    logger.debug("test_noise_aware_ternary_ties_keep_best")
+    # the search starts on the jet and both first probes miss it
+    thread = PeakThread('Noise Aware Ternary', 0.08, position=0.08,
+                        profile=jet)
+    _, done = run(thread)
+    assert done
+    assert thread.motor.position == pytest.approx(0.08, abs=0.001)
+
+
+def test_integration_done():
+    logger.debug("test_integration_done")
+    rng = np.random.default_rng(0)
+    steady = list(1 + rng.normal(0, 0.01, 100))
+    noisy = list(1 + rng.normal(0, 0.5, 100))
+    # a fixed number of shots without a target
+    assert integration_done(steady[:19], 20) == (False, pytest.approx(
+        np.std(steady[:19], ddof=1) / np.sqrt(19)))
+    assert integration_done(steady[:20], 20)[0]
+    assert integration_done(steady[:1], 1) == (True, np.inf)
+    # a steady position is left after the fewest shots, a noisy one only
+    # once its mean is known well enough or at the most shots
+    assert integration_done(steady[:5], 20, target=0.02)[0]
+    assert not integration_done(steady[:4], 20, target=0.02)[0]
+    needed = next(n for n in range(2, 101)
+                  if integration_done(noisy[:n], 20, target=0.1)[0])
+    assert 20 < needed < 100
+    assert integration_done(noisy[:needed], 20, target=0.1)[1] <= 0.1
+    assert integration_done(noisy[:50], 20, target=0.01,
+                            max_averaging=50)[0]
+
+
+@pytest.mark.parametrize('source', ['results', 'gui'])
+def test_target_sem(source):
+    logger.debug("test_target_sem")
+    rng = np.random.default_rng(1)
+    i0 = 10 + rng.normal(0, 1, 200)
+    ratio = 0.5 + rng.normal(0, 0.05, 200)
+    diff = ratio * i0
+    if source == 'results':
+        # what jt_cal writes, the lows are the ends of its cuts
+        cal = results_calibration({
+            'i0_median': np.median(i0), 'i0_low': 8.,
+            'int_median': np.median(diff), 'int_low': 4.,
+            'med_ratio': np.median(ratio), 'std_ratio': np.std(ratio)})
+    else:
+        cal = shots_calibration(list(i0), list(diff), list(ratio))
+    values = {name: {'mean': m, 'stddev': s} for name, (m, s) in cal.items()}
+    target = target_sem(values, 0.25)
+    assert target == pytest.approx(0.25 * 0.05, rel=0.15)
+    # a position is left once the mean of its shots is that precise, not
+    # after the fewest shots
+    shots = list(0.5 + rng.normal(0, 0.05, 100))
+    needed = next(n for n in range(1, 101)
+                  if integration_done(shots[:n], 20, target)[0])
+    assert 5 < needed < 100
+    assert target_sem(values, 0) is None
+    assert target_sem({}, 0.25) is None
+
+
+def test_fly_scan_profile():
+    logger.debug("test_fly_scan_profile")
+    profile = FlyScanProfile(-0.1, 0.1, 0.05)
+    assert profile.bins == 4
+    profile.add([-0.1, -0.06, 0.07, 0.2, -0.2], [1., 3., 5., 7., 9.])
+    profile.add(np.array([0.1]), np.array([7.]))
+    centers, means, counts = profile.profile()
+    assert centers == pytest.approx([-0.075, 0.075])
+    assert means == pytest.approx([2., 6.])
+    assert list(counts) == [2, 2]
+
+
+class ShortMotor(VirtualMotor):
+    """Virtual motor stopping its moves short of the target"""
+
+    def __init__(self, *args, short=0.003):
+        super().__init__(*args)
+        self.short = short
+
+    def move(self, position, wait=False):
+        if not wait:
+            position -= self.short * np.sign(position - self.position)
+        super().move(position, wait)
+
+
+class StalledMotor(VirtualMotor):
+    """Virtual motor that never gets going without wait"""
+
+    @property
+    def moving(self):
+        return True
+
+    def move(self, position, wait=False):
+        if wait:
+            super().move(position, wait)
+
+
+def fly_scan(motor, simgen, latency=0.1):
+    """
+    Run the fly scan on motor, fed in batches through Signals.valuesBatch
+
+    Returns
+    -------
+    thread : BenchmarkMotorThread
+    sent : int
+        Shots that were not dropped, sent while the motor was sweeping.
+    messages : list of str
+    """
+    options = dict(algorithm='Fly Scan', rate=120, low_limit=-0.1,
+                   high_limit=0.1, step_size=0.02, tolerance=0.001,
+                   averaging=20)
+    thread = BenchmarkMotorThread(simgen, motor, options)
+    action_signals = HeadlessSignals()
+    messages = []
+    action_signals.message.connect(messages.append)
+    action = thread.action = MotorAction(thread, simgen.context,
+                                         action_signals)
+    results = []
+
+    # what MotorThread.update_batch does with the batches of StatusThread
+    def update_batch(samples):
+        results.append(action.add_samples(samples))
+
+    signals = Signals()
+    signals.valuesBatch.connect(update_batch)
+    sent = 0
+    while not results or not results[-1][0]:
+        samples = []
+        # one display period of shots at 120 Hz, their times are late
+        for _ in range(12):
+            simgen.motor_position = motor.position_at(simgen.time + 1 / 120)
+            batch = simgen.sim_batch(1)
+            samples.append({'ratio': float(batch['ratio'][0]),
+                            'dropped': bool(batch['dropped'][0]),
+                            'time': float(batch['time'][0]) + latency})
+        if action.fly_scan.sweeping:
+            sent += sum(not s['dropped'] for s in samples)
+        signals.valuesBatch.emit(samples)
+        assert simgen.time < 120
+    return thread, sent, messages
+
+
+def jet_simulation(center=0.023):
+    simgen = SimulationGenerator(SimpleNamespace(refresh_rate=120), seed=3)
+    simgen.change_center(center)
+    return simgen
+
+
+def test_fly_scan_gets_every_shot():
+    logger.debug("test_fly_scan_gets_every_shot")
+    simgen = jet_simulation()
+    motor = VirtualMotor(simgen, -0.05, 0.1, 0.5)
+    latency = 0.1
+    thread, sent, messages = fly_scan(motor, simgen, latency)
+    fly = thread.action.fly_scan
+    assert len(fly.profiles) == 2
+    # 0.2 at 0.03 per second both ways, every shot is in the profiles
+    assert sent > 2 * 0.2 / 0.03 * 120 * 0.8
+    assert sum(p.counts.sum() for p in fly.profiles) == sent
+    # 0.003 apart and opposite, the mean of both is on the jet
+    forward, back = (fit_peak(*p.profile()[:2])['center']
+                     for p in fly.profiles)
+    assert forward - back == pytest.approx(2 * latency * 0.03, abs=0.001)
+    assert fly.latency == pytest.approx(latency, abs=0.02)
+    assert motor.position == pytest.approx(0.023, abs=0.0005)
+    assert len(thread.moves) == 40
+    assert motor.velocity == 0.1
+    assert len(messages) == 1
+
+
+def test_fly_scan_motor_stopping_short():
+    logger.debug("test_fly_scan_motor_stopping_short")
+    simgen = jet_simulation()
+    # stops 0.003 short of the limits, outside of the tolerance
+    motor = ShortMotor(simgen, -0.05, 0.1, 0.5)
+    thread, sent, messages = fly_scan(motor, simgen)
+    fly = thread.action.fly_scan
+    assert len(fly.profiles) == 2
+    assert sum(p.counts.sum() for p in fly.profiles) == sent
+    assert sum('stopped at' in m for m in messages) == 2
+    assert motor.position == pytest.approx(0.023, abs=0.0005)
+    assert motor.velocity == 0.1
+    # the sweeps ended with the motor, not with a timeout
+    assert simgen.time < 2 * 0.2 / 0.03 + 5
+
+
+def test_fly_scan_times_out():
+    logger.debug("test_fly_scan_times_out")
+    simgen = jet_simulation()
+    motor = StalledMotor(simgen, -0.05, 0.1, 0.5)
+    thread, sent, messages = fly_scan(motor, simgen)
+    fly = thread.action.fly_scan
+    assert fly.done
+    # the sweep back starts where the motor is stuck
+    assert sum('timed out' in m for m in messages) == 1
+    # twice 0.2 at 0.03 per second and the margin
+    assert simgen.time > 2 * 0.2 / 0.03 + fly.timeout_margin
+    assert motor.velocity == 0.1
+    assert not fly.sweeping
+
+
+def test_simulated_motor_velocity(monkeypatch):
+    logger.debug("test_simulated_motor_velocity")
+    clock = [100.]
+    monkeypatch.setattr(sim_motorMoving.time, 'time', lambda: clock[0])
+    signals = HeadlessSignals()
+    seen = []
+    signals.changeMotorPosition.connect(seen.append)
+    motor = SimulatedMotor(None, signals)
+    motor.velocity = 0.01
+    motor.move(0.1)
+    assert motor.moving
+    clock[0] += 4
+    assert motor.readback() == (104., pytest.approx(0.04))
+    assert seen[-1] == pytest.approx(0.04)
+    # the rest of the way is faster
+    motor.velocity = 0.1
+    clock[0] += 0.3
+    assert motor.position == pytest.approx(0.07)
+    clock[0] += 1
+    assert motor.position == 0.1
+    assert not motor.moving
+    motor.move(0.)
+    clock[0] += 0.5
+    motor.stop()
+    clock[0] += 1
+    assert motor.position == pytest.approx(0.05)
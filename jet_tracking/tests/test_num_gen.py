@@ -0,0 +1,29 @@
+import logging
+
+import numpy as np
+
+from jet_tracking.sketch.num_gen import SimulationGenerator
+
+logger = logging.getLogger(__name__)
+
+
+def test_batch_matches_single_shots():
+    logger.debug("test_batch_matches_single_shots")
+    for position in [0.03, 0.045, 0.1]:
+        single = SimulationGenerator(None, seed=3)
+        batch = SimulationGenerator(None, seed=3)
+        single.motor_position = batch.motor_position = position
+        shots = [single.sim() for _ in range(200)]
+        vals = batch.sim_batch(200)
+        for key in ['i0', 'diff', 'ratio', 'dropped']:
+            assert np.array_equal(vals[key], [s[key] for s in shots])
+
+
+def test_seed_repeats():
+    logger.debug("test_seed_repeats")
+    gen = SimulationGenerator(None, seed=1)
+    first = gen.sim_batch(50)
+    gen.seed(1)
+    second = gen.sim_batch(50)
+    assert np.array_equal(first['ratio'], second['ratio'])
+    assert 0 < first['dropped'].sum() < 50
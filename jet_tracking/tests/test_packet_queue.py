@@ -0,0 +1,64 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+
+from jet_tracking.mpi_scripts.packet_queue import PacketQueue
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.dtype([('event', 'i8'), ('time', 'f8'), ('ratio', 'f4'),
+                  ('dropped', 'f4')])
+
+
+def make_batch(events, dropped=0, age=0.):
+    batch = np.zeros(len(events), dtype=DTYPE)
+    batch['event'] = events
+    batch['time'] = time.time() - age
+    batch['ratio'] = events
+    batch['dropped'] = dropped
+    return batch
+
+
+def test_drop_oldest():
+    logger.debug("test_drop_oldest")
+    queue = PacketQueue(2, 'drop_oldest')
+    for start in range(0, 12, 4):
+        queue.put(make_batch(range(start, start + 4)))
+    assert queue.depth == 8
+    assert queue.get()['event'][0] == 4
+    stats = queue.stats()
+    assert stats['dropped'] == 4
+    assert stats['received'] == 12
+
+
+def test_conflate_and_aggregate():
+    logger.debug("test_conflate_and_aggregate")
+    queue = PacketQueue(2, 'conflate')
+    queue.put(make_batch([1, 2]))
+    queue.put(make_batch([3, 4]))
+    assert list(queue.get()['event']) == [4]
+    assert queue.dropped == 3
+
+    queue = PacketQueue(2, 'aggregate')
+    queue.put(make_batch([1, 2]))
+    queue.put(make_batch([3, 4]))
+    queue.put(make_batch([5, 6], dropped=1))
+    merged = queue.get()
+    # the good and the dropped shots are merged separately
+    assert len(merged) == 2
+    assert list(merged['dropped']) == [0, 1]
+    assert list(merged['ratio']) == pytest.approx([2.5, 5.5])
+    assert list(merged['event']) == [4, 6]
+    assert queue.get() is None
+
+
+def test_max_age():
+    logger.debug("test_max_age")
+    queue = PacketQueue(8, max_age=0.5)
+    queue.put(make_batch([1, 2], age=1.))
+    queue.put(make_batch([3]))
+    assert list(queue.get()['event']) == [3]
+    assert queue.expired == 2
+    assert queue.worst_age < 0.5
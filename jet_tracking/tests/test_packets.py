@@ -0,0 +1,108 @@
+import logging
+import time
+
+import numpy as np
+from mpi4py import MPI
+
+from jet_tracking.mpi_scripts import packets
+from jet_tracking.mpi_scripts.packets import (PACKET_DTYPE, BatchReceiver,
+                                              BatchSender, PacketBatcher)
+
+logger = logging.getLogger(__name__)
+
+
+class LoopbackComm(object):
+    """
+    Communicator stub that delivers every send to its own receives, over
+    MPI.COMM_SELF, and keeps a record of the sends
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.posted = 0
+
+    def Isend(self, buf, dest, tag):
+        self.sent.append((dest, tag, len(buf[0])))
+        return MPI.COMM_SELF.Isend(buf, dest=0, tag=tag)
+
+    def Irecv(self, buf, source, tag):
+        self.posted += 1
+        return MPI.COMM_SELF.Irecv(buf, source=source, tag=tag)
+
+
+def test_batcher_fills_and_flushes(monkeypatch):
+    logger.debug("test_batcher_fills_and_flushes")
+    now = [100.]
+    monkeypatch.setattr(packets.time, 'monotonic', lambda: now[0])
+    batcher = PacketBatcher(rank=3, max_events=4, max_time=0.05)
+    assert batcher.flush() is None
+    for event in range(3):
+        assert batcher.add(event, 1., 2., .5, 0) is None
+    assert len(batcher) == 3
+    batch = batcher.add(3, 1., 2., .5, 1)
+    assert batch.dtype == PACKET_DTYPE
+    np.testing.assert_array_equal(batch['event'], [0, 1, 2, 3])
+    np.testing.assert_array_equal(batch['rank'], 3)
+    np.testing.assert_array_equal(batch['dropped'], [0, 0, 0, 1])
+    assert len(batcher) == 0
+    # a batch is also ready once its first event is max_time old
+    assert batcher.add(4, 1., 2., .5, 0) is None
+    now[0] += 0.06
+    batch = batcher.add(5, 1., 2., .5, 0)
+    np.testing.assert_array_equal(batch['event'], [4, 5])
+    # flushing hands over what is there, later events go to a new batch
+    batcher.add(6, 1., 2., .5, 0)
+    batch = batcher.flush()
+    batcher.add(7, 1., 2., .5, 0)
+    np.testing.assert_array_equal(batch['event'], [6])
+    assert batcher.flush()['event'][0] == 7
+
+
+def test_send_and_receive():
+    logger.debug("test_send_and_receive")
+    comm = LoopbackComm()
+    receiver = BatchReceiver(comm, max_events=4, depth=2)
+    assert comm.posted == 2
+    sender = BatchSender(comm, dest=0, tag=7)
+    batcher = PacketBatcher(rank=1, max_events=4)
+    batches = []
+    for event in range(10):
+        batch = batcher.add(event, event, 1., float(event), 0)
+        if batch is not None:
+            batches.append(batch)
+    batches.append(batcher.flush())
+    for batch in batches:
+        sender.send(batch)
+    assert [n for _, _, n in comm.sent] == [4 * PACKET_DTYPE.itemsize,
+                                            4 * PACKET_DTYPE.itemsize,
+                                            2 * PACKET_DTYPE.itemsize]
+    received = [receiver.receive(timeout=1.) for _ in batches]
+    sender.wait()
+    # the lowest completed receive is returned first, so batches can come
+    # out of order once a receive has been posted again
+    received.sort(key=lambda b: b['event'][0])
+    assert [len(b) for b in received] == [4, 4, 2]
+    np.testing.assert_array_equal(np.concatenate(received)['event'],
+                                  np.arange(10))
+    assert receiver.messages == 3
+    assert receiver.events == 10
+    # every completed receive is posted again
+    assert comm.posted == 5
+    receiver.cancel()
+
+
+def test_receive_times_out():
+    logger.debug("test_receive_times_out")
+    comm = LoopbackComm()
+    receiver = BatchReceiver(comm, max_events=4, depth=2)
+    start = time.monotonic()
+    assert receiver.receive(timeout=0.05) is None
+    assert time.monotonic() - start >= 0.05
+    assert receiver.messages == 0
+    sender = BatchSender(comm)
+    batch = np.zeros(1, dtype=PACKET_DTYPE)
+    batch['event'] = 42
+    sender.send(batch)
+    assert receiver.receive(timeout=1.)['event'][0] == 42
+    sender.wait()
+    receiver.cancel()
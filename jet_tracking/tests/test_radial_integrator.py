@@ -0,0 +1,94 @@
+import logging
+
+import numpy as np
+import pytest
+
+from jet_tracking import fake_psana
+from jet_tracking.utils import RadialIntegrator, get_r_masks
+
+logger = logging.getLogger(__name__)
+
+
+def mask_azav(image, masks):
+    """Azimuthal average the way the masks of get_r_masks are used"""
+    return np.array([image[mask].mean() if mask.any() else np.nan
+                     for mask in masks])
+
+
+@pytest.mark.parametrize('shape, bins', [((64, 64), 20), ((48, 80), 30),
+                                         ((33, 17), 10), ((100, 60), 100)])
+def test_integrate_matches_r_masks(shape, bins):
+    logger.debug("test_integrate_matches_r_masks")
+    rng = np.random.default_rng(1)
+    image = rng.random(shape)
+    masks = get_r_masks(shape, bins)
+    integrator = RadialIntegrator(shape, bins)
+    assert len(integrator.radii) == len(masks)
+    assert integrator.nbins == len(masks)
+    expected = mask_azav(image, masks)
+    np.testing.assert_allclose(integrator.integrate(image), expected,
+                               rtol=1e-12, equal_nan=True)
+    np.testing.assert_array_equal(integrator.counts,
+                                  [mask.sum() for mask in masks])
+
+
+@pytest.mark.parametrize('low_bin, hi_bin', [(0, 5), (3, 9), (15, 40),
+                                             (18, 18)])
+def test_subset_matches_r_masks(low_bin, hi_bin):
+    logger.debug("test_subset_matches_r_masks")
+    shape, bins = (60, 70), 30
+    image = np.random.default_rng(2).random(shape)
+    masks = get_r_masks(shape, bins)
+    integrator = RadialIntegrator(shape, bins)
+    sub = integrator.subset(low_bin, hi_bin)
+    assert sub is integrator.subset(low_bin, hi_bin)
+    hi_bin = min(hi_bin, len(masks))
+    assert sub.nbins == hi_bin - low_bin
+    expected = mask_azav(image, masks[low_bin:hi_bin])
+    np.testing.assert_allclose(sub.integrate(image), expected,
+                               rtol=1e-12, equal_nan=True)
+    # a subset of a subset counts bins from the start of the subset
+    if sub.nbins > 2:
+        np.testing.assert_allclose(sub.subset(1, 3).integrate(image),
+                                   expected[1:3], rtol=1e-12)
+
+
+def test_pixel_mask_matches_r_masks():
+    logger.debug("test_pixel_mask_matches_r_masks")
+    shape, bins = (50, 50), 25
+    rng = np.random.default_rng(3)
+    image = rng.random(shape)
+    pixel_mask = rng.random(shape) > 0.3
+    masks = [mask & pixel_mask for mask in get_r_masks(shape, bins)]
+    integrator = RadialIntegrator(shape, bins, mask=pixel_mask)
+    np.testing.assert_allclose(integrator.integrate(image),
+                               mask_azav(image, masks), rtol=1e-12,
+                               equal_nan=True)
+
+
+@pytest.mark.parametrize('shape, gap', [((64, 64), 4), ((48, 80), 2)])
+def test_raw_panels_matches_assembled_image(monkeypatch, shape, gap):
+    logger.debug("test_raw_panels_matches_assembled_image")
+    monkeypatch.setitem(fake_psana.CONFIG, 'shape', shape)
+    monkeypatch.setitem(fake_psana.CONFIG, 'panel_gap', gap)
+    det = fake_psana.Detector('detector')
+    evt = fake_psana.Event(0, 1., 5., False, 0., [40])
+    raw = det.calib(evt)
+    raw_mask = det.mask(None)
+    assert raw.shape == (4, shape[0] // 2 - gap, shape[1] // 2 - gap)
+    integrator = RadialIntegrator(shape, 30)
+    panels = integrator.raw_panels(det.indexes_xy(None), raw_mask)
+    assert panels.input_shape == raw.shape
+    np.testing.assert_array_equal(panels.radii, integrator.radii)
+    # the same pixels integrated from the assembled image, the gaps between
+    # the panels and the masked edges are left out
+    image_mask = det.image(evt, raw_mask)
+    assembled = RadialIntegrator(shape, 30, mask=image_mask)
+    np.testing.assert_allclose(panels.integrate(raw),
+                               assembled.integrate(det.image(evt, raw)),
+                               rtol=1e-6, equal_nan=True)
+    np.testing.assert_array_equal(panels.counts, assembled.counts)
+    sub = panels.subset(5, 12)
+    np.testing.assert_allclose(sub.integrate(raw),
+                               panels.integrate(raw)[5:12], rtol=1e-6,
+                               equal_nan=True)
@@ -0,0 +1,20 @@
+import logging
+
+from jet_tracking.tools.rate_meter import RateMeter
+
+logger = logging.getLogger(__name__)
+
+
+def test_rate_meter():
+    logger.debug("test_rate_meter")
+    meter = RateMeter(interval=2.)
+    assert meter.add(7, now=100.) is None
+    # 120 Hz stream drained in bunches at 10 Hz
+    rates = [meter.add(12, now=100. + i / 10) for i in range(1, 41)]
+    measured = [r for r in rates if r is not None]
+    assert measured == [120., 120.]
+    assert meter.rate == 120.
+    meter.reset()
+    assert meter.rate is None
+    assert meter.add(5, now=0.) is None
+    assert meter.add(0, now=4.) == 0.
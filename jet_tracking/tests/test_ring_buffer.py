@@ -0,0 +1,38 @@
+import logging
+
+import numpy as np
+
+from jet_tracking.tools.ring_buffer import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+
+def test_append_wraps_like_deque():
+    logger.debug("test_append_wraps_like_deque")
+    buf = RingBuffer(3, [0])
+    for value in [1, 2, 3]:
+        buf.append(value)
+    assert len(buf) == 3
+    assert list(buf.view()) == [3, 1, 2]
+    assert list(buf.chronological()) == [1, 2, 3]
+
+
+def test_set_by_index_and_view_is_shared():
+    logger.debug("test_set_by_index_and_view_is_shared")
+    buf = RingBuffer(4, [0, 0, 0, 0])
+    view = buf.view()
+    buf[2] = 5
+    assert view[2] == 5
+    assert np.count_nonzero(buf) == 1
+
+
+def test_resize_keeps_last_values():
+    logger.debug("test_resize_keeps_last_values")
+    buf = RingBuffer(5, range(5))
+    buf.resize(3)
+    assert list(buf.view()) == [2, 3, 4]
+    buf.resize(6)
+    assert list(buf.view()) == [2, 3, 4]
+    assert buf.capacity == 6
+    buf.append(5)
+    assert list(buf.view()) == [2, 3, 4, 5]
@@ -0,0 +1,44 @@
+import logging
+import random
+from statistics import StatisticsError, mean, stdev
+
+import pytest
+
+from jet_tracking.tools.rolling_stats import RollingStats
+
+logger = logging.getLogger(__name__)
+
+
+def test_matches_statistics_with_masking():
+    logger.debug("test_matches_statistics_with_masking")
+    rng = random.Random(0)
+    stats = RollingStats([5, 20, 50])
+    history = []
+    for _ in range(500):
+        value = 1e6 + rng.gauss(0, 1)
+        masked = rng.random() < 0.2
+        stats.push(value, masked)
+        history.append((value, masked))
+    for w in [5, 20, 50]:
+        window = [v for v, m in history[-w:] if not m]
+        assert stats.count(w) == len(window)
+        assert stats.mean(w) == pytest.approx(mean(window), abs=1e-9)
+        assert stats.std(w) == pytest.approx(stdev(window), rel=1e-6)
+
+
+def test_set_windows_keeps_history():
+    logger.debug("test_set_windows_keeps_history")
+    stats = RollingStats([3])
+    for value in range(10):
+        stats.push(value)
+    stats.set_windows([2, 4])
+    assert stats.mean(2) == 8.5
+    assert stats.count(4) == 3
+
+
+def test_empty_window_raises():
+    logger.debug("test_empty_window_raises")
+    stats = RollingStats([4])
+    stats.push(1., masked=True)
+    with pytest.raises(StatisticsError):
+        stats.mean()
@@ -0,0 +1,23 @@
+import logging
+import threading
+
+from jet_tracking.tools.sample_queue import SampleQueue
+
+logger = logging.getLogger(__name__)
+
+
+def test_drain_returns_everything_in_order():
+    logger.debug("test_drain_returns_everything_in_order")
+    queue = SampleQueue()
+    threads = [threading.Thread(target=queue.extend,
+                                args=([(i, j) for j in range(100)],))
+               for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    items = queue.drain()
+    assert len(items) == 400
+    for i in range(4):
+        assert [j for k, j in items if k == i] == list(range(100))
+    assert queue.drain(timeout=0.01) == []
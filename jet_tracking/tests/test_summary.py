@@ -0,0 +1,87 @@
+import logging
+import math
+
+import numpy as np
+import pytest
+
+from jet_tracking.mpi_scripts.packet_queue import aggregate
+from jet_tracking.mpi_scripts.packets import PACKET_DTYPE
+from jet_tracking.mpi_scripts.summary import SummaryAggregator
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.dtype([('diff', 'f4'), ('i0', 'f4'), ('ratio', 'f4'),
+                  ('dropped', 'f4')])
+
+
+def test_summary():
+    logger.debug("test_summary")
+    agg = SummaryAggregator(0.)
+    assert agg.due()
+    assert agg.summary() is None
+    batch = np.zeros(4, dtype=DTYPE)
+    batch['ratio'] = [1, 2, 6, 100]
+    batch['dropped'] = [0, 0, 0, 1]
+    agg.add(batch[:2])
+    agg.add(batch[2:])
+    summary = agg.summary()
+    assert summary['count'] == 4
+    assert summary['dropped_fraction'] == 0.25
+    assert summary['dropped'] == 0
+    assert summary['ratio_mean'] == pytest.approx(3)
+    assert summary['ratio_median'] == 2
+    assert summary['ratio_sigma'] == pytest.approx(np.std([1, 2, 6]))
+    assert agg.summary() is None
+
+
+def test_dropped_threshold():
+    logger.debug("test_dropped_threshold")
+    agg = SummaryAggregator(dropped_threshold=0.5)
+    batch = np.zeros(4, dtype=DTYPE)
+    batch['dropped'] = [1, 1, 0, 0]
+    agg.add(batch)
+    assert agg.summary()['dropped'] == 0
+    batch['dropped'] = [1, 1, 1, 0]
+    agg.add(batch)
+    summary = agg.summary()
+    assert summary['dropped'] == 1
+    assert summary['dropped_fraction'] == 0.75
+
+
+def test_all_dropped():
+    logger.debug("test_all_dropped")
+    agg = SummaryAggregator()
+    batch = np.ones(3, dtype=DTYPE)
+    agg.add(batch)
+    summary = agg.summary()
+    assert summary['dropped_fraction'] == 1
+    assert summary['dropped'] == 1
+    assert math.isnan(summary['i0_median'])
+
+
+def test_aggregated_shots_keep_their_weight():
+    logger.debug("test_aggregated_shots_keep_their_weight")
+    batch = np.zeros(10, dtype=PACKET_DTYPE)
+    batch['shots'] = 1
+    batch['event'] = np.arange(10)
+    batch['ratio'] = np.arange(10)
+    batch['dropped'][[2, 7]] = 1
+    # the queue merged the first six shots, then merged the result again
+    # together with the next two
+    merged = aggregate(np.concatenate([aggregate(batch[:6]), batch[6:8]]))
+    assert list(merged['dropped']) == [0, 1]
+    assert list(merged['shots']) == [6, 2]
+    agg = SummaryAggregator()
+    agg.add(merged)
+    agg.add(batch[8:])
+    summary = agg.summary()
+    good = np.delete(np.arange(10), [2, 7])
+    assert summary['count'] == 10
+    assert summary['dropped_fraction'] == pytest.approx(0.2)
+    assert summary['ratio_mean'] == pytest.approx(np.mean(good))
+    # the sigma is that of the merged means, not of the shots
+    assert summary['ratio_sigma'] < np.std(good)
+    agg.add(batch)
+    summary = agg.summary()
+    assert summary['ratio_median'] == np.median(good)
+    assert summary['ratio_sigma'] == pytest.approx(np.std(good))
@@ -0,0 +1,59 @@
+import logging
+
+import numpy as np
+
+from jet_tracking.tools.sample_queue import SampleQueue
+from jet_tracking.tools.zmq_subscriber import ZmqSubscriber, decode_message
+
+logger = logging.getLogger(__name__)
+
+
+def test_decode_batch_without_copy():
+    logger.debug("test_decode_batch_without_copy")
+    data = np.arange(8, dtype='float32').reshape(2, 4)
+    md = dict(dtype=str(data.dtype), shape=data.shape)
+    columns = decode_message(md, data.tobytes())
+    assert list(columns['diff']) == [0, 4]
+    assert list(columns['dropped']) == [3, 7]
+    buf = bytearray(data.tobytes())
+    columns = decode_message(md, buf)
+    buf[0:4] = np.float32(9).tobytes()
+    assert columns['diff'][0] == 9
+
+
+def test_decode_structured():
+    logger.debug("test_decode_structured")
+    dtype = np.dtype([('event', 'i8'), ('diff', 'f4'), ('i0', 'f4'),
+                      ('ratio', 'f4'), ('dropped', 'f4')])
+    data = np.zeros(3, dtype=dtype)
+    data['ratio'] = [1, 2, 3]
+    md = dict(dtype=dtype.descr, shape=data.shape)
+    columns = decode_message(md, data.tobytes())
+    assert list(columns['ratio']) == [1, 2, 3]
+
+
+def test_handle_counts_missed_messages():
+    logger.debug("test_handle_counts_missed_messages")
+    queue = SampleQueue()
+    sub = ZmqSubscriber('tcp://localhost:0', queue)
+    packet = np.array([1, 2, 0.5, 0], dtype='float32')
+    for seq in [0, 1, 4]:
+        md = dict(dtype='float32', shape=packet.shape, seq=seq)
+        sub.handle(md, packet.tobytes())
+    assert sub.missed == 2
+    samples = queue.drain()
+    assert len(samples) == 3
+    assert samples[0] == {'i0': 2., 'diff': 1., 'ratio': 0.5,
+                          'dropped': False}
+
+
+def test_handle_keeps_shot_time():
+    logger.debug("test_handle_keeps_shot_time")
+    queue = SampleQueue()
+    sub = ZmqSubscriber('tcp://localhost:0', queue)
+    dtype = np.dtype([('time', 'f8'), ('diff', 'f4'), ('i0', 'f4'),
+                      ('ratio', 'f4'), ('dropped', 'f4')])
+    data = np.zeros(2, dtype=dtype)
+    data['time'] = [1.5, 2.5]
+    sub.handle(dict(dtype=dtype.descr, shape=data.shape), data.tobytes())
+    assert [sample['time'] for sample in queue.drain()] == [1.5, 2.5]
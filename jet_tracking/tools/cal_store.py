@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# not jt_cal*, so that older readers globbing for results never pick it
+INDEX_NAME = 'cal_index.jsonl'
+
+
+def typed(value):
+    """
+    A calibration value as a plain json type
+
+    numpy scalars and arrays become python numbers and lists, and the
+    strings of old result files become the numbers or None they stand for.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, str):
+        if value == 'None':
+            return None
+        for kind in (int, float):
+            try:
+                return kind(value)
+            except ValueError:
+                pass
+    return value
+
+
+class CalStore(object):
+    """
+    Calibration results of every run, in one append-only index file.
+
+    Each line of the index is one calibration, the experiment, run, time
+    and typed results. A run calibrated again gets a new line, the newest
+    line wins. The index is read once and kept in memory by experiment and
+    run, so looking up the latest or any earlier calibration is a dict
+    lookup. Before each lookup the index file is checked with a single
+    stat, and only the lines added since are read if it has grown.
+
+    Without an index the newest jt_cal* result file of the directory is
+    used, as before the index existed.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory of the index, the jt_results or jt_calib directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.path = self.directory / INDEX_NAME
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._runs = {}
+        self._latest = {}
+        self._newest = None
+        self._stat = None
+        self._offset = 0
+
+    def _refresh(self):
+        """Read what was added to the index since the last call"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key == self._stat:
+            return
+        if (self._stat is None or stat.st_ino != self._stat[0] or
+                stat.st_size < self._offset):
+            # new or rewritten index, start over
+            self._reset()
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # a line still being written is left for the next refresh
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._add_record(json.loads(line))
+        self._offset += end
+        self._stat = key
+
+    def _add_record(self, record):
+        key = (record['experiment'], str(record['run']))
+        self._runs[key] = record
+        self._latest[record['experiment']] = record
+        self._newest = record
+
+    def add(self, experiment, run, results, source=None):
+        """
+        Append a calibration to the index.
+
+        Parameters
+        ----------
+        experiment : str
+        run : str or int
+        results : dict
+            Calibration results, numpy and string values are stored typed.
+        source : str, optional
+            Where else the results were saved, for the operators.
+
+        Returns
+        -------
+        record : dict
+            What was stored, see latest.
+        """
+        record = {'experiment': experiment, 'run': str(run),
+                  'time': time.time(), 'source': source,
+                  'results': {k: typed(v) for k, v in results.items()}}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            # one write of a whole line, appends never interleave
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        return record
+
+    def get(self, experiment, run):
+        """The newest calibration of a run, or None"""
+        with self._lock:
+            self._refresh()
+            return self._runs.get((experiment, str(run)))
+
+    def latest(self, experiment=None):
+        """
+        The newest calibration of an experiment, or of any if None.
+
+        Returns
+        -------
+        record : dict or None
+            'experiment', 'run', 'time', 'source' and the 'results'
+            dictionary. None if nothing was calibrated.
+        """
+        with self._lock:
+            self._refresh()
+            if self._stat is None:
+                return self._legacy_latest(experiment)
+            if experiment is None:
+                return self._newest
+            return self._latest.get(experiment)
+
+    def runs(self, experiment):
+        """Runs of an experiment with a calibration, in calibration order"""
+        with self._lock:
+            self._refresh()
+            records = [r for (exp, _), r in self._runs.items()
+                       if exp == experiment]
+        return [r['run'] for r in sorted(records, key=lambda r: r['time'])]
+
+    def _legacy_latest(self, experiment):
+        """The newest jt_cal* result file, for directories without index"""
+        cal_files = sorted(self.directory.glob('jt_cal*'),
+                           key=os.path.getmtime)
+        if not cal_files:
+            return None
+        with open(cal_files[-1]) as f:
+            results = json.load(f)
+        return {'experiment': experiment, 'run': None,
+                'time': os.path.getmtime(cal_files[-1]),
+                'source': str(cal_files[-1]),
+                'results': {k: typed(v) for k, v in results.items()}}
@@ -0,0 +1,37 @@
+from statistics import mean, stdev
+
+# values the StatusThread keeps a calibration for
+CALIBRATION_NAMES = ('i0', 'diff', 'ratio')
+
+
+def results_calibration(results):
+    """
+    Calibration values from the results of a jt_cal run.
+
+    i0 and diff keep the lower end of their cuts as their spread, the
+    ratio gets the standard deviation of the ratio of the calibration
+    shots.
+
+    Returns
+    -------
+    cal : dict
+        (mean, stddev) for each of CALIBRATION_NAMES.
+    """
+    return {'i0': (float(results['i0_median']), float(results['i0_low'])),
+            'diff': (float(results['int_median']),
+                     float(results['int_low'])),
+            'ratio': (float(results['med_ratio']),
+                      float(results['std_ratio']))}
+
+
+def shots_calibration(i0, diff, ratio):
+    """
+    Calibration values from shots collected in the GUI.
+
+    Returns
+    -------
+    cal : dict
+        (mean, stddev) for each of CALIBRATION_NAMES.
+    """
+    return {name: (mean(values), stdev(values))
+            for name, values in zip(CALIBRATION_NAMES, (i0, diff, ratio))}
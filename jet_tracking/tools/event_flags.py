@@ -0,0 +1,68 @@
+import numpy as np
+
+from .ring_buffer import RingBuffer
+
+
+class EventFlagWindow(object):
+    """
+    Per-shot event flags over the display buffer with running counts.
+
+    Each flag type has one slot per x-axis index. A slot holds zero when the
+    shot was not flagged and the flagged value otherwise. The number of
+    non-zero slots of each type is updated as slots are overwritten, so
+    asking how many shots in the window were flagged costs O(1).
+
+    Parameters
+    ----------
+    capacity : int
+        Number of shots in the window, usually the StatusThread buffer size.
+    flags : iterable of str, optional
+        Names of the flag types.
+    """
+
+    FLAGS = ('high intensity', 'missed shot', 'dropped shot')
+
+    def __init__(self, capacity, flags=FLAGS):
+        self._flags = {}
+        self._counts = {}
+        for flag in flags:
+            self._flags[flag] = RingBuffer(capacity)
+            self._flags[flag].fill(0)
+            self._counts[flag] = 0
+
+    def __getitem__(self, flag):
+        return self._flags[flag]
+
+    def __iter__(self):
+        return iter(self._flags)
+
+    @property
+    def capacity(self):
+        """Number of shots in the window"""
+        return next(iter(self._flags.values())).capacity
+
+    def set(self, flag, idx, value):
+        """Store value for the shot in slot idx and update the count"""
+        buf = self._flags[flag]
+        self._counts[flag] += bool(value != 0) - bool(buf[idx] != 0)
+        buf[idx] = value
+
+    def count(self, flag):
+        """Number of flagged shots of this type in the window"""
+        return self._counts[flag]
+
+    def clear(self):
+        """Mark every shot as unflagged"""
+        for flag, buf in self._flags.items():
+            buf.fill(0)
+            self._counts[flag] = 0
+
+    def resize(self, capacity):
+        """Change the window length, recounting the flags that are kept"""
+        for flag, buf in self._flags.items():
+            size = len(buf)
+            buf.resize(capacity)
+            # the window always covers every x-axis slot
+            for _ in range(capacity - size):
+                buf.append(0)
+            self._counts[flag] = int(np.count_nonzero(buf.view()))
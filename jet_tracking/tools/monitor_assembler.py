@@ -0,0 +1,60 @@
+class MonitorAssembler(object):
+    """
+    Puts the monitor updates of several PVs back together into samples.
+
+    Every field of one sample is put separately, so its updates arrive one
+    at a time, possibly out of order and interleaved with the next sample.
+    Updates whose timestamps lie within tolerance seconds of each other
+    belong to the same sample, which is complete once every field has
+    arrived. Samples still missing a field when a newer one completes, or
+    when more than depth samples are pending, are discarded and counted in
+    incomplete.
+
+    Parameters
+    ----------
+    fields : sequence of str
+        Names of the values that make up one sample.
+    tolerance : float
+        Largest difference in seconds between the timestamps of two updates
+        of the same sample.
+    depth : int
+        Most samples waiting for their missing fields at once.
+    """
+
+    def __init__(self, fields, tolerance=0.1, depth=4):
+        self.fields = tuple(fields)
+        self.tolerance = tolerance
+        self.depth = depth
+        self.incomplete = 0
+        # [first timestamp, oldest timestamp, values], oldest sample first
+        self._pending = []
+
+    def update(self, name, value, timestamp):
+        """
+        Add one update, returns the sample it completes or None.
+
+        A sample holds every field plus 'time', the oldest timestamp of its
+        updates.
+        """
+        for sample in self._pending:
+            if (name not in sample[2] and
+                    abs(timestamp - sample[0]) <= self.tolerance):
+                break
+        else:
+            sample = [timestamp, timestamp, {}]
+            self._pending.append(sample)
+        sample[1] = min(sample[1], timestamp)
+        sample[2][name] = value
+        if len(sample[2]) < len(self.fields):
+            if len(self._pending) > self.depth:
+                self._pending.pop(0)
+                self.incomplete += 1
+            return None
+        idx = self._pending.index(sample)
+        self.incomplete += idx
+        del self._pending[:idx + 1]
+        return dict(sample[2], time=sample[1])
+
+    def clear(self):
+        """Throw away every pending update"""
+        self._pending = []
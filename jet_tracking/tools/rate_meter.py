@@ -0,0 +1,48 @@
+import time
+
+
+class RateMeter(object):
+    """
+    Measures how many samples per second arrive.
+
+    Samples are counted as they are handed over and the rate is worked out
+    once every interval seconds.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds over which the samples are counted.
+    """
+
+    def __init__(self, interval=2.):
+        self.interval = interval
+        self.rate = None
+        self._count = 0
+        self._started = None
+
+    def add(self, count, now=None):
+        """
+        Count samples, returns the rate if an interval just ended.
+
+        The first call only starts the clock, its samples are not counted
+        since it is not known how long they took to arrive.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self._started is None:
+            self._started = now
+            return None
+        self._count += count
+        elapsed = now - self._started
+        if elapsed < self.interval:
+            return None
+        self.rate = self._count / elapsed
+        self._count = 0
+        self._started = now
+        return self.rate
+
+    def reset(self):
+        """Start counting from scratch"""
+        self.rate = None
+        self._count = 0
+        self._started = None
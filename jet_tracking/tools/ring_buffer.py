@@ -0,0 +1,122 @@
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    Fixed-capacity buffer backed by a preallocated numpy array.
+
+    Values are stored in slots 0 to capacity-1. ``append`` fills the slots in
+    order and, once the buffer is full, wraps around and overwrites the oldest
+    slot, the same way a ``deque`` with a ``maxlen`` drops its oldest value.
+    Slots can also be written directly by index, which is how the StatusThread
+    sweeps its x-axis. Nothing is allocated after construction unless the
+    buffer is resized.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of values held.
+    initial : iterable, optional
+        Values to append after allocation.
+    dtype : numpy dtype, optional
+        Type of the stored values, float by default.
+    """
+
+    def __init__(self, capacity, initial=(), dtype=float):
+        self._capacity = max(int(capacity), 1)
+        self._data = np.zeros(self._capacity, dtype=dtype)
+        self._size = 0
+        self._head = 0
+        for value in initial:
+            self.append(value)
+
+    @property
+    def capacity(self):
+        """Maximum number of values held"""
+        return self._capacity
+
+    @property
+    def head(self):
+        """Slot that the next append will write to"""
+        return self._head
+
+    @property
+    def full(self):
+        """True once every slot has been written"""
+        return self._size == self._capacity
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, idx):
+        return self.view()[idx]
+
+    def __setitem__(self, idx, value):
+        if idx < 0:
+            idx += self._size
+        if not 0 <= idx < self._size:
+            raise IndexError('RingBuffer index out of range')
+        self._data[idx] = value
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self.view()
+        return self.view().astype(dtype)
+
+    def append(self, value):
+        """Write value to the head slot and advance the head"""
+        self._data[self._head] = value
+        self._head = (self._head + 1) % self._capacity
+        if self._size < self._capacity:
+            self._size += 1
+
+    def view(self):
+        """
+        Zero-copy view of the filled slots in slot order.
+
+        The StatusThread writes each value to the slot matching its x-axis
+        index, so slot order is also plotting order. The view shares memory
+        with the buffer and sees every later write.
+        """
+        return self._data[:self._size]
+
+    def chronological(self):
+        """Values from oldest to newest appended, copied only if wrapped"""
+        if self._size < self._capacity or self._head == 0:
+            return self.view()
+        return np.concatenate((self._data[self._head:],
+                               self._data[:self._head]))
+
+    def fill(self, value):
+        """Write value to every slot, marking the buffer as full"""
+        self._data[:] = value
+        self._size = self._capacity
+        self._head = 0
+
+    def clear(self):
+        """Forget all values without releasing the storage"""
+        self._size = 0
+        self._head = 0
+
+    def resize(self, capacity):
+        """
+        Change the capacity of the buffer in place.
+
+        When shrinking, the values in the last filled slots are kept, which
+        matches what a new ``deque`` built from the old contents would hold.
+        The previous storage is left alone, so views handed out earlier stay
+        valid but stop following the buffer.
+        """
+        capacity = max(int(capacity), 1)
+        if capacity == self._capacity:
+            return
+        keep = min(self._size, capacity)
+        data = np.zeros(capacity, dtype=self._data.dtype)
+        data[:keep] = self._data[self._size - keep:self._size]
+        self._data = data
+        self._capacity = capacity
+        self._size = keep
+        self._head = keep % capacity
@@ -0,0 +1,178 @@
+import math
+from statistics import StatisticsError
+
+
+class RollingStats(object):
+    """
+    Running mean and standard deviation over several trailing windows.
+
+    Every pushed value updates a running sum and sum of squares for each
+    window and removes the value that just fell out of it, so a push costs
+    O(number of windows) no matter how long the windows are. Masked values,
+    e.g. dropped shots, still take up a slot in the window but are left out
+    of the statistics.
+
+    The sums are kept relative to a reference value close to the data and
+    are recomputed exactly once per pass through the history, which keeps the
+    floating point error of the running sums from building up.
+
+    Parameters
+    ----------
+    windows : iterable of int
+        Window lengths in number of samples.
+    """
+
+    def __init__(self, windows):
+        self._windows = []
+        self._capacity = 0
+        self._values = []
+        self._masked = []
+        self._head = 0
+        self._pushed = 0
+        self._since_resync = 0
+        self._ref = None
+        self._sums = {}
+        self._sumsqs = {}
+        self._counts = {}
+        self.set_windows(windows)
+
+    @property
+    def windows(self):
+        """Window lengths in samples, shortest first"""
+        return list(self._windows)
+
+    def set_windows(self, windows):
+        """
+        Change the window lengths, keeping as much history as still fits.
+        """
+        windows = sorted(set(max(int(w), 1) for w in windows))
+        if not windows:
+            raise ValueError('RollingStats needs at least one window')
+        history = self._history(windows[-1])
+        self._windows = windows
+        self._capacity = windows[-1]
+        self._values = [0.] * self._capacity
+        self._masked = [True] * self._capacity
+        self._head = 0
+        self._pushed = 0
+        for value, masked in history:
+            self._values[self._head] = value
+            self._masked[self._head] = masked
+            self._head = (self._head + 1) % self._capacity
+            self._pushed += 1
+        self._resync()
+
+    def clear(self):
+        """Forget all pushed values"""
+        self._pushed = 0
+        self._head = 0
+        self._masked = [True] * self._capacity
+        self._resync()
+
+    def push(self, value, masked=False):
+        """Add a value, dropping the oldest one from each full window"""
+        if self._ref is None and not masked:
+            self._ref = value
+        ref = self._ref or 0.
+        for w in self._windows:
+            if self._pushed >= w:
+                idx = (self._head - w) % self._capacity
+                if not self._masked[idx]:
+                    old = self._values[idx] - ref
+                    self._sums[w] -= old
+                    self._sumsqs[w] -= old * old
+                    self._counts[w] -= 1
+            if not masked:
+                new = value - ref
+                self._sums[w] += new
+                self._sumsqs[w] += new * new
+                self._counts[w] += 1
+        self._values[self._head] = value
+        self._masked[self._head] = masked
+        self._head = (self._head + 1) % self._capacity
+        self._pushed += 1
+        self._since_resync += 1
+        if self._since_resync >= self._capacity:
+            self._resync()
+
+    def count(self, window=None):
+        """Number of unmasked values in the window"""
+        return self._counts[self._window(window)]
+
+    def mean(self, window=None):
+        """
+        Mean of the unmasked values in the window, the longest window by
+        default. Raises StatisticsError if the window holds no values.
+        """
+        w = self._window(window)
+        n = self._counts[w]
+        if n < 1:
+            raise StatisticsError('mean requires at least one data point')
+        return self._ref + self._sums[w] / n
+
+    def std(self, window=None):
+        """
+        Sample standard deviation of the unmasked values in the window.
+        Raises StatisticsError if the window holds fewer than two values.
+        """
+        w = self._window(window)
+        n = self._counts[w]
+        if n < 2:
+            raise StatisticsError('variance requires at least two data '
+                                  'points')
+        var = (self._sumsqs[w] - self._sums[w] ** 2 / n) / (n - 1)
+        return math.sqrt(max(var, 0.))
+
+    def summary(self):
+        """
+        Mean and standard deviation for every window.
+
+        Returns
+        -------
+        summary : dict
+            Maps each window length to a (mean, std) tuple. Entries are NaN
+            while a window does not hold enough values.
+        """
+        summary = {}
+        for w in self._windows:
+            try:
+                vmean = self.mean(w)
+            except StatisticsError:
+                vmean = float('nan')
+            try:
+                sigma = self.std(w)
+            except StatisticsError:
+                sigma = float('nan')
+            summary[w] = (vmean, sigma)
+        return summary
+
+    def _window(self, window):
+        if window is None:
+            return self._capacity
+        window = int(window)
+        if window not in self._counts:
+            raise KeyError(f'RollingStats has no window of {window} samples')
+        return window
+
+    def _history(self, length):
+        """Last length (value, masked) pairs, oldest first"""
+        n = min(self._pushed, self._capacity, length)
+        return [(self._values[(self._head - n + i) % self._capacity],
+                 self._masked[(self._head - n + i) % self._capacity])
+                for i in range(n)]
+
+    def _resync(self):
+        """Recompute every window exactly around a fresh reference value"""
+        self._since_resync = 0
+        history = self._history(self._capacity)
+        values = [v for v, m in history if not m]
+        self._ref = math.fsum(values) / len(values) if values else None
+        ref = self._ref or 0.
+        self._sums = {}
+        self._sumsqs = {}
+        self._counts = {}
+        for w in self._windows:
+            window = [v - ref for v, m in history[-w:] if not m]
+            self._sums[w] = math.fsum(window)
+            self._sumsqs[w] = math.fsum(v * v for v in window)
+            self._counts[w] = len(window)
@@ -0,0 +1,52 @@
+import threading
+
+
+class SampleQueue(object):
+    """
+    Thread-safe queue that producers fill one sample at a time and the
+    consumer empties in one go.
+
+    Producers are callbacks running in other threads (channel access
+    monitors, socket readers). ``drain`` swaps the pending list out under the
+    lock, so the consumer gets every sample that arrived since its last call
+    and producers are only ever blocked for an append.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._items = []
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, item):
+        """Add one sample and wake up a waiting consumer"""
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify()
+
+    def extend(self, items):
+        """Add several samples at once"""
+        with self._cond:
+            self._items.extend(items)
+            self._cond.notify()
+
+    def drain(self, timeout=None):
+        """
+        Take every pending sample, oldest first.
+
+        If nothing is pending, wait up to timeout seconds for a sample to
+        arrive. Returns an empty list if none did.
+        """
+        with self._cond:
+            if not self._items and timeout:
+                self._cond.wait(timeout)
+            items = self._items
+            self._items = []
+        return items
+
+    def clear(self):
+        """Throw away every pending sample"""
+        with self._cond:
+            self._items = []
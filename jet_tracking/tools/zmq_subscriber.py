@@ -0,0 +1,118 @@
+import json
+import logging
+import threading
+
+import numpy as np
+import zmq
+
+log = logging.getLogger(__name__)
+
+# column order of the packets the MPI workers send to the master
+PACKET_FIELDS = ('diff', 'i0', 'ratio', 'dropped')
+
+
+def message_dtype(md):
+    """Numpy dtype described by the metadata frame of a message"""
+    dtype = md['dtype']
+    if isinstance(dtype, str):
+        return np.dtype(dtype)
+    # structured arrays are described by their dtype.descr
+    return np.dtype([tuple(field) for field in dtype])
+
+
+def decode_message(md, buf):
+    """
+    Turn one published message into per-shot columns without copying.
+
+    Parameters
+    ----------
+    md : dict
+        Metadata frame with the dtype and shape of the data frame, and
+        optionally the names of its columns in 'fields'.
+    buf : buffer
+        The data frame.
+
+    Returns
+    -------
+    columns : dict
+        One 1D array per field, each a view into buf, with one entry per
+        event in the message.
+    """
+    data = np.frombuffer(buf, dtype=message_dtype(md))
+    if data.dtype.names:
+        return {name: data[name] for name in data.dtype.names}
+    fields = md.get('fields', PACKET_FIELDS)
+    data = data.reshape(-1, len(fields))
+    return {name: data[:, i] for i, name in enumerate(fields)}
+
+
+class ZmqSubscriber(threading.Thread):
+    """
+    Thread reading the per-shot stream that MpiMaster publishes over ZMQ.
+
+    Every message is a metadata frame followed by a raw data frame holding
+    one or more events. Each event is queued as a sample dictionary. The
+    master numbers its messages, and a jump in that number is counted as
+    missed messages and logged.
+
+    Parameters
+    ----------
+    address : str
+        Address of the master's data socket, e.g. 'tcp://localhost:8123'.
+    queue : SampleQueue
+        Where the samples go.
+    """
+
+    def __init__(self, address, queue):
+        super(ZmqSubscriber, self).__init__(daemon=True)
+        self.address = address
+        self.queue = queue
+        self.last_seq = None
+        self.messages = 0
+        self.events = 0
+        self.missed = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        ctx = zmq.Context.instance()
+        socket = ctx.socket(zmq.SUB)
+        socket.connect(self.address)
+        socket.subscribe('')
+        log.info('subscribed to %s', self.address)
+        try:
+            while not self._stop_event.is_set():
+                if not socket.poll(100):
+                    continue
+                md_frame, data_frame = socket.recv_multipart(copy=False)
+                self.handle(json.loads(md_frame.bytes), data_frame.buffer)
+        finally:
+            socket.close(linger=0)
+
+    def handle(self, md, buf):
+        """Queue the events of one message and check its sequence number"""
+        seq = md.get('seq')
+        if seq is not None:
+            if self.last_seq is not None and seq != self.last_seq + 1:
+                missed = seq - self.last_seq - 1
+                if missed > 0:
+                    self.missed += missed
+                    log.warning('missed %d messages from %s (total %d)',
+                                missed, self.address, self.missed)
+            self.last_seq = seq
+        columns = decode_message(md, buf)
+        n = len(columns['ratio'])
+        samples = [{'i0': float(columns['i0'][i]),
+                    'diff': float(columns['diff'][i]),
+                    'ratio': float(columns['ratio'][i]),
+                    'dropped': bool(columns['dropped'][i])}
+                   for i in range(n)]
+        if 'time' in columns:
+            # when the shot was processed, to place it on a fly scan
+            for sample, when in zip(samples, columns['time'].tolist()):
+                sample['time'] = when
+        self.queue.extend(samples)
+        self.messages += 1
+        self.events += n
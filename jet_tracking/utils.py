@@ -1,5 +1,4 @@
 import numpy as np
-import psana
 
 
 def get_r_masks(shape, bins=100):
@@ -20,8 +19,149 @@ def get_r_masks(shape, bins=100):
     return masks
 
 
+class RadialIntegrator(object):
+    """
+    Azimuthal average of detector images by radial bin.
+
+    Gives the same bins as the masks of get_r_masks, the mean of the pixels
+    within one bin size of each radius, without keeping a full image mask
+    per bin. Neighbouring bins overlap, so a pixel belongs to at most two
+    bins. The bins are kept as one sparse list of (pixel, bin) pairs and an
+    image is integrated with a single np.bincount instead of one pass over
+    the image per bin.
+
+    The integrator can also work on the raw calibrated detector array
+    instead of the assembled image. Each raw pixel is then binned by the
+    radius of the image pixel it is assembled into, and masked pixels are
+    left out of the bins altogether, so no mask multiply or image assembly
+    is needed per event.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Detector image shape.
+    bins : int, optional
+        Number of radial bins spanning the image.
+    indexes : tuple of np.ndarray, optional
+        Image row and column of every raw pixel, as returned by the psana
+        Detector.indexes_xy. If given, integrate takes raw arrays of the
+        shape of these indexes instead of images.
+    mask : np.ndarray, optional
+        Zero for the pixels to leave out, of the shape integrate takes.
+    """
+
+    def __init__(self, shape, bins=100, indexes=None, mask=None):
+        self.shape = tuple(shape)
+        self.bins = bins
+        center = (shape[1] / 2, shape[0] / 2)
+        x, y = np.meshgrid(np.arange(shape[1]) - center[0],
+                           np.arange(shape[0]) - center[1])
+        R = np.sqrt(x**2 + y**2).ravel()
+        max_R = np.max(R)
+        min_R = np.min(R)
+        bin_size = (max_R - min_R) / bins
+        self.radii = np.arange(1, max_R, bin_size)
+        if indexes is not None:
+            rows, cols = (np.ravel(idx) for idx in indexes)
+            R = np.sqrt((cols - center[0])**2 + (rows - center[1])**2)
+            self.input_shape = np.shape(indexes[0])
+        else:
+            self.input_shape = self.shape
+        # only the bins with radius just below or just above a pixel can
+        # hold it, these are checked with the comparisons of get_r_masks
+        lower = np.floor((R - 1) / bin_size).astype(np.intp)
+        if mask is not None:
+            lower[np.ravel(mask) == 0] = -2
+        pixels = []
+        bin_idx = []
+        for candidate in [lower, lower + 1]:
+            valid = (candidate >= 0) & (candidate < len(self.radii))
+            pix = np.flatnonzero(valid)
+            idx = candidate[valid]
+            inside = ((R[pix] > self.radii[idx] - bin_size) &
+                      (R[pix] < self.radii[idx] + bin_size))
+            pixels.append(pix[inside])
+            bin_idx.append(idx[inside])
+        self._set_pixels(np.concatenate(pixels), np.concatenate(bin_idx),
+                         0, len(self.radii))
+
+    def raw_panels(self, indexes, mask=None):
+        """
+        Integrator with the same bins that takes raw calibrated arrays.
+
+        Parameters
+        ----------
+        indexes : tuple of np.ndarray
+            Image row and column of every raw pixel, e.g. from
+            Detector.indexes_xy for the run.
+        mask : np.ndarray, optional
+            Raw pixel mask, zero for the pixels to leave out.
+        """
+        return RadialIntegrator(self.shape, self.bins, indexes, mask)
+
+    def _set_pixels(self, pixels, bin_idx, low_bin, hi_bin):
+        # sorted by pixel so that integrating reads the image in order
+        order = np.argsort(pixels, kind='stable')
+        self.pixels = pixels[order]
+        self.bin_idx = bin_idx[order]
+        self.low_bin = low_bin
+        self.hi_bin = hi_bin
+        self.counts = np.bincount(self.bin_idx, minlength=self.nbins)
+        self._subsets = {}
+
+    @property
+    def nbins(self):
+        """Number of bins integrate returns"""
+        return self.hi_bin - self.low_bin
+
+    def subset(self, low_bin, hi_bin):
+        """
+        Integrator for the bins low_bin:hi_bin only.
+
+        Only the pixels of those bins are kept, so integrating reads a small
+        part of the image. Subsets are cached and asking again for the same
+        bins returns the same object.
+        """
+        low_bin = min(max(int(low_bin), 0), self.nbins)
+        hi_bin = min(max(int(hi_bin), low_bin), self.nbins)
+        key = (low_bin, hi_bin)
+        if key not in self._subsets:
+            keep = (self.bin_idx >= low_bin) & (self.bin_idx < hi_bin)
+            sub = object.__new__(RadialIntegrator)
+            sub.shape = self.shape
+            sub.bins = self.bins
+            sub.input_shape = self.input_shape
+            sub.radii = self.radii[low_bin:hi_bin]
+            sub._set_pixels(self.pixels[keep], self.bin_idx[keep] - low_bin,
+                            self.low_bin + low_bin, self.low_bin + hi_bin)
+            self._subsets[key] = sub
+        return self._subsets[key]
+
+    def integrate(self, image):
+        """
+        Mean of the image in every bin, NaN for bins without pixels.
+
+        Parameters
+        ----------
+        image : np.ndarray
+            Detector image, or raw calibrated array if the integrator was
+            made with indexes.
+
+        Returns
+        -------
+        azav : np.ndarray
+            One value per bin.
+        """
+        values = np.ravel(image)[self.pixels]
+        sums = np.bincount(self.bin_idx, weights=values,
+                           minlength=self.nbins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return sums / self.counts
+
+
 def get_evr_w_codes(det_names):
     """Get the evr with the event codes, yes this changes..."""
+    import psana
     evr_keys = [det[1] for det in det_names if 'evr' in det[1]]
     evr_dict = {k: psana.Detector(k)._fetch_configs()[0].neventcodes()
                 for k in evr_keys}